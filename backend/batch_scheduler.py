@@ -0,0 +1,121 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatchScheduler:
+    """
+    Merges concurrent single-item inference requests into batched model calls.
+
+    Callers submit one item (a YOLO frame, a text to tag, ...) and get a Future
+    back. A background thread takes the first pending item, keeps collecting more
+    until either max_batch_size items are queued or max_latency_ms has passed
+    since that first item arrived, then runs infer_fn once on the whole batch and
+    resolves every Future.
+    """
+
+    def __init__(self, infer_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 8, max_latency_ms: float = 20.0):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency_ms / 1000.0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.batches_run = 0
+        self.items_run = 0
+
+    def start(self):
+        """Start the background batching thread"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Stop the batching thread, failing any items still waiting"""
+        if not self._running:
+            return
+        self._running = False
+        self._queue.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[1].set_exception(RuntimeError("Batch scheduler stopped"))
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item for inference and return a Future for its result"""
+        future: Future = Future()
+        if not self._running:
+            future.set_exception(RuntimeError("Batch scheduler is not running"))
+            return future
+        self._queue.put((item, future))
+        return future
+
+    def infer(self, item: Any, timeout: Optional[float] = None) -> Any:
+        """Submit one item and block until its result is ready"""
+        return self.submit(item).result(timeout)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {'queue_depth': self.queue_depth, 'batches_run': self.batches_run, 'items_run': self.items_run}
+
+    def _collect_batch(self) -> List[tuple]:
+        first = self._queue.get()
+        if first is None:
+            return []
+
+        batch = [first]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Shutdown requested; finish this batch first
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while self._running:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            # Skip items whose callers already gave up
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                results = self.infer_fn([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Expected {len(batch)} results, got {len(results)}")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.items_run += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,105 @@
+"""
+CKKS float encoding vs exact BFV byte packing for single PII entities.
+
+Encrypts synthetic entity strings through GeminiPIIEncryptionSystem.encrypt_pii_entity
+under a policy that sends everything to one HE mechanism, then decrypts them
+with decrypt_pii_entity. Reports ciphertext bytes, encrypt/decrypt p50 and p99,
+and the fraction of entities that round-trip exactly. Non-ASCII characters are
+mixed in, since that is where the CKKS decoder loses characters.
+
+Usage (from the backend directory):
+    python bench/bench_he_packing.py --lengths 8 16 64 200 --samples 200
+    python bench/bench_he_packing.py --output bench/he_packing.json
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, 'bench'))
+os.chdir(BACKEND_DIR)
+
+from bench_text_pii import install_fake_model, peak_rss_mb  # noqa: E402
+from crypto_policy import BFV, CKKS, CryptoPolicy  # noqa: E402
+from gemini_pii_he_system import GeminiPIIEncryptionSystem, PIIEntity  # noqa: E402
+
+ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789@.-+ ' + 'éüñ' + '中文'
+
+
+def make_entities(count: int, length: int, seed: int = 0):
+    rng = random.Random(seed * 7919 + length)
+    return [''.join(rng.choice(ALPHABET) for _ in range(length)) for _ in range(count)]
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def bench_mechanism(system, texts):
+    encrypt_s, decrypt_s, sizes = [], [], []
+    exact = 0
+    for i, text in enumerate(texts):
+        entity = PIIEntity(start=0, end=len(text), label='SSN', text=text, sensitivity_level=3)
+        t0 = time.perf_counter()
+        system.encrypt_pii_entity(entity)
+        encrypt_s.append(time.perf_counter() - t0)
+        sizes.append(len(entity.encrypted_value or b''))
+
+        t0 = time.perf_counter()
+        decrypted = system.decrypt_pii_entity(entity)
+        decrypt_s.append(time.perf_counter() - t0)
+        exact += decrypted == text
+    return {
+        'ciphertext_bytes_mean': round(statistics.mean(sizes), 1),
+        'encrypt_p50_ms': round(statistics.median(encrypt_s) * 1000, 3),
+        'encrypt_p99_ms': round(percentile(encrypt_s, 0.99) * 1000, 3),
+        'decrypt_p50_ms': round(statistics.median(decrypt_s) * 1000, 3),
+        'decrypt_p99_ms': round(percentile(decrypt_s, 0.99) * 1000, 3),
+        'exact_fraction': round(exact / len(texts), 4),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lengths', type=int, nargs='+', default=[8, 16, 64, 200], help='Characters per entity')
+    parser.add_argument('--samples', type=int, default=100, help='Entities per length')
+    parser.add_argument('--mechanisms', nargs='+', default=[CKKS, BFV], choices=[CKKS, BFV])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report here')
+    args = parser.parse_args()
+
+    install_fake_model(0.0, 0.0)
+    systems = {}
+    for mechanism in args.mechanisms:
+        system = GeminiPIIEncryptionSystem('offline-benchmark', crypto_policy=CryptoPolicy({3: mechanism}))
+        if mechanism == CKKS:
+            system.setup_he_context()
+        # Warm up so context creation isn't timed
+        system.encrypt_pii_entity(PIIEntity(0, 4, 'SSN', 'warm', sensitivity_level=3))
+        systems[mechanism] = system
+
+    report = {}
+    print(f"{'benchmark':<18} {'ct bytes':>10} {'enc p50':>9} {'enc p99':>9} {'dec p50':>9} {'dec p99':>9} {'exact':>7}")
+    for length in args.lengths:
+        texts = make_entities(args.samples, length, args.seed)
+        for mechanism, system in systems.items():
+            key = f"{mechanism}[len={length}]"
+            row = report[key] = bench_mechanism(system, texts)
+            print(f"{key:<18} {row['ciphertext_bytes_mean']:>10} {row['encrypt_p50_ms']:>9} "
+                  f"{row['encrypt_p99_ms']:>9} {row['decrypt_p50_ms']:>9} {row['decrypt_p99_ms']:>9} "
+                  f"{row['exact_fraction']:>7}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k != 'output'}, 'results': report}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
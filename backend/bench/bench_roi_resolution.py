@@ -0,0 +1,109 @@
+"""
+Accuracy vs latency of the ROI resolution policy in ocr_pipeline.
+
+Runs the full OCR pipeline on the sample images under image/TRAINING/ once at
+full ROI resolution (the reference) and once per candidate target size, then
+reports per-policy latency and how closely the recognised text matches the
+full-resolution output.
+
+Usage (from the backend directory):
+    python bench/bench_roi_resolution.py --targets 1600 1280 1024 768 512 --repeat 3
+"""
+import argparse
+import difflib
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)  # ocr_pipeline loads ./best.pt relative to the backend dir
+
+from ocr_pipeline import RoiResolutionPolicy, run_ocr_pipeline  # noqa: E402
+
+SAMPLE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def load_samples(sample_dir):
+    paths = []
+    for pattern in SAMPLE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(sample_dir, pattern)))
+    samples = []
+    for path in sorted(paths):
+        with open(path, 'rb') as f:
+            samples.append((os.path.basename(path), f.read()))
+    return samples
+
+
+def run_policy(image_bytes, policy, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run_ocr_pipeline(image_bytes, roi_policy=policy)
+        timings.append((time.perf_counter() - start) * 1000)
+    text = ' '.join(box.get('text', '') for box in result.get('results', [])) if result['success'] else ''
+    return statistics.median(timings), text, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', default=os.path.join(BACKEND_DIR, 'image', 'TRAINING'))
+    parser.add_argument('--targets', type=int, nargs='+', default=[1600, 1280, 1024, 768, 512])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Optional path to write the JSON report')
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    if not samples:
+        sys.exit(f"No sample images found in {args.samples}")
+
+    policies = [('full', RoiResolutionPolicy(target_long_side=None))]
+    policies += [(str(t), RoiResolutionPolicy(target_long_side=t)) for t in args.targets]
+
+    # Warm up models so the first policy doesn't pay for lazy initialisation
+    run_ocr_pipeline(samples[0][1])
+
+    report = {name: {'latency_ms': [], 'text_similarity': []} for name, _ in policies}
+    for filename, image_bytes in samples:
+        reference_text = None
+        for name, policy in policies:
+            latency_ms, text, result = run_policy(image_bytes, policy, args.repeat)
+            if not result['success']:
+                print(f"{filename} [{name}]: pipeline failed: {result.get('error')}")
+                continue
+            if reference_text is None:
+                reference_text = text
+            similarity = difflib.SequenceMatcher(None, reference_text, text).ratio() if reference_text else 1.0
+            report[name]['latency_ms'].append(latency_ms)
+            report[name]['text_similarity'].append(similarity)
+            print(f"{filename:<48} {name:>6}  {latency_ms:8.1f} ms  similarity {similarity:.3f}")
+
+    summary = {}
+    for name, data in report.items():
+        if not data['latency_ms']:
+            continue
+        summary[name] = {
+            'images': len(data['latency_ms']),
+            'median_latency_ms': round(statistics.median(data['latency_ms']), 1),
+            'total_latency_ms': round(sum(data['latency_ms']), 1),
+            'mean_text_similarity': round(statistics.mean(data['text_similarity']), 4),
+            'min_text_similarity': round(min(data['text_similarity']), 4),
+        }
+
+    print()
+    print(f"{'policy':>8} {'median ms':>10} {'total ms':>10} {'mean sim':>9} {'min sim':>8}")
+    for name, row in summary.items():
+        print(f"{name:>8} {row['median_latency_ms']:>10} {row['total_latency_ms']:>10} "
+              f"{row['mean_text_similarity']:>9} {row['min_text_similarity']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
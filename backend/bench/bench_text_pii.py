@@ -0,0 +1,284 @@
+"""
+Offline throughput benchmark for GeminiPIIEncryptionSystem.
+
+genai.GenerativeModel is replaced with a deterministic fake that answers the NER
+prompt from the local regex detector after an injectable delay, so detection,
+JSON extraction, CKKS encryption and decryption can be measured without an API
+key or network. Each scenario is a synthetic corpus with a given message length
+(in words) and entity density (fraction of words that are PII).
+
+Reports ops/sec, p50/p99 latency, ciphertext bytes and peak RSS per benchmark,
+and can save a baseline or compare against one (exit code 1 on regression).
+
+Usage (from the backend directory):
+    python bench/bench_text_pii.py --lengths 20 80 320 --densities 0.05 0.2 --latency-ms 0
+    python bench/bench_text_pii.py --save-baseline bench/baseline_text_pii.json
+    python bench/bench_text_pii.py --compare bench/baseline_text_pii.json --tolerance 0.15
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+import gemini_pii_he_system  # noqa: E402
+from crypto_policy import CryptoPolicy  # noqa: E402
+from gemini_pii_he_system import GeminiPIIEncryptionSystem  # noqa: E402
+from local_pii import detect_local_pii  # noqa: E402
+
+FILLER_WORDS = ('please', 'send', 'the', 'report', 'to', 'my', 'team', 'before', 'friday', 'thanks',
+                'meeting', 'moved', 'call', 'me', 'about', 'invoice', 'details', 'are', 'below', 'ok')
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """
+    Stand-in for genai.GenerativeModel
+
+    Extracts the message from the NER prompt, finds entities with the local
+    regex detector and answers with a JSON array: fenced as in free-form
+    answers, or bare when JSON mode is requested. latency_ms (+ seeded jitter)
+    models the API; with stream=True it is spread over stream_chunks fragments.
+    """
+
+    latency_ms = 0.0
+    jitter_ms = 0.0
+    stream_chunks = 8
+
+    def __init__(self, model_name: str = 'fake', **kwargs):
+        self.model_name = model_name
+        self._rng = random.Random(0)
+
+    def generate_content(self, prompt: str, generation_config=None, stream: bool = False):
+        text = prompt.rsplit('Text to analyze: "', 1)[-1][:-1]
+        delay = self.latency_ms + (self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        entities = [{k: e[k] for k in ('text', 'label', 'start', 'end', 'confidence')} for e in detect_local_pii(text)]
+        body = json.dumps(entities)
+        if (generation_config or {}).get('response_mime_type') != 'application/json':
+            body = "```json\n" + body + "\n```"
+        if stream:
+            return self._stream(body, max(delay, 0.0))
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        return FakeResponse(body)
+
+    def _stream(self, body: str, delay_ms: float):
+        size = max(1, -(-len(body) // self.stream_chunks))
+        for start in range(0, len(body), size):
+            time.sleep(delay_ms / self.stream_chunks / 1000.0)
+            yield FakeResponse(body[start:start + size])
+
+
+def install_fake_model(latency_ms: float, jitter_ms: float, stream_chunks: int = 8):
+    FakeGenerativeModel.latency_ms = latency_ms
+    FakeGenerativeModel.jitter_ms = jitter_ms
+    FakeGenerativeModel.stream_chunks = stream_chunks
+    gemini_pii_he_system.genai.configure = lambda **kwargs: None
+    gemini_pii_he_system.genai.GenerativeModel = FakeGenerativeModel
+
+
+def _card_number(rng):
+    digits = [4] + [rng.randrange(10) for _ in range(14)]
+    # Append the Luhn check digit so the detector accepts it
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    digits.append((10 - total % 10) % 10)
+    return ''.join(map(str, digits))
+
+
+ENTITY_GENERATORS = (
+    lambda rng: f"user{rng.randrange(10000)}@example.com",
+    lambda rng: f"{rng.randrange(100, 999)}-{rng.randrange(10, 99)}-{rng.randrange(1000, 9999)}",
+    lambda rng: f"S{rng.randrange(1000000, 9999999)}{rng.choice('ABCDEFGHIJZ')}",
+    _card_number,
+    lambda rng: f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}",
+    lambda rng: f"+65 {rng.randrange(8000, 9999)} {rng.randrange(1000, 9999)}",
+)
+
+
+def make_corpus(num_messages: int, length: int, density: float, seed: int = 0):
+    """Deterministic synthetic messages of `length` words, roughly `density` of them PII"""
+    rng = random.Random(seed * 1_000_003 + length * 101 + int(density * 1000))
+    corpus = []
+    for _ in range(num_messages):
+        words = [rng.choice(ENTITY_GENERATORS)(rng) if rng.random() < density else rng.choice(FILLER_WORDS)
+                 for _ in range(length)]
+        corpus.append(' '.join(words))
+    return corpus
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(latencies_s, ops, elapsed_s, **extra):
+    latencies_ms = sorted(t * 1000 for t in latencies_s)
+    p99_idx = min(len(latencies_ms) - 1, int(round(0.99 * (len(latencies_ms) - 1))))
+    row = {
+        'ops': ops,
+        'ops_per_sec': round(ops / elapsed_s, 2) if elapsed_s else 0.0,
+        'p50_ms': round(statistics.median(latencies_ms), 3) if latencies_ms else 0.0,
+        'p99_ms': round(latencies_ms[p99_idx], 3) if latencies_ms else 0.0,
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+    }
+    row.update(extra)
+    return row
+
+
+def bench_encrypt(system, corpus, min_sensitivity):
+    latencies, first_entity, ciphertext_sizes, encrypted = [], [], [], []
+    start = time.perf_counter()
+    for text in corpus:
+        t0 = time.perf_counter()
+        result = system.encrypt_text_pii(text, min_sensitivity=min_sensitivity)
+        latencies.append(time.perf_counter() - t0)
+        if result.get('time_to_first_entity') is not None:
+            first_entity.append(result['time_to_first_entity'] * 1000)
+        for entity in result['encrypted_entities']:
+            if entity.encrypted_value:
+                ciphertext_sizes.append(len(entity.encrypted_value))
+                encrypted.append(entity)
+    elapsed = time.perf_counter() - start
+    row = summarize(latencies, len(corpus), elapsed,
+                    entities=len(ciphertext_sizes),
+                    ciphertext_bytes_total=sum(ciphertext_sizes),
+                    ciphertext_bytes_mean=round(statistics.mean(ciphertext_sizes), 1) if ciphertext_sizes else 0,
+                    first_entity_p50_ms=round(statistics.median(first_entity), 3) if first_entity else None)
+    return row, encrypted
+
+
+def bench_decrypt(system, entities):
+    latencies = []
+    mismatches = 0
+    start = time.perf_counter()
+    for entity in entities:
+        t0 = time.perf_counter()
+        decrypted = system.decrypt_pii_entity(entity)
+        latencies.append(time.perf_counter() - t0)
+        mismatches += decrypted != entity.text
+    elapsed = time.perf_counter() - start
+    return summarize(latencies, len(entities), elapsed, mismatches=mismatches)
+
+
+def bench_decrypt_many(system, entities):
+    start = time.perf_counter()
+    decrypted = system.decrypt_many(entities)
+    elapsed = time.perf_counter() - start
+    mismatches = sum(text != entity.text for text, entity in zip(decrypted, entities))
+    # One call for the whole batch, so report the per-entity mean as both percentiles
+    per_entity = [elapsed / max(len(entities), 1)] * len(entities)
+    return summarize(per_entity, len(entities), elapsed, mismatches=mismatches)
+
+
+def bench_batch_detect(system, corpus, batch_size):
+    start = time.perf_counter()
+    results = system.batch_detect_pii(corpus, batch_size=batch_size)
+    elapsed = time.perf_counter() - start
+    # batch_detect_pii has no per-text hook, so report the mean as both percentiles
+    per_text = [elapsed / max(len(corpus), 1)] * len(corpus)
+    return summarize(per_text, len(corpus), elapsed, entities=sum(len(r) for r in results))
+
+
+def compare(report, baseline, tolerance):
+    """Return human-readable regressions of ops/sec or p99 beyond `tolerance` (a fraction)"""
+    regressions = []
+    for key, row in report.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if base['ops_per_sec'] and row['ops_per_sec'] < base['ops_per_sec'] * (1 - tolerance):
+            regressions.append(f"{key}: ops/sec {row['ops_per_sec']} < baseline {base['ops_per_sec']}")
+        if base['p99_ms'] and row['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{key}: p99 {row['p99_ms']} ms > baseline {base['p99_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lengths', type=int, nargs='+', default=[20, 80, 320], help='Words per message')
+    parser.add_argument('--densities', type=float, nargs='+', default=[0.05, 0.2], help='Fraction of PII words')
+    parser.add_argument('--messages', type=int, default=50, help='Messages per corpus')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Injected fake LLM latency')
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help='Uniform +/- jitter on the latency')
+    parser.add_argument('--stream-chunks', type=int, default=8, help='Fragments per streamed fake response')
+    parser.add_argument('--min-sensitivity', type=int, default=2)
+    parser.add_argument('--crypto-policy', default='',
+                        help='CryptoPolicy spec, e.g. "1:token,2:aes-gcm,3:ckks" or "2:ckks,3:ckks" for all-HE')
+    parser.add_argument('--batch-size', type=int, default=5)
+    parser.add_argument('--skip-batch', action='store_true',
+                        help='Skip batch_detect_pii (it sleeps 0.1 s per text for rate limiting)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report here')
+    parser.add_argument('--save-baseline', help='Write the report as a baseline file')
+    parser.add_argument('--compare', help='Baseline file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed regression fraction')
+    args = parser.parse_args()
+
+    install_fake_model(args.latency_ms, args.jitter_ms, args.stream_chunks)
+    policy = CryptoPolicy.parse(args.crypto_policy) if args.crypto_policy else CryptoPolicy()
+    system = GeminiPIIEncryptionSystem('offline-benchmark', crypto_policy=policy)
+    system.setup_he_context()
+    # Warm up TenSEAL and the JSON path so the first scenario isn't penalised
+    system.encrypt_text_pii(make_corpus(1, 20, 0.2, args.seed)[0], min_sensitivity=args.min_sensitivity)
+
+    report = {}
+    print(f"{'benchmark':<40} {'ops/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'ct bytes':>10} {'rss MB':>8}")
+    for length in args.lengths:
+        for density in args.densities:
+            corpus = make_corpus(args.messages, length, density, args.seed)
+            scenario = f"len={length},density={density}"
+
+            rows = {}
+            rows['encrypt_text_pii'], encrypted = bench_encrypt(system, corpus, args.min_sensitivity)
+            rows['decrypt_pii_entity'] = bench_decrypt(system, encrypted)
+            rows['decrypt_many'] = bench_decrypt_many(system, encrypted)
+            if not args.skip_batch:
+                rows['batch_detect_pii'] = bench_batch_detect(system, corpus, args.batch_size)
+
+            for name, row in rows.items():
+                key = f"{name}[{scenario}]"
+                report[key] = row
+                print(f"{key:<40} {row['ops_per_sec']:>9} {row['p50_ms']:>9} {row['p99_ms']:>9} "
+                      f"{row.get('ciphertext_bytes_mean', ''):>10} {row['peak_rss_mb']:>8}")
+
+    report_doc = {
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'save_baseline', 'compare')},
+        'results': report,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report_doc, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline['results'], args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,299 @@
+"""
+End-to-end load test for the main.py chat API.
+
+Registers users, creates chats between them, then drives a weighted mix of
+send_message, get_messages_since polling, get_user_chats and single-placeholder
+decrypt_messages from a closed-loop
+pool of client threads, once per concurrency level. Prints and optionally saves
+a JSON report with throughput and per-operation latency percentiles, plus a
+scaling curve (concurrency -> throughput, p99).
+
+main.py calls the text service at 127.0.0.1:8003, so by default this starts a
+stand-in /validate_text_msg there: the local regex detector behind a
+configurable delay. Point --api at a running main.py, or pass --spawn-api to
+start one (OCR_WORKERS etc. are passed through from the environment).
+
+Usage (from the backend directory):
+    python bench/load_test.py --spawn-api --users 50 --concurrency 1 4 16 64 --duration 20 \\
+        --validation-latency-ms 150 --output load_report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+from local_pii import detect_local_pii  # noqa: E402
+
+PLACEHOLDER_RE = re.compile(r"\[ENCRYPTED_[^\]]+\]")
+
+SAMPLE_MESSAGES = (
+    "hey are we still on for lunch tomorrow?",
+    "my number is +65 9123 4567, call me after 6",
+    "sure, send it to alex.tan@example.com",
+    "the card ending 4111 1111 1111 1111 got declined again",
+    "NRIC is S1234567D if the clinic asks",
+    "running 10 mins late, start without me",
+    "server is at 10.0.0.12, password reset link coming",
+    "ok sounds good",
+)
+
+OPERATIONS = ('send', 'poll', 'chats', 'decrypt')
+
+
+# --- Stand-in validation service -------------------------------------------------
+
+def make_stub_app(latency_ms: float):
+    from fastapi import FastAPI
+
+    app = FastAPI()
+
+    @app.get("/validate_text_msg")
+    async def validate_text_msg(text: str):
+        if latency_ms > 0:
+            await asyncio.sleep(latency_ms / 1000.0)
+        text = text.strip()
+        entities = detect_local_pii(text)
+        encrypted_text = text
+        for entity in reversed(entities):
+            if entity['sensitivity_level'] >= 2:
+                entity['encryption_id'] = uuid.uuid4().hex[:16]
+                placeholder = f"[ENCRYPTED_{entity['encryption_id']}]"
+                encrypted_text = encrypted_text[:entity['start']] + placeholder + encrypted_text[entity['end']:]
+        return {"entities": entities, "encrypted_text": encrypted_text, "original_text": text}
+
+    return app
+
+
+def start_stub_service(port: int, latency_ms: float):
+    import uvicorn
+
+    config = uvicorn.Config(make_stub_app(latency_ms), host="127.0.0.1", port=port, log_level="warning")
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, name="validation-stub", daemon=True)
+    thread.start()
+    wait_until_up(f"http://127.0.0.1:{port}/validate_text_msg?text=ping")
+    return server
+
+
+def spawn_api(port: int):
+    process = subprocess.Popen([sys.executable, 'main.py'], cwd=BACKEND_DIR, stdout=subprocess.DEVNULL)
+    wait_until_up(f"http://127.0.0.1:{port}/health", timeout=300, process=process)
+    return process
+
+
+def wait_until_up(url: str, timeout: float = 30.0, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            sys.exit(f"main.py exited with code {process.returncode} before becoming ready")
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"Timed out waiting for {url}")
+
+
+# --- Fixture setup ---------------------------------------------------------------
+
+def setup_fixtures(api: str, num_users: int, chats_per_user: int, rng: random.Random):
+    run_id = uuid.uuid4().hex[:6]
+    session = requests.Session()
+    usernames = []
+    for i in range(num_users):
+        username = f"load_{run_id}_{i}"
+        response = session.post(f"{api}/users/register", json={'username': username})
+        response.raise_for_status()
+        usernames.append(username)
+
+    chats = []  # (chat_id, user1, user2)
+    for user in usernames:
+        peers = rng.sample([u for u in usernames if u != user], min(chats_per_user, num_users - 1))
+        for peer in peers:
+            response = session.post(f"{api}/chats/create", json={'user1': user, 'user2': peer})
+            response.raise_for_status()
+            chats.append((response.json()['chat_id'], user, peer))
+    return usernames, chats
+
+
+# --- Load loop -------------------------------------------------------------------
+
+def parse_mix(spec: str):
+    weights = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{name}' (expected one of {OPERATIONS})")
+        weights[name] = float(weight)
+    return weights
+
+
+def client_loop(api, usernames, chats, mix, stop_at, seed, samples, errors):
+    rng = random.Random(seed)
+    session = requests.Session()
+    names, weights = zip(*mix.items())
+    last_seen = defaultdict(float)
+    sent = []  # (chat_id, msg_id, placeholder) from this client's own messages
+    while time.monotonic() < stop_at:
+        op = rng.choices(names, weights)[0]
+        chat_id, user1, user2 = rng.choice(chats)
+        if op == 'decrypt' and not sent:
+            op = 'send'
+        start = time.perf_counter()
+        try:
+            if op == 'send':
+                response = session.post(f"{api}/chats/{chat_id}/messages",
+                                        json={'content': rng.choice(SAMPLE_MESSAGES), 'sender': rng.choice((user1, user2))})
+                if response.ok:
+                    message = response.json()['message']
+                    sent.extend((chat_id, message['id'], token)
+                                for token in PLACEHOLDER_RE.findall(message.get('content') or ''))
+            elif op == 'poll':
+                response = session.get(f"{api}/chats/{chat_id}/messages/since/{last_seen[chat_id]}")
+                if response.ok:
+                    new_messages = response.json().get('messages', [])
+                    if new_messages:
+                        last_seen[chat_id] = new_messages[-1]['timestamp']
+            elif op == 'decrypt':
+                sent_chat, msg_id, token = rng.choice(sent)
+                response = session.post(f"{api}/chats/{sent_chat}/messages/decrypt/{msg_id}",
+                                        params={'placeholder': token})
+            else:
+                response = session.get(f"{api}/chats/{rng.choice(usernames)}")
+            ok = response.ok
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        samples[op].append(elapsed)
+        if not ok:
+            errors[op] += 1
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def run_level(api, usernames, chats, mix, concurrency, duration, seed):
+    per_client = [(defaultdict(list), defaultdict(int)) for _ in range(concurrency)]
+    stop_at = time.monotonic() + duration
+    threads = [threading.Thread(target=client_loop,
+                                args=(api, usernames, chats, mix, stop_at, seed + i, samples, errors), daemon=True)
+               for i, (samples, errors) in enumerate(per_client)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    operations = {}
+    all_latencies = []
+    total_errors = 0
+    for op in OPERATIONS:
+        latencies = sorted(t for samples, _ in per_client for t in samples[op])
+        op_errors = sum(errors[op] for _, errors in per_client)
+        if not latencies:
+            continue
+        all_latencies.extend(latencies)
+        total_errors += op_errors
+        operations[op] = {
+            'requests': len(latencies),
+            'errors': op_errors,
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p90_ms': round(percentile(latencies, 0.90) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'max_ms': round(latencies[-1] * 1000, 2),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        }
+    all_latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'duration_s': round(elapsed, 2),
+        'requests': len(all_latencies),
+        'errors': total_errors,
+        'throughput_rps': round(len(all_latencies) / elapsed, 2),
+        'messages_per_sec': operations.get('send', {}).get('throughput_rps', 0.0),
+        'p50_ms': round(percentile(all_latencies, 0.50) * 1000, 2),
+        'p99_ms': round(percentile(all_latencies, 0.99) * 1000, 2),
+        'operations': operations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--api', default='http://127.0.0.1:8002', help='Base URL of main.py')
+    parser.add_argument('--spawn-api', action='store_true', help='Start main.py as a subprocess')
+    parser.add_argument('--no-stub', action='store_true', help='Use the real text service already on 8003')
+    parser.add_argument('--stub-port', type=int, default=8003)
+    parser.add_argument('--validation-latency-ms', type=float, default=100.0)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--chats-per-user', type=int, default=3)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('send=0.2,poll=0.6,chats=0.1,decrypt=0.1'),
+                        help='Operation weights, e.g. send=0.2,poll=0.7,chats=0.1')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per concurrency level')
+    parser.add_argument('--p99-slo-ms', type=float, default=1000.0, help='Report the first level whose p99 exceeds this')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the JSON report here')
+    args = parser.parse_args()
+
+    if not args.no_stub:
+        start_stub_service(args.stub_port, args.validation_latency_ms)
+    api_process = spawn_api(int(args.api.rsplit(':', 1)[-1])) if args.spawn_api else None
+
+    try:
+        rng = random.Random(args.seed)
+        usernames, chats = setup_fixtures(args.api, args.users, args.chats_per_user, rng)
+        print(f"Created {len(usernames)} users and {len(chats)} chats")
+
+        levels = []
+        for concurrency in args.concurrency:
+            level = run_level(args.api, usernames, chats, args.mix, concurrency, args.duration, args.seed)
+            levels.append(level)
+            print(f"concurrency {concurrency:>4}: {level['throughput_rps']:>8} req/s  "
+                  f"{level['messages_per_sec']:>7} msg/s  p50 {level['p50_ms']:>8} ms  "
+                  f"p99 {level['p99_ms']:>8} ms  errors {level['errors']}")
+    finally:
+        if api_process is not None:
+            api_process.terminate()
+            api_process.wait(10)
+
+    knee = next((level['concurrency'] for level in levels if level['p99_ms'] > args.p99_slo_ms), None)
+    report = {
+        'config': {
+            'api': args.api, 'validation_latency_ms': None if args.no_stub else args.validation_latency_ms,
+            'users': args.users, 'chats_per_user': args.chats_per_user, 'mix': args.mix,
+            'duration_s': args.duration, 'p99_slo_ms': args.p99_slo_ms,
+        },
+        'levels': levels,
+        'scaling_curve': [[level['concurrency'], level['throughput_rps'], level['p99_ms']] for level in levels],
+        'p99_slo_exceeded_at_concurrency': knee,
+    }
+    print(json.dumps(report['scaling_curve']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
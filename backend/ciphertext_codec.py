@@ -0,0 +1,145 @@
+"""
+Versioned wire format for protected entity values and HE contexts.
+
+Every blob that leaves encrypt_pii_entity, or is written by save_he_context,
+goes through CiphertextCodec. Each frame starts with a 4-byte header:
+
+    byte 0  MAGIC (0xCE)
+    byte 1  format VERSION
+    byte 2  flags: compression id in the low nibble, key-stripping bits above
+    byte 3  kind: the protection mechanism, or CONTEXT for a serialized HE context
+
+So a ciphertext says how to decode and decrypt itself. Contexts can drop their
+Galois/relinearization keys, which are regenerated from the secret key on load,
+and their public key, which takes an N=8192 context from about 705 KB to
+235 KB. Entity ciphertexts are not compressed by default: SEAL already
+compresses them and the rest is uniformly random, so zlib, zstd and lz4 all
+make a 17 KB CKKS or BFV ciphertext a few bytes larger. Smaller per-entity
+values come from CryptoPolicy picking AES-GCM or tokens instead of HE.
+zlib can still be switched on with PII_CIPHERTEXT_COMPRESSION=zlib, and is only
+kept for a frame when it actually saves bytes.
+"""
+import os
+import struct
+import zlib
+from typing import Callable, Dict, Optional, Tuple
+
+from crypto_policy import AES_GCM, BFV, CKKS, TOKEN
+
+MAGIC = 0xCE
+VERSION = 1
+HEADER = struct.Struct('>BBBB')
+
+CONTEXT = 'context'
+KINDS = {TOKEN: 1, AES_GCM: 2, BFV: 3, CKKS: 4, CONTEXT: 5}
+KIND_NAMES = {kind_id: name for name, kind_id in KINDS.items()}
+
+FLAG_PUBLIC_KEY_STRIPPED = 0x10
+FLAG_EVAL_KEYS_STRIPPED = 0x20
+
+Compressor = Tuple[int, Callable[[bytes], bytes], Callable[[bytes], bytes]]
+
+
+def _zlib() -> Compressor:
+    return 1, lambda data: zlib.compress(data, 6), zlib.decompress
+
+
+COMPRESSORS = {'zlib': _zlib}
+COMPRESSOR_NAMES = {1: 'zlib'}
+
+
+def _load_compressor(name: str) -> Optional[Compressor]:
+    """Compressor by name; 'none' is None"""
+    if name == 'none':
+        return None
+    if name not in COMPRESSORS:
+        raise ValueError(f"Unknown compression '{name}' (expected none or one of {sorted(COMPRESSORS)})")
+    return COMPRESSORS[name]()
+
+
+def is_framed(blob: bytes) -> bool:
+    """True for codec frames; False for raw pre-codec ciphertexts"""
+    return len(blob) >= HEADER.size and blob[0] == MAGIC
+
+
+class CiphertextCodec:
+    """Frame, compress and parse protected values and HE contexts"""
+
+    def __init__(self, compression: str = 'none'):
+        self.compression = compression
+        self._compressor = _load_compressor(compression)
+        self._decompressors: Dict[int, Callable[[bytes], bytes]] = {}
+        if self._compressor:
+            self._decompressors[self._compressor[0]] = self._compressor[2]
+
+    @classmethod
+    def from_env(cls) -> 'CiphertextCodec':
+        return cls(os.getenv("PII_CIPHERTEXT_COMPRESSION", "none").lower())
+
+    def _decompressor(self, compression_id: int) -> Callable[[bytes], bytes]:
+        decompress = self._decompressors.get(compression_id)
+        if decompress is None:
+            name = COMPRESSOR_NAMES.get(compression_id)
+            if name is None:
+                raise ValueError(f"Unknown compression id {compression_id}")
+            decompress = self._decompressors[compression_id] = COMPRESSORS[name]()[2]
+        return decompress
+
+    def encode(self, payload: bytes, kind: str, flags: int = 0) -> bytes:
+        compression_id = 0
+        if self._compressor:
+            compressed = self._compressor[1](payload)
+            if len(compressed) < len(payload):
+                compression_id, payload = self._compressor[0], compressed
+        return HEADER.pack(MAGIC, VERSION, flags | compression_id, KINDS[kind]) + payload
+
+    def decode_header(self, blob: bytes) -> Tuple[str, int]:
+        """(kind, flags) without touching the payload"""
+        if not is_framed(blob):
+            raise ValueError("Not a ciphertext codec frame")
+        _, version, flags, kind_id = HEADER.unpack_from(blob)
+        if version > VERSION:
+            raise ValueError(f"Ciphertext format version {version} is newer than this codec ({VERSION})")
+        if kind_id not in KIND_NAMES:
+            raise ValueError(f"Unknown ciphertext kind id {kind_id}")
+        return KIND_NAMES[kind_id], flags
+
+    def decode(self, blob: bytes) -> Tuple[str, bytes]:
+        """(kind, payload) of one frame"""
+        kind, flags = self.decode_header(blob)
+        payload = blob[HEADER.size:]
+        compression_id = flags & 0x0F
+        if compression_id:
+            payload = self._decompressor(compression_id)(payload)
+        return kind, payload
+
+    def encode_context(self, context, strip_public_key: bool = False, strip_eval_keys: bool = True) -> bytes:
+        """
+        Serialize a TenSEAL context with its secret key
+
+        Without the public key the context can only decrypt, unless it was created
+        with symmetric encryption. Stripped eval keys are regenerated by decode_context.
+        """
+        payload = context.serialize(
+            save_public_key=not strip_public_key,
+            save_secret_key=True,
+            save_galois_keys=not strip_eval_keys,
+            save_relin_keys=not strip_eval_keys,
+        )
+        flags = (FLAG_PUBLIC_KEY_STRIPPED if strip_public_key else 0) | (FLAG_EVAL_KEYS_STRIPPED if strip_eval_keys else 0)
+        return self.encode(payload, CONTEXT, flags)
+
+    def decode_context(self, blob: bytes, galois_keys: bool = True, relin_keys: bool = True):
+        """Rebuild a context, regenerating whichever stripped eval keys are asked for"""
+        import tenseal as ts
+
+        kind, flags = self.decode_header(blob)
+        if kind != CONTEXT:
+            raise ValueError(f"Expected a context frame, got {kind}")
+        context = ts.context_from(self.decode(blob)[1])
+        if flags & FLAG_EVAL_KEYS_STRIPPED:
+            if galois_keys:
+                context.generate_galois_keys()
+            if relin_keys:
+                context.generate_relin_keys()
+        return context
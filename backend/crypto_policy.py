@@ -0,0 +1,145 @@
+"""
+Tiered protection policy for detected PII.
+
+Giving every sensitive entity a full CKKS ciphertext costs hundreds of KB and
+milliseconds of CPU per phone number, although nothing ever computes on most
+of them. CryptoPolicy picks a mechanism per entity from its sensitivity level,
+with optional per-label overrides:
+
+    token    - keyed HMAC token; the plaintext stays in a bounded in-memory vault
+    aes-gcm  - authenticated symmetric encryption (nonce + ciphertext + tag)
+    bfv      - homomorphic encryption with exact byte packing (see he_packing)
+    ckks     - homomorphic encryption, for values that are computed on
+
+The default keeps CKKS for level 3 only. Policies can be written as strings,
+e.g. "1:token,2:aes-gcm,3:ckks;FINANCIAL=ckks,SSN=aes-gcm", which is also the
+format of the PII_CRYPTO_POLICY environment variable.
+
+The AES-GCM mechanism needs the `cryptography` package and imports it on first use.
+"""
+import base64
+import hashlib
+import hmac
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from mapping_store import MappingStore
+
+TOKEN = 'token'
+AES_GCM = 'aes-gcm'
+BFV = 'bfv'
+CKKS = 'ckks'
+MECHANISMS = (TOKEN, AES_GCM, BFV, CKKS)
+
+
+@dataclass
+class CryptoPolicy:
+    """Sensitivity level -> mechanism, with label overrides taking precedence"""
+    level_mechanisms: Dict[int, str] = field(default_factory=lambda: {1: TOKEN, 2: AES_GCM, 3: CKKS})
+    label_mechanisms: Dict[str, str] = field(default_factory=dict)
+    default: str = AES_GCM
+
+    def __post_init__(self):
+        for mechanism in (*self.level_mechanisms.values(), *self.label_mechanisms.values(), self.default):
+            if mechanism not in MECHANISMS:
+                raise ValueError(f"Unknown protection mechanism '{mechanism}' (expected one of {MECHANISMS})")
+
+    def mechanism_for(self, label: str, sensitivity_level: int) -> str:
+        mechanism = self.label_mechanisms.get(label)
+        if mechanism is None:
+            mechanism = self.level_mechanisms.get(sensitivity_level, self.default)
+        return mechanism
+
+    @classmethod
+    def parse(cls, spec: str) -> 'CryptoPolicy':
+        """Build a policy from "LEVEL:MECH,...;LABEL=MECH,..." (either half may be empty)"""
+        levels_part, _, labels_part = spec.partition(';')
+        policy = cls()
+        for item in filter(None, (s.strip() for s in levels_part.split(','))):
+            level, _, mechanism = item.partition(':')
+            policy.level_mechanisms[int(level)] = mechanism.strip().lower()
+        for item in filter(None, (s.strip() for s in labels_part.split(','))):
+            label, _, mechanism = item.partition('=')
+            policy.label_mechanisms[label.strip().upper()] = mechanism.strip().lower()
+        policy.__post_init__()
+        return policy
+
+    @classmethod
+    def from_env(cls) -> 'CryptoPolicy':
+        spec = os.getenv("PII_CRYPTO_POLICY", "")
+        return cls.parse(spec) if spec else cls()
+
+
+class TokenVault:
+    """
+    Deterministic HMAC-SHA256 tokenization
+
+    The token (first 16 bytes of the MAC over label and text) is what leaves the
+    service; the plaintext is only recoverable through this vault. The same
+    value under the same label always maps to the same token, so tokens can be
+    compared for equality without revealing anything else. The vault is a
+    MappingStore: give it the same bounds as the entity mappings and every
+    token is touched whenever its mapping is, so a token is not evicted while
+    a mapping still refers to it.
+    """
+
+    TOKEN_BYTES = 16
+
+    def __init__(self, key: Optional[bytes] = None, store: Optional[MappingStore] = None):
+        self.key = key or os.urandom(32)
+        self._vault = store if store is not None else MappingStore()
+
+    def protect(self, text: str, label: str) -> bytes:
+        token = hmac.new(self.key, f"{label}\x00{text}".encode('utf-8'), hashlib.sha256).digest()[:self.TOKEN_BYTES]
+        self._vault[token] = text
+        return token
+
+    def reveal(self, token: bytes, label: str) -> str:
+        return self._vault[token]
+
+    def __len__(self) -> int:
+        return len(self._vault)
+
+    def export(self) -> dict:
+        return {'key': self.key, 'vault': self._vault.to_dict()}
+
+    @classmethod
+    def restore(cls, state: dict, store: Optional[MappingStore] = None) -> 'TokenVault':
+        vault = cls(state['key'], store)
+        for token, text in state['vault'].items():
+            vault._vault[token] = text
+        return vault
+
+
+class AESGCMCipher:
+    """AES-256-GCM with a random 96-bit nonce; the label is bound as associated data"""
+
+    NONCE_BYTES = 12
+
+    def __init__(self, key: Optional[bytes] = None):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+        self.key = key or AESGCM.generate_key(bit_length=256)
+        self._aead = AESGCM(self.key)
+
+    def protect(self, text: str, label: str) -> bytes:
+        nonce = os.urandom(self.NONCE_BYTES)
+        return nonce + self._aead.encrypt(nonce, text.encode('utf-8'), label.encode('utf-8'))
+
+    def reveal(self, blob: bytes, label: str) -> str:
+        nonce, ciphertext = blob[:self.NONCE_BYTES], blob[self.NONCE_BYTES:]
+        return self._aead.decrypt(nonce, ciphertext, label.encode('utf-8')).decode('utf-8')
+
+    def export(self) -> dict:
+        return {'key': self.key}
+
+    @classmethod
+    def restore(cls, state: dict) -> 'AESGCMCipher':
+        return cls(state['key'])
+
+
+def key_from_env(name: str) -> Optional[bytes]:
+    """Base64-encoded key from the environment, or None to generate one"""
+    value = os.getenv(name, "")
+    return base64.b64decode(value) if value else None
@@ -7,20 +7,38 @@ from datasets import load_dataset
 from tqdm import tqdm
 import tenseal as ts
 import pickle
-from typing import List, Dict, Tuple, Optional
+from typing import Iterator, List, Dict, Tuple, Optional
 import logging
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass, replace
 import hashlib
+import hmac
 import google.generativeai as genai
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI, Header, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import BaseModel
 import uvicorn
 
+from span_align import align_entities
+from span_rewrite import resolve_overlaps, rewrite_spans
+from text_chunker import chunk_text, estimate_tokens, merge_chunk_entities
+from json_stream import IncrementalJSONArrayParser
+from crypto_policy import AES_GCM, BFV, CKKS, TOKEN, AESGCMCipher, CryptoPolicy, TokenVault, key_from_env
+from he_packing import BFVTextEncoder
+from he_params import HEConfig, make_context, select_he_config
+from ciphertext_codec import CiphertextCodec, is_framed
+from mapping_store import MappingStore
+from metrics import CONTENT_TYPE, REGISTRY, ciphertext_bytes, install_http_metrics, pii_entities_total, stage_seconds
+
+gemini_retries_total = REGISTRY.counter('gemini_retries_total', 'Gemini detection attempts that failed and were retried')
+
 load_dotenv()  # Load environment variables from .env file
 API_KEY = os.getenv("GEMINI_API_KEY", "")
+# Shared secret the API server presents as a bearer token; /decrypt is disabled without it
+SERVICE_TOKEN = os.getenv("PII_SERVICE_TOKEN", "")
 app = FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -29,6 +47,7 @@ app.add_middleware(
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
 )
+install_http_metrics(app, 'text')
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,18 +55,24 @@ logger = logging.getLogger(__name__)
 
 device = "cuda:0" if torch.cuda.is_available() else "cpu"
 
-@dataclass
-class HEConfig:
-    """Configuration for homomorphic encryption parameters"""
-    poly_modulus_degree: int = 8192
-    coeff_mod_bit_sizes: List[int] = None
-    scale: float = 2.0**40
-    cache_galois_keys: bool = True
-    cache_relin_keys: bool = True
-    
-    def __post_init__(self):
-        if self.coeff_mod_bit_sizes is None:
-            self.coeff_mod_bit_sizes = [60, 40, 40, 60]
+# Schema for Gemini's structured output: a bare JSON array of entity objects
+PII_RESPONSE_SCHEMA = {
+    'type': 'ARRAY',
+    'items': {
+        'type': 'OBJECT',
+        'properties': {
+            'text': {'type': 'STRING'},
+            'label': {'type': 'STRING'},
+            'start': {'type': 'INTEGER'},
+            'end': {'type': 'INTEGER'},
+            'confidence': {'type': 'NUMBER'},
+        },
+        'required': ['text', 'label', 'start', 'end'],
+    },
+}
+
+class DetectionIncomplete(RuntimeError):
+    """Gemini detection did not finish, so the text can't be treated as checked"""
 
 @dataclass
 class PIIEntity:
@@ -60,20 +85,49 @@ class PIIEntity:
     sensitivity_level: int = 1  # 1=low, 2=medium, 3=high
     encrypted_value: Optional[bytes] = None
     encryption_id: Optional[str] = None
+    protection: Optional[str] = None  # mechanism chosen by the CryptoPolicy
 
 class GeminiPIIEncryptionSystem:
     """Complete PII detection using Gemini-2.5-flash and homomorphic encryption system"""
     
-    def __init__(self, api_key: str, he_config: HEConfig = None):
+    def __init__(self, api_key: str, he_config: HEConfig = None, detector=None,
+                 chunk_max_tokens: int = 1024, chunk_overlap_tokens: int = 64, max_parallel_chunks: int = 8,
+                 crypto_policy: CryptoPolicy = None, codec: CiphertextCodec = None, max_decrypt_workers: int = 4,
+                 mapping_store: MappingStore = None):
         self.api_key = api_key
-        self.he_config = he_config or HEConfig()
+        self.he_config = he_config  # None: pick the smallest safe parameters in setup_he_context
         self.he_context = None
-        self.entity_mappings = {}
+        # Ciphertexts kept for /decrypt; least recently used ones are evicted past the store's bound
+        self.entity_mappings = mapping_store if mapping_store is not None else MappingStore()
         self.sensitivity_rules = self._init_sensitivity_rules()
         
+        # Which mechanism protects each entity; CKKS only where the policy asks for it
+        self.crypto_policy = crypto_policy or CryptoPolicy()
+        self.protectors = {}
+        # Versioned, self-describing framing for every stored ciphertext
+        self.codec = codec or CiphertextCodec()
+        # decrypt_many deserializes and decrypts HE ciphertexts on this many threads
+        self.max_decrypt_workers = max_decrypt_workers
+        self._decrypt_executor = None
+        
+        # Optional offline detector (see local_ner.py); replaces Gemini for detection when set
+        self.detector = detector
+        
+        # Long texts are split into overlapping chunks that are sent to Gemini concurrently
+        self.chunk_max_tokens = chunk_max_tokens
+        self.chunk_overlap_tokens = chunk_overlap_tokens
+        self.max_parallel_chunks = max_parallel_chunks
+        self._chunk_executor = None
+        
         # Initialize Gemini
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.model = None
+        if detector is None:
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel('gemini-2.5-flash')
+        self.generation_config = {
+            'response_mime_type': 'application/json',
+            'response_schema': PII_RESPONSE_SCHEMA,
+        }
         
         # Enhanced prompt for comprehensive PII detection
         self.ner_prompt = '''
@@ -127,79 +181,167 @@ Text to analyze: "'''
     
     def setup_he_context(self) -> ts.Context:
         """Initialize CKKS homomorphic encryption context"""
-        logger.info("Setting up CKKS context...")
-        
-        context = ts.context(
-            ts.SCHEME_TYPE.CKKS,
-            poly_modulus_degree=self.he_config.poly_modulus_degree,
-            coeff_mod_bit_sizes=self.he_config.coeff_mod_bit_sizes
-        )
+        if self.he_config is None:
+            # Entity vectors are 100 slots (see _text_to_vector)
+            level = int(os.getenv("HE_SECURITY_LEVEL", "128"))
+            self.he_config = select_he_config(payload_length=100, level=level)
+            logger.info(f"Selected CKKS parameters N={self.he_config.poly_modulus_degree} "
+                        f"{self.he_config.coeff_mod_bit_sizes} for {level}-bit security")
         
-        context.generate_galois_keys()
-        context.generate_relin_keys()
-        context.global_scale = self.he_config.scale
+        logger.info("Setting up CKKS context...")
+        context = make_context(self.he_config)
         
         self.he_context = context
         logger.info("CKKS context initialized successfully")
         return context
     
     def detect_pii_entities_with_gemini(self, text: str, max_retries: int = 3) -> List[PIIEntity]:
-        """Detect PII entities using Gemini-2.5-flash"""
+        """Detect PII entities using Gemini-2.5-flash, chunking long texts"""
+        chunks = chunk_text(text, self.chunk_max_tokens, self.chunk_overlap_tokens)
+        if len(chunks) == 1:
+            return self._detect_chunk_with_gemini(text, max_retries)
         
+        logger.info(f"Splitting {len(text)} chars into {len(chunks)} chunks for detection")
+        if self._chunk_executor is None:
+            self._chunk_executor = ThreadPoolExecutor(max_workers=self.max_parallel_chunks,
+                                                      thread_name_prefix="gemini-chunk")
+        chunk_entities = self._chunk_executor.map(
+            lambda chunk: self._detect_chunk_with_gemini(chunk.text, max_retries), chunks)
+        return merge_chunk_entities(list(zip(chunks, chunk_entities)))
+    
+    def _detect_chunk_with_gemini(self, text: str, max_retries: int = 3) -> List[PIIEntity]:
+        """Single Gemini request for one piece of text"""
+        return list(self.stream_pii_entities_with_gemini(text, max_retries))
+    
+    def stream_pii_entities_with_gemini(self, text: str, max_retries: int = 3) -> Iterator[PIIEntity]:
+        """
+        Yield PII entities as Gemini streams its JSON array, before the response is complete
+
+        A stream that breaks off, or ends before the array is closed, is retried;
+        entities already yielded are not yielded again. Raises DetectionIncomplete
+        when no attempt gets through the whole array, so a partial result is never
+        mistaken for a complete one.
+        """
+        seen = set()  # (start, end, label) of every entity yielded so far, across attempts
+        request_start = time.perf_counter()
         for attempt in range(max_retries):
             try:
-                # Generate content with Gemini
-                response = self.model.generate_content(self.ner_prompt + text + '"')
-                response_text = response.text.strip()
-                
-                # Extract JSON from response
-                entities_data = self._extract_json_from_response(response_text)
-                
-                # Convert to PIIEntity objects
+                response = self.model.generate_content(self.ner_prompt + text + '"',
+                                                       generation_config=self.generation_config, stream=True)
+                parser = IncrementalJSONArrayParser()
                 entities = []
-                for entity_dict in entities_data:
-                    try:
-                        # Get sensitivity level
-                        label = entity_dict.get('label', 'MISC')
-                        sensitivity = self.sensitivity_rules.get(label, 1)
-                        
-                        entity = PIIEntity(
-                            start=int(entity_dict['start']),
-                            end=int(entity_dict['end']),
-                            label=label,
-                            text=entity_dict['text'],
-                            confidence=float(entity_dict.get('confidence', 1.0)),
-                            sensitivity_level=sensitivity
-                        )
-                        
+                misaligned = []
+                
+                fragments = iter(response)
+                waited = 0.0
+                while True:
+                    wait_start = time.perf_counter()
+                    fragment = next(fragments, None)
+                    waited += time.perf_counter() - wait_start
+                    if fragment is None:
+                        break
+                    for entity_dict in parser.feed(self._response_text(fragment)):
+                        entity = self._entity_from_dict(entity_dict)
+                        if entity is None:
+                            continue
                         # Validate entity positions
-                        span = text[entity.start:entity.end]
-                        if span != entity.text:
-                            # Try to find the entity text in the original string
-                            match = re.search(re.escape(entity.text), text)
-                            if match:
-                                entity.start, entity.end = match.start(), match.end()
-                                logger.info(f"Corrected entity offsets for: {entity.text}")
-                                entities.append(entity)
-                            else:
-                                logger.warning(f"Invalid entity positions for: {entity.text}")
-                        else:
-                            entities.append(entity)
-                            
-                    except (KeyError, ValueError, TypeError) as e:
-                        logger.warning(f"Error processing entity {entity_dict}: {e}")
-                        continue
+                        if text[entity.start:entity.end] != entity.text:
+                            misaligned.append(entity)
+                            continue
+                        entities.append(entity)
+                        key = (entity.start, entity.end, entity.label)
+                        if key in seen:
+                            continue
+                        if not seen:
+                            stage_seconds.observe(time.perf_counter() - request_start,
+                                                  service='text', stage='gemini_first_entity')
+                        seen.add(key)
+                        yield entity
+                stage_seconds.observe(waited, service='text', stage='gemini_call')
                 
-                return entities
+                if not parser.finished:
+                    raise ValueError(f"Response ended before the JSON array was closed ({parser.items_parsed} entities parsed)")
+                
+                # Find misaligned entities in the original string, nearest their hinted offsets
+                if misaligned:
+                    unmatched = {id(e) for e in align_entities(text, misaligned, claimed=((e.start, e.end) for e in entities))}
+                    for entity in misaligned:
+                        if id(entity) in unmatched:
+                            logger.warning(f"Invalid entity positions for: {entity.text}")
+                            continue
+                        logger.info(f"Corrected entity offsets for: {entity.text}")
+                        key = (entity.start, entity.end, entity.label)
+                        if key not in seen:
+                            seen.add(key)
+                            yield entity
+                return
                 
             except Exception as e:
-                logger.warning(f"Attempt {attempt + 1} failed: {e}")
+                gemini_retries_total.inc()
+                logger.warning(f"Attempt {attempt + 1} failed after {len(seen)} entities: {e}")
                 if attempt < max_retries - 1:
                     time.sleep(1)  # Brief delay before retry
                 continue
         
-        logger.error(f"Failed to detect entities after {max_retries} attempts")
-        return []
+        raise DetectionIncomplete(f"Failed to detect entities after {max_retries} attempts ({len(seen)} found before failing)")
+    
+    @staticmethod
+    def _response_text(fragment) -> str:
+        # Chunks without text parts (e.g. the final finish-reason chunk) raise on .text
+        try:
+            return fragment.text
+        except ValueError:
+            return ''
+    
+    def _entity_from_dict(self, entity_dict: Dict) -> Optional[PIIEntity]:
+        """Convert one entity object from Gemini's JSON into a PIIEntity"""
+        try:
+            # Get sensitivity level
+            label = entity_dict.get('label', 'MISC')
+            sensitivity = self.sensitivity_rules.get(label, 1)
+            
+            return PIIEntity(
+                start=int(entity_dict['start']),
+                end=int(entity_dict['end']),
+                label=label,
+                text=entity_dict['text'],
+                confidence=float(entity_dict.get('confidence', 1.0)),
+                sensitivity_level=sensitivity
+            )
+        except (AttributeError, KeyError, ValueError, TypeError) as e:
+            logger.warning(f"Error processing entity {entity_dict}: {e}")
+            return None
+    
+    def _entities_from_detector(self, found: List[Tuple]) -> List[PIIEntity]:
+        """Convert local detector (start, end, label, text, confidence) tuples to PIIEntity objects"""
+        return [
+            PIIEntity(
+                start=start,
+                end=end,
+                label=label,
+                text=span_text,
+                confidence=confidence,
+                sensitivity_level=self.sensitivity_rules.get(label, 1)
+            )
+            for start, end, label, span_text, confidence in found
+        ]
+    
+    def detect_pii_entities_locally(self, text: str) -> List[PIIEntity]:
+        """Detect PII entities with the offline spaCy/ONNX detector"""
+        with stage_seconds.time(service='text', stage='local_detect'):
+            return self._entities_from_detector(self.detector.detect(text))
+    
+    def detect_pii_entities(self, text: str) -> List[PIIEntity]:
+        """Detect PII entities with whichever detector was selected at startup"""
+        if self.detector is not None:
+            return self.detect_pii_entities_locally(text)
+        return self.detect_pii_entities_with_gemini(text)
+    
+    def iter_pii_entities(self, text: str) -> Iterator[PIIEntity]:
+        """Like detect_pii_entities, but streams from Gemini when the text fits in one request"""
+        if self.detector is None and estimate_tokens(len(text)) <= self.chunk_max_tokens:
+            return self.stream_pii_entities_with_gemini(text)
+        return iter(self.detect_pii_entities(text))
     
     def _extract_json_from_response(self, response_text: str) -> List[Dict]:
         """Extract JSON from Gemini response text"""
@@ -209,13 +351,13 @@ Text to analyze: "'''
             if json_match:
                 json_str = json_match.group(1)
             else:
-                # Try to find array directly
-                array_match = re.search(r'\[.*?\]', response_text, re.DOTALL)
-                if array_match:
-                    json_str = array_match.group(0)
-                else:
-                    # Fallback: try parsing entire response
-                    json_str = response_text
+                # Try to find array directly (bracket-matched, so nested arrays don't truncate it)
+                parser = IncrementalJSONArrayParser()
+                entities = parser.feed(response_text)
+                if parser.finished and not parser.errors:
+                    return entities
+                # Fallback: try parsing entire response
+                json_str = response_text
             
             # Parse JSON
             entities = json.loads(json_str)
@@ -260,7 +402,55 @@ Text to analyze: "'''
         content = f"{entity.text}_{entity.label}_{entity.start}_{entity.end}"
         return hashlib.sha256(content.encode()).hexdigest()[:16]
     
+    def _protector(self, mechanism: str):
+        """Token vault / AES-GCM cipher / BFV encoder for a mechanism, created on first use"""
+        protector = self.protectors.get(mechanism)
+        if protector is None:
+            if mechanism == TOKEN:
+                protector = TokenVault(key_from_env("PII_TOKEN_KEY"), self._token_store())
+            elif mechanism == AES_GCM:
+                protector = AESGCMCipher(key_from_env("PII_AES_KEY"))
+            elif mechanism == BFV:
+                protector = BFVTextEncoder()
+            else:
+                raise ValueError(f"No protector for mechanism '{mechanism}'")
+            self.protectors[mechanism] = protector
+        return protector
+    
+    def _token_store(self) -> MappingStore:
+        """Token vault storage, bounded like entity_mappings so plaintexts are evicted with their mappings"""
+        return MappingStore(self.entity_mappings.max_entries, self.entity_mappings.max_age)
+    
     def encrypt_pii_entity(self, entity: PIIEntity) -> PIIEntity:
+        """Protect a single PII entity with the mechanism its policy tier asks for"""
+        mechanism = self.crypto_policy.mechanism_for(entity.label, entity.sensitivity_level)
+        if mechanism != CKKS:
+            return self._protect_pii_entity(entity, mechanism)
+        return self._encrypt_pii_entity_ckks(entity)
+    
+    def _protect_pii_entity(self, entity: PIIEntity, mechanism: str) -> PIIEntity:
+        """Tokenize, AES-GCM or BFV encrypt an entity; no plaintext goes into entity_mappings"""
+        try:
+            with stage_seconds.time(service='text', stage=mechanism.replace('-', '_')):
+                protected = self.codec.encode(self._protector(mechanism).protect(entity.text, entity.label), mechanism)
+            ciphertext_bytes.observe(len(protected), service='text', label=entity.label)
+            
+            entity.encrypted_value = protected
+            entity.protection = mechanism
+            entity.encryption_id = self._generate_encryption_id(entity)
+            self.entity_mappings[entity.encryption_id] = {
+                'label': entity.label,
+                'mechanism': mechanism,
+                'ciphertext': protected,
+            }
+            return entity
+        
+        except Exception as e:
+            logger.error(f"{mechanism} protection error for entity {entity.label}: {e}")
+            entity.encryption_id = self._generate_encryption_id(entity)
+            return entity
+    
+    def _encrypt_pii_entity_ckks(self, entity: PIIEntity) -> PIIEntity:
         """Encrypt a single PII entity using CKKS"""
         if not self.he_context:
             self.setup_he_context()
@@ -270,13 +460,17 @@ Text to analyze: "'''
             vector = self._text_to_vector(entity.text)
             
             # Encrypt using CKKS
-            encrypted_vector = ts.ckks_vector(self.he_context, vector)
+            with stage_seconds.time(service='text', stage='ckks_encrypt'):
+                encrypted_vector = ts.ckks_vector(self.he_context, vector)
             
             # Serialize encrypted data
-            encrypted_bytes = encrypted_vector.serialize()
+            with stage_seconds.time(service='text', stage='serialize'):
+                encrypted_bytes = self.codec.encode(encrypted_vector.serialize(), CKKS)
+            ciphertext_bytes.observe(len(encrypted_bytes), service='text', label=entity.label)
             
             # Update entity with encrypted data
             entity.encrypted_value = encrypted_bytes
+            entity.protection = CKKS
             entity.encryption_id = self._generate_encryption_id(entity)
             
             # Store mapping for decryption
@@ -284,7 +478,9 @@ Text to analyze: "'''
                 'original_text': entity.text,
                 'label': entity.label,
                 'vector_length': len(vector),
-                'encoding': 'utf-8'
+                'encoding': 'utf-8',
+                'mechanism': CKKS,
+                'ciphertext': encrypted_bytes,
             }
             
             logger.debug(f"Encrypted entity: {entity.label} - {entity.text[:20]}...")
@@ -297,40 +493,71 @@ Text to analyze: "'''
             return entity
     
     def encrypt_text_pii(self, text: str, min_sensitivity: int = 0) -> Dict:
-        """Detect and encrypt PII in text based on sensitivity level"""
-        # Detect PII entities using Gemini
+        """
+        Detect and encrypt PII in text based on sensitivity level
+        
+        Overlapping and duplicate spans are merged into one entity per cluster
+        before anything is encrypted. Gemini streams entities in text order, so a
+        cluster is protected as soon as an entity starts past its end, while the
+        rest of the response is still being generated.
+        """
+        # Detect PII entities using Gemini or the local detector
         logger.info(f"Detecting PII in text ({len(text)} chars)...")
-        entities = self.detect_pii_entities_with_gemini(text)
+        detect_start = time.perf_counter()
+        first_entity_time = None
+        encrypt_time = 0.0
+        entities = []
+        protected = []  # cluster entities already encrypted
+        pending = []    # sensitive entities whose cluster may still grow
+        pending_end = 0
         
-        # Filter by sensitivity level
-        entities_to_encrypt = [e for e in entities if e.sensitivity_level >= min_sensitivity]
+        def merge_clusters(items: List[PIIEntity]) -> List[PIIEntity]:
+            return resolve_overlaps(
+                items,
+                merge=lambda e, start, end: replace(e, start=start, end=end, text=text[start:end],
+                                                     encrypted_value=None, encryption_id=None, protection=None),
+                text_length=len(text),
+                priority=lambda e: (e.sensitivity_level, e.confidence)
+            )
         
-        logger.info(f"Found {len(entities)} total entities, {len(entities_to_encrypt)} to encrypt")
+        def protect(items: List[PIIEntity]):
+            nonlocal encrypt_time
+            encrypt_start = time.perf_counter()
+            for entity in items:
+                if entity.encryption_id is None:
+                    self.encrypt_pii_entity(entity)
+            encrypt_time += time.perf_counter() - encrypt_start
         
-        # Encrypt sensitive entities
-        encrypted_entities = []
-        processed_text = text
-        offset = 0
+        for entity in self.iter_pii_entities(text):
+            if first_entity_time is None:
+                first_entity_time = time.perf_counter() - detect_start
+            entities.append(entity)
+            pii_entities_total.inc(service='text', label=entity.label)
+            if entity.sensitivity_level < min_sensitivity:
+                continue
+            if pending and entity.start >= pending_end:
+                # Nothing from here on touches the pending cluster: protect it while Gemini generates the rest
+                clusters = merge_clusters(pending)
+                protect(clusters)
+                protected.extend(clusters)
+                pending = []
+            pending_end = max(pending_end, entity.end) if pending else entity.end
+            pending.append(entity)
+        detection_time = time.perf_counter() - detect_start - encrypt_time
+        stage_seconds.observe(detection_time, service='text', stage='detection')
         
-        # Sort entities by start position (reverse order for safe replacement)
-        entities_to_encrypt.sort(key=lambda x: x.start, reverse=True)
+        # Spans that arrived out of order can still join a protected cluster; the merged entity is
+        # encrypted afresh and the absorbed ciphertext is never issued to an owner
+        encrypted_entities = merge_clusters(protected + pending)
+        protect(encrypted_entities)
         
-        for entity in entities_to_encrypt:
-            # Encrypt the entity
-            encrypted_entity = self.encrypt_pii_entity(entity)
-            encrypted_entities.append(encrypted_entity)
-            
-            # Replace in text with placeholder (working backwards to preserve positions)
-            start_pos = entity.start
-            end_pos = entity.end
-            placeholder = f"[ENCRYPTED_{encrypted_entity.encryption_id}]"
-            
-            processed_text = (processed_text[:start_pos] + 
-                            placeholder + 
-                            processed_text[end_pos:])
+        logger.info(f"Found {len(entities)} total entities, {len(encrypted_entities)} to encrypt")
         
-        # Sort back to original order for return
-        encrypted_entities.reverse()
+        # Swap in all placeholders in one pass
+        processed_text, offset_map = rewrite_spans(
+            text,
+            [(e.start, e.end, f"[ENCRYPTED_{e.encryption_id}]") for e in encrypted_entities]
+        )
         
         return {
             'original_text': text,
@@ -338,56 +565,139 @@ Text to analyze: "'''
             'encrypted_entities': encrypted_entities,
             'total_entities': len(entities),
             'encrypted_count': len(encrypted_entities),
-            'all_entities': entities,
-            'gemini_response_time': None  # Can be added for performance monitoring
+            # Sensitive spans appear once per cluster, as the entity that carries the placeholder
+            'all_entities': sorted([e for e in entities if e.sensitivity_level < min_sensitivity] + encrypted_entities,
+                                   key=lambda x: x.start),
+            'offset_map': offset_map,
+            'gemini_response_time': detection_time,  # seconds spent in detection (Gemini or local model)
+            'time_to_first_entity': first_entity_time
         }
     
-    def decrypt_pii_entity(self, entity: PIIEntity) -> str:
-        """Decrypt a PII entity"""
-        if not entity.encrypted_value or not entity.encryption_id:
-            return entity.text
-        
+    def _unframe(self, entity: PIIEntity) -> Tuple[str, bytes]:
+        """(mechanism, raw ciphertext) of an entity's stored value"""
+        payload = entity.encrypted_value
+        if is_framed(payload):
+            return self.codec.decode(payload)
+        # Raw ciphertext from before the codec
+        return entity.protection or self.entity_mappings.get(entity.encryption_id, {}).get('mechanism', CKKS), payload
+    
+    def _decrypt_he_payload(self, entity: PIIEntity, mechanism: str, payload: bytes):
+        """Decrypted CKKS vector or BFV text; exceptions are returned so one bad entity doesn't sink a batch"""
         try:
-            # Deserialize encrypted vector
-            encrypted_vector = ts.lazy_ckks_vector_from(entity.encrypted_value)
-            encrypted_vector.link_context(self.he_context)
-            
-            # Decrypt
-            decrypted_vector = encrypted_vector.decrypt()
-            
-            # Convert back to text
+            if mechanism == CKKS:
+                # Deserialize encrypted vector
+                encrypted_vector = ts.lazy_ckks_vector_from(payload)
+                encrypted_vector.link_context(self.he_context)
+                return encrypted_vector.decrypt()
+            return self._protector(mechanism).reveal(payload, entity.label)
+        except Exception as e:
+            return e
+    
+    def _decode_ckks_vectors(self, vectors: List[List[float]], entities: List[PIIEntity]) -> List[str]:
+        """Convert decrypted CKKS vectors back to text, rounding all of them at once"""
+        width = max(len(vector) for vector in vectors)
+        values = np.zeros((len(vectors), width))
+        for row, vector in enumerate(vectors):
+            values[row, :len(vector)] = vector
+        
+        # Numbers back to bytes, skipping padding zeros
+        byte_values = np.rint(values * 255.0)
+        keep = (values > 0) & (byte_values <= 255)
+        
+        texts = []
+        for row, entity in enumerate(entities):
             entity_info = self.entity_mappings.get(entity.encryption_id, {})
             original_text = entity_info.get('original_text', '')
-            encoding = entity_info.get('encoding', 'utf-8')
-            
-            # Convert numbers back to bytes then to text
-            if encoding == 'utf-8':
-                byte_values = []
-                for val in decrypted_vector:
-                    if val > 0:  # Skip padding zeros
-                        byte_val = int(round(val * 255.0))
-                        if 0 <= byte_val <= 255:
-                            byte_values.append(byte_val)
-                
+            if entity_info.get('encoding', 'utf-8') == 'utf-8':
                 try:
-                    decrypted_text = bytes(byte_values).decode('utf-8').rstrip('\x00')
-                    return decrypted_text[:len(original_text)]  # Trim to original length
+                    decrypted_text = byte_values[row][keep[row]].astype(np.uint8).tobytes().decode('utf-8').rstrip('\x00')
+                    texts.append(decrypted_text[:len(original_text)])  # Trim to original length
+                    continue
                 except UnicodeDecodeError:
                     pass
             
             # Fallback to ASCII
-            chars = []
-            for val in decrypted_vector[:len(original_text)]:
-                if val > 0:
-                    char_code = int(round(val * 127.0))
-                    if 32 <= char_code <= 126:  # Printable ASCII
-                        chars.append(chr(char_code))
-            
-            return ''.join(chars)
-            
-        except Exception as e:
-            logger.error(f"Decryption error: {e}")
-            return f"[DECRYPTION_ERROR_{entity.encryption_id}]"
+            head = values[row, :len(original_text)]
+            char_codes = np.rint(head * 127.0)
+            printable = (head > 0) & (char_codes >= 32) & (char_codes <= 126)
+            texts.append(''.join(map(chr, char_codes[printable].astype(int))))
+        return texts
+    
+    def decrypt_many(self, entities: List[PIIEntity]) -> List[str]:
+        """
+        Decrypt a batch of entities in one call, in order
+        
+        Token and AES-GCM values are revealed inline. BFV/CKKS ciphertexts are
+        deserialized and decrypted on a worker pool, then all CKKS vectors are
+        decoded together with numpy.
+        """
+        results: List[Optional[str]] = [None] * len(entities)
+        he_jobs = []
+        for i, entity in enumerate(entities):
+            if not entity.encrypted_value or not entity.encryption_id:
+                results[i] = entity.text
+                continue
+            try:
+                mechanism, payload = self._unframe(entity)
+                if mechanism in (BFV, CKKS):
+                    he_jobs.append((i, mechanism, payload))
+                else:
+                    results[i] = self._protector(mechanism).reveal(payload, entity.label)
+            except Exception as e:
+                logger.error(f"Decryption error: {e}")
+                results[i] = f"[DECRYPTION_ERROR_{entity.encryption_id}]"
+        
+        if not he_jobs:
+            return results
+        
+        with stage_seconds.time(service='text', stage='he_decrypt'):
+            if len(he_jobs) == 1:
+                i, mechanism, payload = he_jobs[0]
+                outputs = [self._decrypt_he_payload(entities[i], mechanism, payload)]
+            else:
+                if self._decrypt_executor is None:
+                    self._decrypt_executor = ThreadPoolExecutor(max_workers=self.max_decrypt_workers,
+                                                                thread_name_prefix="he-decrypt")
+                outputs = list(self._decrypt_executor.map(
+                    lambda job: self._decrypt_he_payload(entities[job[0]], job[1], job[2]), he_jobs))
+        
+        ckks_rows, ckks_vectors = [], []
+        for (i, mechanism, _), output in zip(he_jobs, outputs):
+            if isinstance(output, Exception):
+                logger.error(f"Decryption error: {output}")
+                results[i] = f"[DECRYPTION_ERROR_{entities[i].encryption_id}]"
+            elif mechanism == CKKS:
+                ckks_rows.append(i)
+                ckks_vectors.append(output)
+            else:
+                results[i] = output
+        if ckks_rows:
+            texts = self._decode_ckks_vectors(ckks_vectors, [entities[i] for i in ckks_rows])
+            for i, text in zip(ckks_rows, texts):
+                results[i] = text
+        return results
+    
+    def decrypt_pii_entity(self, entity: PIIEntity) -> str:
+        """Decrypt a PII entity"""
+        return self.decrypt_many([entity])[0]
+    
+    def assign_owner(self, encryption_ids: List[str], owner: str):
+        """Record that owner may decrypt these ids (ids are content hashes, so one can have several owners)"""
+        for encryption_id in encryption_ids:
+            entity_info = self.entity_mappings.get(encryption_id)
+            if entity_info is not None:
+                entity_info.setdefault('owners', set()).add(owner)
+    
+    def stored_entity(self, encryption_id: str, owner: Optional[str] = None) -> Optional[PIIEntity]:
+        """Rebuild an entity from what encrypt_pii_entity kept for this id, or None (also when owner doesn't own it)"""
+        entity_info = self.entity_mappings.get(encryption_id)
+        if not entity_info or 'ciphertext' not in entity_info:
+            return None
+        if owner is not None and owner not in entity_info.get('owners', ()):
+            return None
+        return PIIEntity(start=0, end=0, label=entity_info['label'], text='',
+                         encrypted_value=entity_info['ciphertext'], encryption_id=encryption_id,
+                         protection=entity_info.get('mechanism'))
     
     def batch_detect_pii(self, texts: List[str], batch_size: int = 5) -> List[List[PIIEntity]]:
         """Batch process multiple texts for PII detection"""
@@ -395,6 +705,10 @@ Text to analyze: "'''
         
         logger.info(f"Processing {len(texts)} texts in batches of {batch_size}")
         
+        if self.detector is not None:
+            # Local models batch natively and need no rate limiting
+            return [self._entities_from_detector(found) for found in self.detector.detect_many(texts)]
+        
         for i in tqdm(range(0, len(texts), batch_size), desc="Processing batches"):
             batch = texts[i:i+batch_size]
             batch_results = []
@@ -413,11 +727,16 @@ Text to analyze: "'''
         return results
     
     def save_he_context(self, filepath: str):
-        """Save HE context and mappings"""
+        """Save HE context and mappings; Galois/relin keys are regenerated on load instead of stored"""
+        context = None
+        if self.he_context:
+            context = self.codec.encode_context(self.he_context, strip_public_key=getattr(self.he_config, 'symmetric', False))
         save_data = {
-            'context': self.he_context.serialize() if self.he_context else None,
-            'mappings': self.entity_mappings,
+            'context': context,
+            'mappings': self.entity_mappings.to_dict(),
             'config': self.he_config,
+            'crypto_policy': self.crypto_policy,
+            'protectors': {mechanism: p.export() for mechanism, p in self.protectors.items()},
             'api_key': None  # Don't save API key for security
         }
         
@@ -431,12 +750,23 @@ Text to analyze: "'''
         with open(filepath, 'rb') as f:
             save_data = pickle.load(f)
         
-        if save_data['context']:
-            self.he_context = ts.context_from(save_data['context'])
-        
-        self.entity_mappings = save_data['mappings']
+        self.entity_mappings = MappingStore(self.entity_mappings.max_entries, self.entity_mappings.max_age,
+                                            initial=save_data['mappings'])
         self.he_config = save_data['config']
         
+        context = save_data['context']
+        if context and is_framed(context):
+            self.he_context = self.codec.decode_context(context,
+                                                        galois_keys=self.he_config.cache_galois_keys,
+                                                        relin_keys=self.he_config.cache_relin_keys)
+        elif context:
+            self.he_context = ts.context_from(context)
+        self.crypto_policy = save_data.get('crypto_policy', self.crypto_policy)
+        restore = {TOKEN: lambda state: TokenVault.restore(state, self._token_store()),
+                   AES_GCM: AESGCMCipher.restore, BFV: BFVTextEncoder.restore}
+        self.protectors = {mechanism: restore[mechanism](state)
+                           for mechanism, state in save_data.get('protectors', {}).items()}
+        
         logger.info(f"HE context loaded from {filepath}")
 
 def demo_gemini_pii_encryption():
@@ -585,21 +915,71 @@ def advanced_gemini_demo():
     return system, all_results
 
 
+@app.get("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+def service_caller(authorization: Optional[str] = Header(None),
+                   x_pii_owner: Optional[str] = Header(None)) -> Optional[str]:
+    """Check the caller's bearer token when PII_SERVICE_TOKEN is set; returns the owner it acts for"""
+    if SERVICE_TOKEN and not hmac.compare_digest((authorization or '').encode(), f"Bearer {SERVICE_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing service token")
+    return x_pii_owner
+
 @app.get("/validate_text_msg")
-def validate_text_msg(text: str):
+def validate_text_msg(text: str, owner: Optional[str] = Depends(service_caller)):
     text = text.strip()
     
-    entities = system.detect_pii_entities_with_gemini(text)
-    
-    # Encryption
-    result = system.encrypt_text_pii(text, min_sensitivity=2)
+    # Detection happens once, inside encrypt_text_pii
+    try:
+        result = system.encrypt_text_pii(text, min_sensitivity=2)
+    except DetectionIncomplete as e:
+        # Part of the text was never checked; nothing may be returned as protected
+        raise HTTPException(status_code=502, detail=str(e))
+    if owner:
+        system.assign_owner([e.encryption_id for e in result['encrypted_entities'] if e.encryption_id], owner)
+    # Ciphertext bytes aren't JSON-serializable; encryption_id marks which entities got a placeholder
+    entities = [{k: v for k, v in asdict(e).items() if k != 'encrypted_value'} for e in result['all_entities']]
     encrypted_text = result['processed_text']
     original_text = result['original_text']
 
     return {"entities": entities, "encrypted_text": encrypted_text, "original_text": original_text}
 
+class DecryptRequest(BaseModel):
+    encryption_ids: List[str]
+
+@app.post("/decrypt")
+def decrypt(request: DecryptRequest, owner: Optional[str] = Depends(service_caller)):
+    """
+    Decrypt every placeholder of a message or chat page in one round trip
+
+    Needs the service token and an X-PII-Owner header. Ids not issued to that
+    owner are reported as missing, the same as unknown ones.
+    """
+    if not SERVICE_TOKEN:
+        raise HTTPException(status_code=503, detail="Set PII_SERVICE_TOKEN to enable /decrypt")
+    if not owner:
+        raise HTTPException(status_code=403, detail="X-PII-Owner header is required")
+    encryption_ids = list(dict.fromkeys(request.encryption_ids))
+    entities = [system.stored_entity(encryption_id, owner=owner) for encryption_id in encryption_ids]
+    found = [entity for entity in entities if entity is not None]
+    decrypted = dict(zip((entity.encryption_id for entity in found), system.decrypt_many(found)))
+    missing = [encryption_id for encryption_id, entity in zip(encryption_ids, entities) if entity is None]
+    return {"decrypted": decrypted, "missing": missing}
+
+def load_detector():
+    """Pick the PII detector from PII_DETECTOR (gemini | spacy | onnx) and PII_MODEL_PATH"""
+    kind = os.getenv("PII_DETECTOR", "gemini").lower()
+    if kind == "gemini":
+        return None
+    from local_ner import load_local_detector
+    model_path = os.getenv("PII_MODEL_PATH", "./pii_ner_model" if kind == "spacy" else "./pii_ner_onnx")
+    logger.info(f"Using local {kind} PII detector from {model_path}")
+    return load_local_detector(kind, model_path)
+
 if __name__ == "__main__":
-    system = GeminiPIIEncryptionSystem(API_KEY)
+    system = GeminiPIIEncryptionSystem(API_KEY, detector=load_detector(), crypto_policy=CryptoPolicy.from_env(),
+                                       codec=CiphertextCodec.from_env(), mapping_store=MappingStore.from_env())
     system.setup_he_context()
     uvicorn.run(app, host="0.0.0.0", port=8003)
     
@@ -0,0 +1,120 @@
+"""
+Exact byte packing for BFV, the integer alternative to CKKS text encoding.
+
+The CKKS path maps each UTF-8 byte to a float in [0, 1] and has to round its
+way back on decryption, which can lose characters. BFV works on integers modulo
+a plain modulus t, so bytes are packed big-endian, bytes_per_slot at a time,
+into slots that decrypt exactly. Slot 0 holds the payload length.
+
+Parameter sets are picked per payload: the smallest profile whose slots hold the
+text is used. Entity strings nearly always fit the N=2048 profile, whose
+ciphertexts are about 17 KB versus about 330 KB under the legacy HEConfig().
+Each profile's plain modulus is the smallest batching-friendly prime
+(t = 1 mod 2N) above 256**bytes_per_slot.
+
+Serialized ciphertexts carry a one-byte profile index so they can be decrypted
+with the matching context.
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import tenseal as ts
+
+
+@dataclass(frozen=True)
+class BFVProfile:
+    """A BFV parameter set and how many bytes it packs per slot"""
+    poly_modulus_degree: int
+    coeff_mod_bit_sizes: tuple
+    plain_modulus: int
+    bytes_per_slot: int
+
+    @property
+    def capacity(self) -> int:
+        """Payload bytes that fit in one ciphertext (slot 0 holds the length)"""
+        return (self.poly_modulus_degree - 1) * self.bytes_per_slot
+
+
+# Smallest first. Coefficient moduli stay within SEAL's 128-bit security bounds
+# and leave enough noise budget for a fresh encryption at each plain modulus.
+BFV_PROFILES = (
+    BFVProfile(2048, (27, 27), 86017, 2),
+    BFVProfile(4096, (54, 55), 16801793, 3),
+    BFVProfile(8192, (60, 60, 60), 4295049217, 4),
+)
+
+
+def select_profile(num_bytes: int, profiles: Sequence[BFVProfile] = BFV_PROFILES) -> int:
+    """Index of the smallest profile that holds num_bytes"""
+    for idx, profile in enumerate(profiles):
+        if num_bytes <= profile.capacity:
+            return idx
+    raise ValueError(f"{num_bytes} bytes exceeds the largest BFV profile ({profiles[-1].capacity} bytes)")
+
+
+def pack_bytes(data: bytes, profile: BFVProfile) -> List[int]:
+    """[len(data), big-endian integers of bytes_per_slot bytes each (last one zero-padded)]"""
+    k = profile.bytes_per_slot
+    padded = data + b'\x00' * (-len(data) % k)
+    return [len(data)] + [int.from_bytes(padded[i:i + k], 'big') for i in range(0, len(padded), k)]
+
+
+def unpack_bytes(values: Sequence[int], profile: BFVProfile) -> bytes:
+    """Inverse of pack_bytes; values may come back centered, so they are reduced mod t first"""
+    t, k = profile.plain_modulus, profile.bytes_per_slot
+    length = values[0] % t
+    slots = -(-length // k)
+    data = b''.join((value % t).to_bytes(k, 'big') for value in values[1:1 + slots])
+    return data[:length]
+
+
+class BFVTextEncoder:
+    """
+    Encrypts strings bit-exactly with BFV, one context per profile (created on first use)
+
+    protect/reveal match the protector interface in crypto_policy, so this can
+    back the 'bfv' mechanism of a CryptoPolicy.
+    """
+
+    def __init__(self, profiles: Sequence[BFVProfile] = BFV_PROFILES,
+                 contexts: Optional[Dict[int, 'ts.Context']] = None):
+        self.profiles = tuple(profiles)
+        self.contexts: Dict[int, ts.Context] = dict(contexts or {})
+
+    def context(self, idx: int) -> 'ts.Context':
+        context = self.contexts.get(idx)
+        if context is None:
+            profile = self.profiles[idx]
+            context = ts.context(
+                ts.SCHEME_TYPE.BFV,
+                poly_modulus_degree=profile.poly_modulus_degree,
+                plain_modulus=profile.plain_modulus,
+                coeff_mod_bit_sizes=list(profile.coeff_mod_bit_sizes),
+                encryption_type=ts.ENCRYPTION_TYPE.SYMMETRIC  # the service holds the secret key anyway
+            )
+            self.contexts[idx] = context
+        return context
+
+    def encrypt(self, data: bytes) -> bytes:
+        idx = select_profile(len(data), self.profiles)
+        vector = ts.bfv_vector(self.context(idx), pack_bytes(data, self.profiles[idx]))
+        return bytes([idx]) + vector.serialize()
+
+    def decrypt(self, blob: bytes) -> bytes:
+        idx = blob[0]
+        vector = ts.lazy_bfv_vector_from(blob[1:])
+        vector.link_context(self.context(idx))
+        return unpack_bytes(vector.decrypt(), self.profiles[idx])
+
+    def protect(self, text: str, label: str) -> bytes:
+        return self.encrypt(text.encode('utf-8'))
+
+    def reveal(self, blob: bytes, label: str) -> str:
+        return self.decrypt(blob).decode('utf-8')
+
+    def export(self) -> dict:
+        return {'contexts': {idx: context.serialize(save_secret_key=True) for idx, context in self.contexts.items()}}
+
+    @classmethod
+    def restore(cls, state: dict) -> 'BFVTextEncoder':
+        return cls(contexts={idx: ts.context_from(data) for idx, data in state['contexts'].items()})
@@ -0,0 +1,185 @@
+"""
+CKKS parameter profiling and automatic selection.
+
+The text service only encrypts and decrypts entity vectors; it never multiplies
+or rotates ciphertexts. The old fixed HEConfig (N=8192, [60, 40, 40, 60]) paid
+for three levels of multiplicative depth anyway, and its ciphertexts were about
+330 KB each. Here candidate depth-0 parameter sets are derived from the
+HomomorphicEncryption.org bounds for the requested security level. Each one is
+profiled for encrypt/decrypt time, serialized size and round-trip precision.
+The selector returns the smallest one that has enough slots for the payload and
+decodes every byte exactly.
+
+    python he_params.py --payload 100 --security 128
+"""
+import argparse
+import random
+import statistics
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import tenseal as ts
+
+# Max total coefficient modulus bits per poly_modulus_degree (HE standard, as enforced by SEAL)
+MAX_COEFF_BITS = {
+    128: {1024: 27, 2048: 54, 4096: 109, 8192: 218, 16384: 438, 32768: 881},
+    192: {1024: 19, 2048: 37, 4096: 75, 8192: 152, 16384: 305, 32768: 611},
+    256: {1024: 14, 2048: 29, 4096: 58, 8192: 118, 16384: 237, 32768: 476},
+}
+
+MAX_PRIME_BITS = 60
+SCALE_HEADROOM_BITS = 5  # data prime bits left above the scale for the value (<= 1) and noise
+BYTE_TOLERANCE = 0.5 / 255.0  # _text_to_vector stores byte / 255; larger errors round to the wrong byte
+
+
+@dataclass
+class HEConfig:
+    """Configuration for homomorphic encryption parameters"""
+    poly_modulus_degree: int = 8192
+    coeff_mod_bit_sizes: List[int] = None
+    scale: float = 2.0**40
+    cache_galois_keys: bool = True
+    cache_relin_keys: bool = True
+    symmetric: bool = False  # encrypt with the secret key, so the context needs no public key
+
+    def __post_init__(self):
+        if self.coeff_mod_bit_sizes is None:
+            self.coeff_mod_bit_sizes = [60, 40, 40, 60]
+
+
+def security_level(config: HEConfig) -> Optional[int]:
+    """Highest standard security level the parameters meet, or None"""
+    total = sum(config.coeff_mod_bit_sizes)
+    for level in sorted(MAX_COEFF_BITS, reverse=True):
+        if total <= MAX_COEFF_BITS[level].get(config.poly_modulus_degree, 0):
+            return level
+    return None
+
+
+def candidate_configs(payload_length: int, level: int = 128) -> List[HEConfig]:
+    """
+    Depth-0 CKKS parameter sets for the security level, smallest first
+
+    One data prime plus the special prime, splitting the modulus budget evenly,
+    with the scale SCALE_HEADROOM_BITS below the data prime. No Galois or relin
+    keys, since nothing is rotated or multiplied, and symmetric encryption, since
+    the service that encrypts also holds the secret key.
+    """
+    candidates = []
+    for degree, budget in sorted(MAX_COEFF_BITS[level].items()):
+        if degree // 2 < payload_length:
+            continue
+        prime_bits = min(MAX_PRIME_BITS, budget // 2)
+        # Primes must be = 1 mod 2N, which needs more bits than log2(2N)
+        if prime_bits <= (2 * degree).bit_length():
+            continue
+        candidates.append(HEConfig(
+            poly_modulus_degree=degree,
+            coeff_mod_bit_sizes=[prime_bits, prime_bits],
+            scale=2.0 ** (prime_bits - SCALE_HEADROOM_BITS),
+            cache_galois_keys=False,
+            cache_relin_keys=False,
+            symmetric=True,
+        ))
+    return candidates
+
+
+def make_context(config: HEConfig) -> 'ts.Context':
+    context = ts.context(
+        ts.SCHEME_TYPE.CKKS,
+        poly_modulus_degree=config.poly_modulus_degree,
+        coeff_mod_bit_sizes=config.coeff_mod_bit_sizes,
+        encryption_type=ts.ENCRYPTION_TYPE.SYMMETRIC if config.symmetric else ts.ENCRYPTION_TYPE.ASYMMETRIC
+    )
+    if config.cache_galois_keys:
+        context.generate_galois_keys()
+    if config.cache_relin_keys:
+        context.generate_relin_keys()
+    context.global_scale = config.scale
+    return context
+
+
+def profile_he_config(config: HEConfig, payload_length: int, samples: int = 20, seed: int = 0) -> Dict:
+    """Encrypt/decrypt random byte vectors and report latency, size and precision"""
+    row = {
+        'poly_modulus_degree': config.poly_modulus_degree,
+        'coeff_mod_bit_sizes': list(config.coeff_mod_bit_sizes),
+        'scale_bits': int(config.scale).bit_length() - 1,
+        'security_level': security_level(config),
+    }
+    try:
+        context = make_context(config)
+    except (RuntimeError, ValueError) as e:
+        # e.g. too few primes of that size are = 1 mod 2N
+        row.update(error=str(e), byte_exact=False)
+        return row
+
+    rng = random.Random(seed)
+    encrypt_s, decrypt_s, sizes = [], [], []
+    max_error = 0.0
+    for _ in range(samples):
+        vector = [rng.randrange(256) / 255.0 for _ in range(payload_length)]
+        t0 = time.perf_counter()
+        serialized = ts.ckks_vector(context, vector).serialize()
+        encrypt_s.append(time.perf_counter() - t0)
+        sizes.append(len(serialized))
+
+        t0 = time.perf_counter()
+        encrypted = ts.lazy_ckks_vector_from(serialized)
+        encrypted.link_context(context)
+        decrypted = encrypted.decrypt()
+        decrypt_s.append(time.perf_counter() - t0)
+        max_error = max(max_error, max(abs(a - b) for a, b in zip(decrypted, vector)))
+
+    row.update(
+        ciphertext_bytes=round(statistics.mean(sizes)),
+        encrypt_ms=round(statistics.median(encrypt_s) * 1000, 3),
+        decrypt_ms=round(statistics.median(decrypt_s) * 1000, 3),
+        max_error=max_error,
+        byte_exact=max_error < BYTE_TOLERANCE,
+    )
+    return row
+
+
+def select_he_config(payload_length: int = 100, level: int = 128, samples: int = 20) -> HEConfig:
+    """Smallest candidate for the security level that round-trips payload_length bytes exactly"""
+    for config in candidate_configs(payload_length, level):
+        if profile_he_config(config, payload_length, samples)['byte_exact']:
+            return config
+    raise ValueError(f"No CKKS parameters meet {level}-bit security for a {payload_length}-slot payload")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--payload', type=int, default=100, help='Slots per entity vector')
+    parser.add_argument('--security', type=int, default=128, choices=sorted(MAX_COEFF_BITS))
+    parser.add_argument('--samples', type=int, default=20)
+    parser.add_argument('--include-default', action='store_true', help='Also profile the legacy HEConfig()')
+    args = parser.parse_args()
+
+    configs = candidate_configs(args.payload, args.security)
+    if args.include_default:
+        configs.append(HEConfig())
+    print(f"{'N':>6} {'coeff bits':<18} {'scale':>5} {'sec':>4} {'ct bytes':>9} {'enc ms':>8} {'dec ms':>8} "
+          f"{'max err':>9} exact")
+    selected = None
+    for config in configs:
+        row = profile_he_config(config, args.payload, args.samples)
+        if 'error' in row:
+            print(f"{row['poly_modulus_degree']:>6} {str(row['coeff_mod_bit_sizes']):<18} unusable: {row['error']}")
+            continue
+        if selected is None and row['byte_exact'] and row['security_level'] and row['security_level'] >= args.security:
+            selected = row
+        print(f"{row['poly_modulus_degree']:>6} {str(row['coeff_mod_bit_sizes']):<18} {row['scale_bits']:>5} "
+              f"{row['security_level'] or '-':>4} {row['ciphertext_bytes']:>9} {row['encrypt_ms']:>8} "
+              f"{row['decrypt_ms']:>8} {row['max_error']:>9.2e} {row['byte_exact']}")
+    if selected:
+        print(f"\nSelected N={selected['poly_modulus_degree']} {selected['coeff_mod_bit_sizes']} "
+              f"scale 2^{selected['scale_bits']}")
+    else:
+        print("\nNo candidate met the requirements")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,362 @@
+import asyncio
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+
+@dataclass
+class CacheKey:
+    """
+    Identity of an image: exact content hash plus optional perceptual hash
+
+    variant separates results computed differently from the same image (e.g. an
+    early-exit run) and is folded into sha256. The perceptual hash needs a full
+    decode, so it is left unset until an exact lookup misses; image_bytes is kept
+    until then to compute it from.
+    """
+    sha256: str
+    phash: Optional[int] = None
+    variant: str = ''
+    image_bytes: Optional[bytes] = field(default=None, repr=False, compare=False)
+
+
+def dhash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """64-bit difference hash, stable across re-encoding and mild resizing"""
+    image = Image.open(io.BytesIO(image_bytes)).convert('L').resize((hash_size + 1, hash_size))
+    pixels = np.asarray(image, dtype=np.int16)
+    value = 0
+    for bit in (pixels[:, :-1] > pixels[:, 1:]).flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+
+def _to_json(value: Any):
+    """json.dumps default for the numpy scalars and arrays in OCR boxes"""
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class ImageResultCache:
+    """
+    Size-bounded LRU cache of OCR analysis results keyed on image content.
+
+    Entries are looked up by SHA-256 of the raw bytes first. With use_phash enabled,
+    a miss falls back to a perceptual hash so re-encoded copies of the same image
+    (e.g. forwarded screenshots) also hit. An optional disk tier keeps evicted and
+    cold entries across restarts. It is bounded like the memory tier, evicting the
+    least recently used files by mtime, and stores JSON so nothing read back from
+    the directory is executed.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024,
+                 disk_dir: Optional[str] = None, use_phash: bool = False,
+                 phash_max_distance: int = 0, disk_max_entries: int = 16384,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.use_phash = use_phash
+        self.phash_max_distance = phash_max_distance
+
+        self._entries: "OrderedDict[str, Tuple[Any, float, int]]" = OrderedDict()
+        self._phash_index: Dict[Tuple[str, int], str] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Event] = {}
+        self._disk_entries: "OrderedDict[str, int]" = OrderedDict()  # sha -> file size, oldest first
+        self._disk_bytes = 0
+
+        self.hits = 0
+        self.phash_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def make_key(self, image_bytes: bytes, variant: str = '') -> CacheKey:
+        """Exact content hash; the perceptual hash is deferred to _phash_for on a miss"""
+        sha = hashlib.sha256(image_bytes).hexdigest()
+        if variant:
+            sha = f"{sha}-{variant}"
+        return CacheKey(sha, variant=variant, image_bytes=image_bytes if self.use_phash else None)
+
+    def _phash_for(self, key: CacheKey) -> Optional[int]:
+        """Compute key's perceptual hash once, if enabled (called without the lock held)"""
+        if key.phash is None and key.image_bytes is not None:
+            try:
+                key.phash = dhash(key.image_bytes)
+            except Exception:
+                key.phash = None
+            key.image_bytes = None
+        return key.phash
+
+    def get(self, key: CacheKey) -> Optional[Any]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            entry = self._get_memory(key.sha256)
+        if entry is None and self._phash_for(key) is not None:
+            with self._lock:
+                alias = self._find_phash(key.variant, key.phash)
+                if alias is not None:
+                    entry = self._get_memory(alias)
+                    if entry is not None:
+                        self.phash_hits += 1
+
+        if entry is None:
+            entry = self._get_disk(key.sha256)
+            if entry is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._put_memory(key, *entry)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_ms += entry[1]
+        return entry[0]
+
+    def put(self, key: CacheKey, value: Any, compute_ms: float):
+        """Store value for key, remembering how long it took to compute"""
+        blob = json.dumps({'value': value, 'compute_ms': compute_ms}, default=_to_json).encode('utf-8')
+        self._phash_for(key)
+        with self._lock:
+            self._put_memory(key, value, compute_ms, len(blob))
+        if self.disk_dir:
+            self._put_disk(key.sha256, blob)
+
+    def get_or_compute(self, key: CacheKey, compute: Callable[[], Any],
+                       should_cache: Callable[[Any], bool] = lambda value: True) -> Tuple[Any, bool]:
+        """
+        Return (value, was_cached). Concurrent callers with the same key wait for
+        the first one to finish instead of running the pipeline again.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value, True
+
+            with self._lock:
+                event = self._inflight.get(key.sha256)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[key.sha256] = event
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                event.wait()
+                if self._has(key.sha256):
+                    # Undo the miss counted above; the retry counts the hit
+                    with self._lock:
+                        self.misses -= 1
+                    continue
+                # The owner failed or chose not to cache; compute our own copy
+                return compute(), False
+
+            try:
+                start = time.perf_counter()
+                value = compute()
+                if should_cache(value):
+                    self.put(key, value, (time.perf_counter() - start) * 1000)
+                return value, False
+            finally:
+                with self._lock:
+                    self._inflight.pop(key.sha256, None)
+                event.set()
+
+    async def get_or_compute_async(self, key: CacheKey, compute: Callable[[], Awaitable[Any]],
+                                   should_cache: Callable[[Any], bool] = lambda value: True) -> Tuple[Any, bool]:
+        """
+        get_or_compute for a coroutine compute. Waiting for a concurrent owner (sync
+        or async) polls its event instead of holding a thread.
+        """
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value, True
+
+            with self._lock:
+                event = self._inflight.get(key.sha256)
+                if event is None:
+                    event = threading.Event()
+                    self._inflight[key.sha256] = event
+                    owner = True
+                else:
+                    owner = False
+
+            if not owner:
+                while not event.is_set():
+                    await asyncio.sleep(0.01)
+                if self._has(key.sha256):
+                    with self._lock:
+                        self.misses -= 1
+                    continue
+                return await compute(), False
+
+            try:
+                start = time.perf_counter()
+                value = await compute()
+                if should_cache(value):
+                    self.put(key, value, (time.perf_counter() - start) * 1000)
+                return value, False
+            finally:
+                with self._lock:
+                    self._inflight.pop(key.sha256, None)
+                event.set()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'phash_hits': self.phash_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'disk_entries': len(self._disk_entries),
+                'disk_bytes': self._disk_bytes,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'saved_ms': round(self.saved_ms, 1),
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._phash_index.clear()
+            self._bytes = 0
+
+    # Internal helpers (callers hold self._lock unless noted)
+
+    def _has(self, sha: str) -> bool:
+        with self._lock:
+            return sha in self._entries or sha in self._disk_entries
+
+    def _get_memory(self, sha: str) -> Optional[Tuple[Any, float, int]]:
+        entry = self._entries.get(sha)
+        if entry is not None:
+            self._entries.move_to_end(sha)
+        return entry
+
+    def _put_memory(self, key: CacheKey, value: Any, compute_ms: float, size: int):
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key.sha256, None)
+        if old is not None:
+            self._bytes -= old[2]
+        self._entries[key.sha256] = (value, compute_ms, size)
+        self._bytes += size
+        if key.phash is not None:
+            self._phash_index[(key.variant, key.phash)] = key.sha256
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+
+        if len(self._phash_index) > 4 * self.max_entries:
+            self._phash_index = {p: s for p, s in self._phash_index.items() if s in self._entries}
+
+    def _find_phash(self, variant: str, phash: int) -> Optional[str]:
+        sha = self._phash_index.get((variant, phash))
+        if sha is not None or self.phash_max_distance <= 0:
+            return sha
+        best, best_distance = None, self.phash_max_distance + 1
+        for (candidate_variant, candidate), candidate_sha in self._phash_index.items():
+            if candidate_variant != variant:
+                continue
+            distance = bin(candidate ^ phash).count('1')
+            if distance < best_distance:
+                best, best_distance = candidate_sha, distance
+        return best
+
+    def _disk_path(self, sha: str) -> str:
+        return os.path.join(self.disk_dir, f"{sha}.json")
+
+    def _scan_disk(self):
+        """Index the files already in disk_dir, least recently used first"""
+        files = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                files.append((stat.st_mtime, name[:-len('.json')], stat.st_size))
+        with self._lock:
+            for _, sha, size in sorted(files):
+                self._disk_entries[sha] = size
+                self._disk_bytes += size
+            evicted = self._evict_disk()
+        self._remove_disk(evicted)
+
+    def _evict_disk(self) -> list:
+        """Drop least recently used disk entries past the limits; returns the shas whose files to delete"""
+        evicted = []
+        while self._disk_entries and (len(self._disk_entries) > self.disk_max_entries
+                                      or self._disk_bytes > self.disk_max_bytes):
+            sha, size = self._disk_entries.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(sha)
+        return evicted
+
+    def _remove_disk(self, shas):
+        """Delete disk entry files (called without the lock held)"""
+        for sha in shas:
+            try:
+                os.remove(self._disk_path(sha))
+            except OSError:
+                pass
+
+    def _put_disk(self, sha: str, blob: bytes):
+        """Write an entry to the disk tier (called without the lock held)"""
+        if len(blob) > self.disk_max_bytes:
+            return
+        path = self._disk_path(sha)
+        try:
+            # Written under a temporary name and renamed, so readers never see half a file
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(blob)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Image cache disk write failed: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += len(blob) - self._disk_entries.pop(sha, 0)
+            self._disk_entries[sha] = len(blob)
+            evicted = self._evict_disk()
+        self._remove_disk(evicted)
+
+    def _get_disk(self, sha: str) -> Optional[Tuple[Any, float, int]]:
+        """Read an entry from the disk tier (called without the lock held)"""
+        if not self.disk_dir:
+            return None
+        with self._lock:
+            if sha not in self._disk_entries:
+                return None
+            self._disk_entries.move_to_end(sha)
+        path = self._disk_path(sha)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            entry = json.loads(blob)
+            os.utime(path)  # mtime is the LRU order across restarts
+            return entry['value'], float(entry['compute_ms']), len(blob)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Image cache disk read failed: {e}")
+            return None
@@ -0,0 +1,92 @@
+"""
+Incremental parser for a JSON array that arrives in pieces.
+
+Gemini streams its answer as arbitrary text fragments. IncrementalJSONArrayParser
+scans each fragment once, tracking nesting depth and string state, and hands
+back every top-level array element as soon as its closing bracket arrives, so
+callers can act on the first entities while later ones are still generating.
+Anything before the opening '[' (a ```json fence, prose) is skipped.
+"""
+import json
+from typing import Any, Iterable, Iterator, List
+
+
+class IncrementalJSONArrayParser:
+    """Feed text fragments, get back completed top-level array elements"""
+
+    def __init__(self):
+        self._buffer = []        # fragments of the element currently being read
+        self._started = False    # seen the opening '['
+        self._finished = False   # seen the closing ']'
+        self._depth = 0          # nesting depth inside the current element
+        self._in_string = False
+        self._escape = False
+        self.items_parsed = 0
+        self.errors = 0
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def feed(self, fragment: str) -> List[Any]:
+        items = []
+        pos = 0
+        if not self._started:
+            pos = fragment.find('[')
+            if pos < 0:
+                return items
+            self._started = True
+            pos += 1
+
+        element_start = pos
+        for i in range(pos, len(fragment)):
+            if self._finished:
+                break
+            ch = fragment[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch in '[{':
+                self._depth += 1
+            elif ch in ']}':
+                if self._depth == 0 and ch == ']':
+                    self._emit(fragment[element_start:i], items)
+                    self._finished = True
+                    break
+                self._depth -= 1
+            elif ch == ',' and self._depth == 0:
+                self._emit(fragment[element_start:i], items)
+                element_start = i + 1
+
+        if not self._finished:
+            self._buffer.append(fragment[element_start:])
+        return items
+
+    def _emit(self, tail: str, items: List[Any]):
+        self._buffer.append(tail)
+        raw = ''.join(self._buffer).strip()
+        self._buffer = []
+        if not raw:
+            return
+        try:
+            items.append(json.loads(raw))
+            self.items_parsed += 1
+        except json.JSONDecodeError:
+            self.errors += 1
+
+
+def iter_json_array(fragments: Iterable[str]) -> Iterator[Any]:
+    """Yield the elements of a streamed JSON array as each one completes"""
+    parser = IncrementalJSONArrayParser()
+    for fragment in fragments:
+        yield from parser.feed(fragment)
+        if parser.finished:
+            break
@@ -0,0 +1,265 @@
+"""
+Offline PII detectors for the text service.
+
+Both detectors return plain (start, end, label, text, confidence) tuples with
+labels already mapped onto the label set used by GeminiPIIEncryptionSystem, so
+the service can swap them in for Gemini without touching sensitivity rules.
+
+    spacy  - the NER model produced by PIIEncryptionSystem.train_ner_model
+    onnx   - a token-classification transformer exported (and int8-quantized)
+             with `python local_ner.py export`
+
+spaCy, onnxruntime and transformers are only imported by the detector that
+needs them.
+"""
+import argparse
+import json
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from batch_scheduler import MicroBatchScheduler
+
+logger = logging.getLogger(__name__)
+
+RawEntity = Tuple[int, int, str, str, float]
+
+# Dataset / spaCy labels -> labels used by GeminiPIIEncryptionSystem's sensitivity rules
+LABEL_ALIASES = {
+    'FIRSTNAME': 'PERSON', 'LASTNAME': 'PERSON', 'MIDDLENAME': 'PERSON', 'PREFIX': 'PERSON',
+    'FULLNAME': 'PERSON', 'NAME': 'PERSON',
+    'EMAIL': 'EMAIL',
+    'PHONE': 'PHONE', 'PHONENUMBER': 'PHONE', 'PHONEIMEI': 'ID_NUMBER',
+    'SSN': 'SSN',
+    'CREDITCARD': 'CREDITCARD', 'CREDITCARDNUMBER': 'CREDITCARD', 'CREDITCARDCVV': 'CREDITCARD',
+    'ACCOUNTNUMBER': 'FINANCIAL', 'ACCOUNTNAME': 'FINANCIAL', 'IBAN': 'FINANCIAL', 'BIC': 'FINANCIAL',
+    'BITCOINADDRESS': 'FINANCIAL', 'ETHEREUMADDRESS': 'FINANCIAL', 'LITECOINADDRESS': 'FINANCIAL',
+    'FINANCIALINFO': 'FINANCIAL',
+    'PASSWORD': 'ID_NUMBER', 'PIN': 'ID_NUMBER', 'VEHICLEVIN': 'ID_NUMBER', 'VEHICLEVRM': 'ID_NUMBER',
+    'ID_NUMBER': 'ID_NUMBER',
+    'MEDICALRECORD': 'MEDICAL',
+    'STREET': 'ADDRESS', 'BUILDINGNUMBER': 'ADDRESS', 'SECONDARYADDRESS': 'ADDRESS', 'ZIPCODE': 'ADDRESS',
+    'ADDRESS': 'ADDRESS',
+    'CITY': 'LOCATION', 'STATE': 'LOCATION', 'COUNTY': 'LOCATION', 'GPE': 'LOCATION', 'LOC': 'LOCATION',
+    'NEARBYGPSCOORDINATE': 'LOCATION',
+    'COMPANYNAME': 'ORGANIZATION', 'COMPANY': 'ORGANIZATION', 'ORG': 'ORGANIZATION',
+    'DOB': 'DATE', 'DATE': 'DATE', 'TIME': 'TIME',
+    'USERNAME': 'USERNAME', 'USERAGENT': 'MISC',
+    'IP': 'IP_ADDRESS', 'IPV4': 'IP_ADDRESS', 'IPV6': 'IP_ADDRESS', 'MAC': 'IP_ADDRESS',
+    'URL': 'URL',
+    'PERSON': 'PERSON',
+}
+
+
+def normalize_label(label: str) -> str:
+    """Map a model label (with or without BIO prefix / _N suffix) onto the service label set"""
+    if label[:2] in ('B-', 'I-'):
+        label = label[2:]
+    label = label.strip('[]').upper()
+    if label in LABEL_ALIASES:
+        return LABEL_ALIASES[label]
+    return LABEL_ALIASES.get(label.split('_')[0], 'MISC')
+
+
+class SpacyNERDetector:
+    """NER-only spaCy pipeline (e.g. the model trained by train_ner_model)"""
+
+    NON_NER_COMPONENTS = ["tagger", "parser", "lemmatizer", "attribute_ruler", "senter", "morphologizer"]
+
+    def __init__(self, model_path: str, batch_size: int = 256):
+        import spacy
+
+        self.nlp = spacy.load(model_path, exclude=self.NON_NER_COMPONENTS)
+        self.batch_size = batch_size
+        logger.info(f"Loaded spaCy NER model from {model_path} ({self.nlp.pipe_names})")
+
+    def detect(self, text: str) -> List[RawEntity]:
+        return self.detect_many([text])[0]
+
+    def detect_many(self, texts: List[str]) -> List[List[RawEntity]]:
+        return [[(ent.start_char, ent.end_char, normalize_label(ent.label_), ent.text, 1.0) for ent in doc.ents]
+                for doc in self.nlp.pipe(texts, batch_size=self.batch_size)]
+
+    def close(self):
+        pass
+
+
+class OnnxNERDetector:
+    """
+    Token-classification transformer served with onnxruntime
+
+    Single-text calls go through a MicroBatchScheduler, so concurrent requests
+    share one forward pass. Texts longer than max_length are split into
+    overlapping windows whose entities are merged back into text offsets.
+    """
+
+    def __init__(self, model_dir: str, max_length: int = 256, stride: int = 32,
+                 max_batch_size: int = 32, max_latency_ms: float = 10.0, num_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        with open(os.path.join(model_dir, 'config.json')) as f:
+            self.id2label = {int(k): v for k, v in json.load(f)['id2label'].items()}
+
+        model_file = os.path.join(model_dir, 'model.int8.onnx')
+        if not os.path.exists(model_file):
+            model_file = os.path.join(model_dir, 'model.onnx')
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_file, options, providers=['CPUExecutionProvider'])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+        self.max_length = max_length
+        self.stride = stride
+        self.max_batch_size = max_batch_size
+        self.scheduler = MicroBatchScheduler(self.detect_many, max_batch_size=max_batch_size,
+                                             max_latency_ms=max_latency_ms)
+        self.scheduler.start()
+        logger.info(f"Loaded ONNX NER model from {model_file}")
+
+    def detect(self, text: str) -> List[RawEntity]:
+        return self.scheduler.infer(text)
+
+    def detect_many(self, texts: List[str]) -> List[List[RawEntity]]:
+        results: List[List[RawEntity]] = [[] for _ in texts]
+        for start in range(0, len(texts), self.max_batch_size):
+            chunk = texts[start:start + self.max_batch_size]
+            for i, entities in enumerate(self._run(chunk)):
+                results[start + i] = entities
+        return results
+
+    def close(self):
+        self.scheduler.stop()
+
+    def _run(self, texts: List[str]) -> List[List[RawEntity]]:
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length, stride=self.stride,
+                                 return_overflowing_tokens=True, return_offsets_mapping=True,
+                                 padding=True, return_tensors='np')
+        feeds = {name: encoded[name].astype(np.int64) for name in ('input_ids', 'attention_mask', 'token_type_ids')
+                 if name in self.input_names and name in encoded}
+        logits = self.session.run(None, feeds)[0]
+
+        # Softmax over labels, vectorized for the whole batch
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=-1, keepdims=True)
+        label_ids = probs.argmax(axis=-1)
+        scores = probs.max(axis=-1)
+
+        per_text: List[dict] = [{} for _ in texts]
+        sample_map = encoded['overflow_to_sample_mapping']
+        for window, text_idx in enumerate(sample_map):
+            text = texts[text_idx]
+            for entity in self._decode(text, encoded['offset_mapping'][window], encoded['attention_mask'][window],
+                                       label_ids[window], scores[window]):
+                key = (entity[0], entity[1])
+                # Overlapping windows report the same span twice; keep the more confident one
+                if key not in per_text[text_idx] or per_text[text_idx][key][4] < entity[4]:
+                    per_text[text_idx][key] = entity
+        return [sorted(found.values()) for found in per_text]
+
+    def _decode(self, text, offsets, attention, label_ids, scores) -> List[RawEntity]:
+        """Group BIO (or plain per-token) labels into character spans"""
+        entities = []
+        current = None  # [start, end, label, score_sum, tokens]
+        for (tok_start, tok_end), mask, label_id, score in zip(offsets, attention, label_ids, scores):
+            if not mask or tok_start == tok_end:  # padding / special tokens
+                continue
+            raw = self.id2label[int(label_id)]
+            if raw == 'O':
+                current = self._close(text, current, entities)
+                continue
+            label = normalize_label(raw)
+            continues = current is not None and current[2] == label and not raw.startswith('B-') \
+                and tok_start <= current[1] + 1
+            if continues:
+                current[1] = int(tok_end)
+                current[3] += float(score)
+                current[4] += 1
+            else:
+                self._close(text, current, entities)
+                current = [int(tok_start), int(tok_end), label, float(score), 1]
+        self._close(text, current, entities)
+        return entities
+
+    @staticmethod
+    def _close(text, current, entities):
+        if current is not None:
+            start, end, label, score_sum, tokens = current
+            entities.append((start, end, label, text[start:end], score_sum / tokens))
+        return None
+
+
+def load_local_detector(kind: str, model_path: str):
+    """Build the detector selected at startup ('spacy' or 'onnx')"""
+    if kind == 'spacy':
+        return SpacyNERDetector(model_path)
+    if kind == 'onnx':
+        return OnnxNERDetector(model_path)
+    raise ValueError(f"Unknown local detector: {kind}")
+
+
+def export_onnx(model_name_or_path: str, output_dir: str, quantize: bool = True, opset: int = 17) -> str:
+    """
+    Export a Hugging Face token-classification model to ONNX, optionally with
+    dynamic int8 quantization, alongside its tokenizer and config
+    """
+    import torch
+    from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name_or_path, use_fast=True)
+    model = AutoModelForTokenClassification.from_pretrained(model_name_or_path).eval()
+    tokenizer.save_pretrained(output_dir)
+    model.config.save_pretrained(output_dir)
+
+    sample = tokenizer(["John lives at 5 Main Street"], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['logits'] = {0: 'batch', 1: 'sequence'}
+
+    onnx_path = os.path.join(output_dir, 'model.onnx')
+    with torch.no_grad():
+        torch.onnx.export(model, tuple(sample[name] for name in input_names), onnx_path,
+                          input_names=input_names, output_names=['logits'],
+                          dynamic_axes=dynamic_axes, opset_version=opset)
+    logger.info(f"Exported ONNX model to {onnx_path}")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantized_path = os.path.join(output_dir, 'model.int8.onnx')
+        quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8)
+        logger.info(f"Wrote int8 model to {quantized_path}")
+        return quantized_path
+    return onnx_path
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Offline PII NER tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export a token-classification model to ONNX')
+    export_parser.add_argument('--model', required=True, help='HF model name or local fine-tuned model dir')
+    export_parser.add_argument('--output', required=True, help='Directory for model.onnx, tokenizer and config')
+    export_parser.add_argument('--no-quantize', action='store_true', help='Skip int8 dynamic quantization')
+
+    detect_parser = subparsers.add_parser('detect', help='Run a local detector on some text')
+    detect_parser.add_argument('--kind', choices=['spacy', 'onnx'], required=True)
+    detect_parser.add_argument('--model', required=True)
+    detect_parser.add_argument('text')
+
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_onnx(args.model, args.output, quantize=not args.no_quantize)
+    else:
+        detector = load_local_detector(args.kind, args.model)
+        for entity in detector.detect(args.text):
+            print(entity)
+        detector.close()
@@ -0,0 +1,68 @@
+import re
+from typing import Dict, List
+
+# Fast, offline PII patterns. Labels and sensitivity levels follow the
+# GeminiPIIEncryptionSystem sensitivity rules so results can be compared directly.
+LOCAL_PII_PATTERNS = [
+    ('EMAIL', 2, re.compile(r"\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}\b")),
+    ('SSN', 3, re.compile(r"\b\d{3}-\d{2}-\d{4}\b")),
+    ('ID_NUMBER', 3, re.compile(r"\b[STFGM]\d{7}[A-Z]\b")),  # Singapore NRIC / FIN
+    ('CREDITCARD', 3, re.compile(r"\b(?:\d[ -]?){12,18}\d\b")),
+    ('IP_ADDRESS', 2, re.compile(r"\b(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)\b")),
+    # Only digit runs laid out like a phone number count: a +country code, a
+    # parenthesised area code, or 3-3-4 / 3-4 groups with separators
+    ('PHONE', 2, re.compile(r"(?<!\w)(?:\+\d{1,3}[-.\s]?(?:\(\d{1,4}\)[-.\s]?)?\d{2,4}(?:[-.\s]?\d{2,4}){1,3}"
+                            r"|\(\d{3}\)[-.\s]?\d{3}[-.\s]?\d{4}"
+                            r"|\d{3}([-.\s])\d{3}\1\d{4}"
+                            r"|\d{3}[-.]\d{4})\b")),
+    # Bare 7-10 digit runs are as likely to be invoice numbers, order IDs or dates;
+    # scored below the early-exit threshold so they go to the validation service
+    ('PHONE', 1, re.compile(r"(?<!\w)(?:\d{3,4}[-.\s]?\d{4}|\d{10})\b")),
+]
+
+
+def luhn_valid(number: str) -> bool:
+    """Luhn checksum, used to drop random digit runs that aren't card numbers"""
+    digits = [int(c) for c in number if c.isdigit()]
+    if len(digits) < 13:
+        return False
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        if i % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return total % 10 == 0
+
+
+def detect_local_pii(text: str, min_sensitivity: int = 0) -> List[Dict]:
+    """
+    Detect obvious PII with regular expressions, no model or network call.
+
+    Returns entity dicts shaped like the validation service's entities
+    (text, label, start, end, confidence, sensitivity_level). Spans already
+    claimed by an earlier, more specific pattern are not reported twice.
+    """
+    entities = []
+    claimed = []
+    for label, sensitivity, pattern in LOCAL_PII_PATTERNS:
+        if sensitivity < min_sensitivity:
+            continue
+        for match in pattern.finditer(text):
+            start, end = match.span()
+            if any(start < c_end and c_start < end for c_start, c_end in claimed):
+                continue
+            if label == 'CREDITCARD' and not luhn_valid(match.group(0)):
+                continue
+            claimed.append((start, end))
+            entities.append({
+                'text': match.group(0),
+                'label': label,
+                'start': start,
+                'end': end,
+                'confidence': 1.0,
+                'sensitivity_level': sensitivity,
+            })
+    entities.sort(key=lambda e: e['start'])
+    return entities
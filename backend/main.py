@@ -1,21 +1,64 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 import uvicorn
+import asyncio
 import uuid
 import time
 import requests
 import re
 import base64
-import io
-from PIL import Image
+import os
 
-# Import your OCR pipeline function
-from ocr_pipeline import run_ocr_pipeline  # Assuming the previous code is in ocr_pipeline.py
+from batch_scheduler import MicroBatchScheduler
+from image_cache import ImageResultCache
+from metrics import CONTENT_TYPE, REGISTRY, install_http_metrics, pii_entities_total, stage_seconds
+from ocr_workers import OcrJobTimeout, OcrPoolBusy, OcrWorkerPool
+from text_validation import SensitivityShortCircuit, validate_text_with_service, validation_headers
 
 app = FastAPI()
 
+# With OCR_WORKERS > 0, OCR runs in a pool of worker processes that each load their
+# own models; otherwise it runs in this process and the models are loaded here.
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', '0'))
+if OCR_WORKERS > 0:
+    ocr_pool = OcrWorkerPool(
+        num_workers=OCR_WORKERS,
+        max_queued_jobs=int(os.getenv('OCR_MAX_QUEUED_JOBS', '32')),
+        job_timeout=float(os.getenv('OCR_JOB_TIMEOUT', '60')),
+    )
+    yolo_scheduler = None
+else:
+    # Import your OCR pipeline function
+    from ocr_pipeline import load_models, run_ocr_pipeline, run_yolo  # Assuming the previous code is in ocr_pipeline.py
+    ocr_pool = None
+    # Merges concurrent /ocr/analyze requests into shared YOLO forward passes
+    yolo_scheduler = MicroBatchScheduler(run_yolo, max_batch_size=8, max_latency_ms=20.0)
+
+# Forwarded copies of the same image reuse the first analysis instead of re-running OCR
+image_cache = ImageResultCache(
+    max_entries=int(os.getenv('IMAGE_CACHE_ENTRIES', '1024')),
+    disk_dir=os.getenv('IMAGE_CACHE_DIR') or None,
+    disk_max_entries=int(os.getenv('IMAGE_CACHE_DISK_ENTRIES', '16384')),
+    use_phash=os.getenv('IMAGE_CACHE_PHASH', '0') == '1',
+)
+
+# Scrape-time gauges for queues and caches owned by the objects above
+if ocr_pool is not None:
+    REGISTRY.gauge('ocr_pool_pending_jobs', 'OCR jobs queued or running in the worker pool',
+                   callback=lambda: ocr_pool.stats()['pending_jobs'])
+    REGISTRY.gauge('ocr_pool_ready_workers', 'OCR worker processes with models loaded',
+                   callback=lambda: ocr_pool.ready_workers)
+else:
+    REGISTRY.gauge('yolo_scheduler_queue_depth', 'Frames waiting for a batched YOLO pass',
+                   callback=lambda: yolo_scheduler.queue_depth)
+REGISTRY.gauge('image_cache_entries', 'Entries in the image result cache', callback=lambda: image_cache.stats()['entries'])
+REGISTRY.gauge('image_cache_hits', 'Image result cache hits since startup', callback=lambda: image_cache.hits)
+REGISTRY.gauge('image_cache_misses', 'Image result cache misses since startup', callback=lambda: image_cache.misses)
+
+install_http_metrics(app, 'api')
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -40,45 +83,84 @@ class MessageCreate(BaseModel):
 
 class ImageUrlModel(BaseModel):
     imageUrl: str
+    earlyExit: bool = False  # stop at the first region with a sensitive entity
+
+class ImageUrlBatchModel(BaseModel):
+    imageUrls: List[str] = Field(..., min_length=1, max_length=32)
 
 
 # --- In-memory Storage ---
 users: Dict[str, dict] = {}
 chats: Dict[str, dict] = {}
 messages: Dict[str, List[dict]] = {}
+# msg_id -> (chat_id, message), so decrypting a message doesn't scan its chat
+message_index: Dict[str, Tuple[str, dict]] = {}
+# msg_id -> placeholder table built at send time (see build_placeholder_table)
+placeholder_tables: Dict[str, dict] = {}
 
 # --- Helper Functions ---
-def download_and_encode_image(image_url: str) -> str:
-    """Download image from URL and return base64 encoded data"""
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', str(20 * 1024 * 1024)))
+
+def download_image(image_url: str, max_bytes: int = MAX_IMAGE_BYTES) -> bytes:
+    """Stream an image from URL into a single buffer, refusing anything over max_bytes"""
     try:
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        return base64.b64encode(response.content).decode('utf-8')
+        with requests.get(image_url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            declared = response.headers.get('Content-Length')
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+
+            buffer = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                buffer += chunk
+                if len(buffer) > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+            return bytes(buffer)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to download image: {str(e)}")
 
-def validate_text_with_service(text: str, validation_endpoint: str = "127.0.0.1:8003") -> Dict:
-    """Validate text using the validation service"""
-    try:
-        headers = {"Content-Type": "application/json"}
-        response = requests.get(f"http://{validation_endpoint}/validate_text_msg?text={text}", headers=headers)
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            print(f"Validation service failed with status code: {response.status_code}")
-            return {
-                'original_text': text,
-                'encrypted_text': text,
-                'entities': []
-            }
-    except requests.exceptions.RequestException as e:
-        print(f"Error connecting to validation service: {e}")
-        return {
-            'original_text': text,
-            'encrypted_text': text,
-            'entities': []
-        }
+def download_and_encode_image(image_url: str) -> str:
+    """Download image from URL and return base64 encoded data"""
+    return base64.b64encode(download_image(image_url)).decode('utf-8')
+
+ENCRYPTED_RE = re.compile(r"\[ENCRYPTED_([^\]]+)\]")
+
+def build_placeholder_table(encrypted_text: str, entities: List[dict]) -> dict:
+    """
+    Locate every [ENCRYPTED_<id>] token in a message once, at send time
+
+    spans holds (start, end, token, original) in text order and index maps a
+    token to its position in spans, so revealing one placeholder is a dict
+    lookup. Tokens whose id the text service didn't issue (a user typing
+    something that looks like a placeholder) are left alone.
+    """
+    originals = {e['encryption_id']: e['text'] for e in entities if e.get('encryption_id')}
+    spans, index = [], {}
+    for match in ENCRYPTED_RE.finditer(encrypted_text):
+        original = originals.get(match.group(1))
+        if original is None or match.group(0) in index:
+            continue
+        index[match.group(0)] = len(spans)
+        spans.append((match.start(), match.end(), match.group(0), original))
+    return {'encrypted_text': encrypted_text, 'spans': spans, 'index': index, 'revealed': set()}
+
+def render_placeholders(table: dict) -> str:
+    """The encrypted text with the revealed placeholders swapped for their originals"""
+    text = table['encrypted_text']
+    parts, cursor = [], 0
+    for i in sorted(table['revealed']):
+        start, end, _, original = table['spans'][i]
+        parts.append(text[cursor:start])
+        parts.append(original)
+        cursor = end
+    parts.append(text[cursor:])
+    return ''.join(parts)
+
+def store_message(chat_id: str, message: dict):
+    messages.setdefault(chat_id, []).append(message)
+    message_index[message['id']] = (chat_id, message)
 
 def process_ocr_results_with_validation(ocr_results: List[Dict], image_dims: tuple) -> Dict:
     """
@@ -109,7 +191,12 @@ def process_ocr_results_with_validation(ocr_results: List[Dict], image_dims: tup
 
     any_sensitive = any(([result.get("sensitivity_level", 0) > 1 for result in validation_result.get('entities', [])]))
     if not any_sensitive:
-
+        if validation_result.get('validation_error'):
+            # Not a real verdict; flagged so it is not cached (see is_cacheable)
+            return {
+                'is_sensitive': False,
+                'validation_error': True
+            }
         return {
             'is_sensitive': False
         }
@@ -168,8 +255,72 @@ def process_ocr_results_with_validation(ocr_results: List[Dict], image_dims: tup
     #     'sensitive_detections': sensitive_detections
     # }
 
+def run_image_ocr(image_content: bytes, early_exit: bool = False) -> Dict:
+    """Run the OCR pipeline in-process; early-exit results carry the short circuit's verdict like the workers' do"""
+    if early_exit:
+        short_circuit = SensitivityShortCircuit()
+        ocr_result = run_ocr_pipeline(image_content, detector=yolo_scheduler.infer,
+                                      stop_when=short_circuit, order='confidence')
+        ocr_result['sensitive_entity'] = short_circuit.finish() if ocr_result['success'] else None
+        ocr_result['detected_by'] = short_circuit.detected_by
+        ocr_result['validation_errors'] = short_circuit.validation_errors
+        return ocr_result
+    # Decoded once inside the pipeline; dimensions come back with the results
+    return run_ocr_pipeline(image_content, detector=yolo_scheduler.infer)
+
+def analyze_ocr_result(ocr_result: Dict, early_exit: bool = False) -> Dict:
+    """Sensitivity analysis of one image's OCR output"""
+    if not ocr_result['success']:
+        raise HTTPException(status_code=500, detail=ocr_result.get('error', 'OCR processing failed'))
+    if early_exit:
+        sensitive_entity = ocr_result.get('sensitive_entity')
+        analysis = {
+            'is_sensitive': sensitive_entity is not None,
+            'early_exit': ocr_result['stopped_early'],
+            'regions_read': ocr_result['regions_read'],
+            'detected_by': ocr_result.get('detected_by'),
+        }
+        if sensitive_entity is None and ocr_result.get('validation_errors'):
+            analysis['validation_error'] = True
+    else:
+        analysis = process_ocr_results_with_validation(ocr_result['results'], ocr_result['image_size'])
+    return {'analysis': analysis, 'ocr_results': ocr_result['results']}
+
+async def run_image_analysis(image_content: bytes, early_exit: bool = False) -> Dict:
+    """
+    Run OCR and the sensitivity analysis for one image without holding a threadpool
+    thread while a pool worker runs the job
+    """
+    with stage_seconds.time(service='api', stage='ocr'):
+        if ocr_pool is not None:
+            # The collector enforces job_timeout once the job starts; this also bounds queue wait
+            ocr_result = await asyncio.wait_for(asyncio.wrap_future(ocr_pool.submit(image_content, early_exit=early_exit)),
+                                                timeout=ocr_pool.job_timeout * 2)
+        else:
+            ocr_result = await run_in_threadpool(run_image_ocr, image_content, early_exit)
+    return await run_in_threadpool(analyze_ocr_result, ocr_result, early_exit)
+
+def is_cacheable(result: Dict) -> bool:
+    """A negative verdict from a failed validation call is not cached, so the next request retries"""
+    return not result['analysis'].get('validation_error')
+
 # --- API Endpoints ---
 
+@app.on_event('startup')
+def start_ocr_backends():
+    if ocr_pool is not None:
+        ocr_pool.start()
+    else:
+        load_models()
+        yolo_scheduler.start()
+
+@app.on_event('shutdown')
+def stop_ocr_backends():
+    if ocr_pool is not None:
+        ocr_pool.stop()
+    else:
+        yolo_scheduler.stop()
+
 @app.get('/health')
 def health_check():
     return {'status': 'healthy', 'timestamp': time.time() * 1000}
@@ -247,7 +398,7 @@ def send_message(chat_id: str, msg_data: MessageCreate):
             'timestamp': time.time() * 1000,
             'imageUrl': image_url,
         }
-        messages.setdefault(chat_id, []).append(message)
+        store_message(chat_id, message)
         return {'message': message}
 
     if not sender:
@@ -261,9 +412,14 @@ def send_message(chat_id: str, msg_data: MessageCreate):
 
     # Validate message content
     endpoint = "127.0.0.1:8003"
-    headers = {"Content-Type": "application/json"}
-    response = requests.get(f"http://{endpoint}/validate_text_msg?text={content}", headers=headers)
-
+    # Ciphertexts are issued to the chat, so only its participants can have them decrypted
+    headers = validation_headers(owner=chat_id)
+    with stage_seconds.time(service='api', stage='validation_call'):
+        response = requests.get(f"http://{endpoint}/validate_text_msg?text={content}", headers=headers)
+
+    if response.status_code >= 500:
+        # Detection failed or was cut short; don't store a message that may still hold plaintext PII
+        raise HTTPException(status_code=502, detail='PII detection failed, message not sent')
     if response.status_code != 200:
         raise HTTPException(status_code=400, detail='Invalid message content')
 
@@ -273,9 +429,12 @@ def send_message(chat_id: str, msg_data: MessageCreate):
     entity_list = json_response.get('entities', [])
     encrypted_words_list = []
     for dict in entity_list:
+        pii_entities_total.inc(service='api', label=dict.get("label", "MISC"))
         if dict["sensitivity_level"] >=2:
+            # Overlapping spans come back as one entity per cluster, so every sensitive entity has a placeholder
+            if not dict.get("encryption_id"):
+                raise HTTPException(status_code=502, detail='Validation service returned a sensitive entity without an encryption_id')
             encrypted_words_list.append(dict["text"])
-    print("Encrypted_words", encrypted_words_list)
 
     message = {
         'id': str(uuid.uuid4()),
@@ -288,9 +447,9 @@ def send_message(chat_id: str, msg_data: MessageCreate):
         'original_text': json_response['original_text'],  # in case uw just show everything
         'encrypted_text': json_response['encrypted_text'] # in case uw want to show everything encrypted
     }
-    messages.setdefault(chat_id, []).append(message)
+    placeholder_tables[message['id']] = build_placeholder_table(json_response['encrypted_text'], entity_list)
+    store_message(chat_id, message)
 
-    print(messages)
     return {'message': message}
 
 # @app.post('/chats/{chat_id}/messages', status_code=201)
@@ -334,32 +493,30 @@ def send_message(chat_id: str, msg_data: MessageCreate):
 #     messages.setdefault(chat_id, []).append(message)
 #     return {'message': message}
 
-# ENCRYPTED_RE = re.compile(r"\[ENCRYPTED_[^\]]+\]")
 @app.post('/chats/{chat_id}/messages/decrypt/{msg_id}')
-# def decrypt_messages(chat_id: str, msg_id: str, enc_msg: str):
-def decrypt_messages(chat_id: str, msg_id: str):
+def decrypt_messages(chat_id: str, msg_id: str, placeholder: Optional[str] = None):
+    """Reveal one [ENCRYPTED_*] placeholder, or the whole message when none is given"""
     if chat_id not in chats:
         raise HTTPException(status_code=404, detail='Chat not found')
-    chat_messages = messages.get(chat_id, [])
-    message = next((msg for msg in chat_messages if msg['id'] == msg_id), None)
-    if not message:
+    indexed = message_index.get(msg_id)
+    if not indexed or indexed[0] != chat_id:
         raise HTTPException(status_code=404, detail='Message not found')
-    
-    # content = message['content']
-    # encrypted_words = message['encrypted_words']
-    # encrypted_text = message['encrypted_text']
+    message = indexed[1]
+    table = placeholder_tables.get(msg_id)
 
-    # index_positions = [m.group(0) for m in ENCRYPTED_RE.finditer(encrypted_text)]
-    # idx = index_positions.index(enc_msg)
-    
-    # original_word = encrypted_words[idx] if idx < len(encrypted_words) else None
-    
-    # content = content.replace(enc_msg, original_word)
-    
-    # message['content'] = content
-    message['content'] = message['original_text']
-    
-    return {'message': message}
+    if placeholder is None:
+        if table is not None:
+            table['revealed'].update(range(len(table['spans'])))
+        message['content'] = message.get('original_text', message.get('content'))
+        return {'message': message}
+
+    position = table['index'].get(placeholder) if table is not None else None
+    if position is None:
+        raise HTTPException(status_code=404, detail='Placeholder not found')
+    table['revealed'].add(position)
+    message['content'] = render_placeholders(table)
+
+    return {'message': message, 'placeholder': placeholder, 'text': table['spans'][position][3]}
 
 @app.get('/chats/{chat_id}/messages/since/{timestamp}')
 def get_messages_since(chat_id: str, timestamp: float):
@@ -368,33 +525,72 @@ def get_messages_since(chat_id: str, timestamp: float):
     return {'messages': new_messages}
 
 @app.post('/ocr/analyze')
-def analyze_image_ocr(payload: ImageUrlModel):
+async def analyze_image_ocr(payload: ImageUrlModel):
     """Standalone endpoint for OCR analysis that returns relative bboxes."""
     image_url = payload.imageUrl
     if not image_url:
         raise HTTPException(status_code=400, detail="imageUrl is required")
         
     try:
-        response = requests.get(image_url, timeout=10)
-        response.raise_for_status()
-        image_content = response.content
-        
-        image = Image.open(io.BytesIO(image_content))
-        image_dims = image.size # Get (width, height)
-        
-        image_base64 = base64.b64encode(image_content).decode('utf-8')
-        
-        ocr_result = run_ocr_pipeline(image_base64)
-        
-        if ocr_result['success']:
-            analysis = process_ocr_results_with_validation(ocr_result['results'], image_dims)
-            return {'success': True, 'analysis': analysis}
-        else:
-            raise HTTPException(status_code=500, detail=ocr_result.get('error', 'OCR processing failed'))
+        with stage_seconds.time(service='api', stage='image_download'):
+            image_content = await run_in_threadpool(download_image, image_url)
+
+        def compute():
+            return run_image_analysis(image_content, payload.earlyExit)
+
+        cache_key = image_cache.make_key(image_content, variant='early-exit' if payload.earlyExit else '')
+        cached, was_cached = await image_cache.get_or_compute_async(cache_key, compute, should_cache=is_cacheable)
+        return {'success': True, 'analysis': cached['analysis'], 'cached': was_cached}
             
+    except HTTPException:
+        raise
+    except OcrPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except (OcrJobTimeout, TimeoutError, asyncio.TimeoutError):
+        raise HTTPException(status_code=504, detail='OCR processing timed out')
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def analyze_batch_item(image_url: str) -> Dict:
+    """One image of a batch request; failures are reported for that image instead of failing the batch"""
+    try:
+        with stage_seconds.time(service='api', stage='image_download'):
+            image_content = await run_in_threadpool(download_image, image_url)
+        cached, was_cached = await image_cache.get_or_compute_async(
+            image_cache.make_key(image_content), lambda: run_image_analysis(image_content), should_cache=is_cacheable)
+        return {'imageUrl': image_url, 'success': True, 'analysis': cached['analysis'], 'cached': was_cached}
+    except HTTPException as e:
+        error = e.detail
+    except (OcrJobTimeout, TimeoutError, asyncio.TimeoutError):
+        error = 'OCR processing timed out'
+    except Exception as e:
+        error = str(e)
+    return {'imageUrl': image_url, 'success': False, 'error': error}
+
+@app.post('/ocr/analyze/batch')
+async def analyze_images_ocr_batch(payload: ImageUrlBatchModel):
+    """
+    Batch OCR analysis: every image goes the same way as /ocr/analyze, concurrently.
+    In-process, the scheduler merges their YOLO frames into shared passes; with
+    OCR_WORKERS they fan out across the worker pool.
+    """
+    results = await asyncio.gather(*(analyze_batch_item(image_url) for image_url in payload.imageUrls))
+    return {'success': True, 'results': list(results)}
+
+@app.get('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get('/ocr/cache/stats')
+def image_cache_stats():
+    return {'cache': image_cache.stats()}
+
+@app.get('/ocr/pool/stats')
+def ocr_pool_stats():
+    if ocr_pool is None:
+        return {'pool': None, 'scheduler': yolo_scheduler.stats()}
+    return {'pool': ocr_pool.stats()}
+
 # Admin endpoints
 @app.get('/admin/users')
 def list_all_users(): return {'users': list(users.values())}
@@ -0,0 +1,87 @@
+"""
+Bounded store for the text service's encryption_id -> mapping table.
+
+Every protected entity keeps its ciphertext (about 17 KB for a BFV/CKKS value)
+in entity_mappings so /decrypt can find it later. Left unbounded, that table
+grows with every message the service ever sees. MappingStore keeps the most
+recently used max_entries mappings and, optionally, drops them max_age seconds
+after they were stored (PII_MAX_MAPPINGS / PII_MAPPING_TTL in the environment).
+An evicted id decrypts as missing.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+
+class MappingStore:
+    """dict-like LRU (with optional TTL) of encryption_id -> mapping"""
+
+    def __init__(self, max_entries: int = 10000, max_age: Optional[float] = None,
+                 initial: Optional[Dict[str, Any]] = None):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        for key, value in (initial or {}).items():
+            self[key] = value
+
+    @classmethod
+    def from_env(cls) -> 'MappingStore':
+        max_age = os.getenv("PII_MAPPING_TTL", "")
+        return cls(int(os.getenv("PII_MAX_MAPPINGS", "10000")), float(max_age) if max_age else None)
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.max_age is not None and now - stored_at > self.max_age
+
+    def __setitem__(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            if self._expired(entry[1], time.monotonic()):
+                del self._entries[key]
+                self.evictions += 1
+                return default
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def __getitem__(self, key: str) -> Any:
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        missing = object()
+        return self.get(key, missing) is not missing
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._entries))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Live mappings, oldest first (what save_he_context persists)"""
+        now = time.monotonic()
+        with self._lock:
+            return {key: value for key, (value, stored_at) in self._entries.items()
+                    if not self._expired(stored_at, now)}
@@ -3,20 +3,71 @@ import numpy as np
 import base64
 import math
 import requests
+import threading
+from dataclasses import dataclass
+from functools import cached_property
 from scipy.ndimage import interpolation as inter
-from typing import List, Dict, Tuple, Optional
-from ultralytics import YOLO
-from paddleocr import PaddleOCR
+from typing import Callable, Iterator, List, Dict, Tuple, Optional, Union
 
-# Initialize models (do this once at startup)
+# Models are loaded once per process by load_models (the API at startup, each OCR
+# worker before it reports ready), so the image and geometry helpers import without them
 imgsz = 640
-model = YOLO('./best.pt')
-ocr = PaddleOCR(
-    ocr_version='PP-OCRv5',
-    use_doc_orientation_classify=True, 
-    use_doc_unwarping=False, 
-    use_textline_orientation=True
-)
+model = None
+ocr = None
+models_lock = threading.Lock()
+# Ultralytics models are not thread-safe; every forward pass goes through run_yolo under this lock
+yolo_lock = threading.Lock()
+
+def load_models():
+    """Load YOLO and PaddleOCR into this process; a no-op once they are loaded"""
+    global model, ocr
+    with models_lock:
+        if model is not None:
+            return
+        from ultralytics import YOLO
+        from paddleocr import PaddleOCR
+
+        ocr = PaddleOCR(
+            ocr_version='PP-OCRv5',
+            use_doc_orientation_classify=True, 
+            use_doc_unwarping=False, 
+            use_textline_orientation=True
+        )
+        model = YOLO('./best.pt')
+
+@dataclass
+class RoiResolutionPolicy:
+    """Resolution detected regions are brought to before skew correction and OCR"""
+    target_long_side: Optional[int] = 1024  # ~ an ID-1 card's width scanned at 300 DPI
+    allow_upscale: bool = False
+    interpolation: int = cv2.INTER_AREA
+
+    def scale_for(self, height: int, width: int) -> float:
+        """Scale factor that brings an ROI of this size to the target resolution"""
+        if not self.target_long_side:
+            return 1.0
+        scale = self.target_long_side / max(height, width)
+        if scale > 1.0 and not self.allow_upscale:
+            return 1.0
+        return scale
+
+    def apply(self, roi: np.ndarray) -> Tuple[np.ndarray, float]:
+        """Resize an ROI according to the policy, returning it with the scale used"""
+        h, w = roi.shape[:2]
+        scale = self.scale_for(h, w)
+        if scale == 1.0:
+            return roi, 1.0
+        interpolation = self.interpolation if scale < 1.0 else cv2.INTER_CUBIC
+        resized = cv2.resize(roi, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=interpolation)
+        return resized, scale
+
+default_roi_policy = RoiResolutionPolicy()
+
+def rotation_matrix(shape, angle):
+    """Rotation about the image centre, as used by correct_skew"""
+    (h, w) = shape[:2]
+    center = (w // 2, h // 2)
+    return cv2.getRotationMatrix2D(center, angle, 1.0)
 
 def correct_skew(image, delta=1, limit=5):
     """Correct image skew using projection profile method"""
@@ -35,8 +86,7 @@ def correct_skew(image, delta=1, limit=5):
         scores.append(score)
     best_angle = angles[scores.index(max(scores))]
     (h, w) = image.shape[:2]
-    center = (w // 2, h // 2)
-    M = cv2.getRotationMatrix2D(center, best_angle, 1.0)
+    M = rotation_matrix(image.shape, best_angle)
     corrected = cv2.warpAffine(image, M, (w, h), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
     return best_angle, corrected
 
@@ -47,76 +97,138 @@ def calculate_aspect_ratio(width, height):
     simplified_height = int(height) // gcd
     return f"{simplified_width}:{simplified_height}", simplified_width / simplified_height
 
+class MaskGeometry:
+    """
+    Contour-derived geometry of a binary mask, computed lazily and at most once
+
+    The shape helpers below accept either a raw mask or a MaskGeometry; passing
+    the same MaskGeometry to all of them shares one findContours call, one
+    approxPolyDP and one bounding-box pass per detection.
+    """
+
+    def __init__(self, mask):
+        self.mask = mask
+
+    @cached_property
+    def mask_u8(self):
+        return self.mask.astype(np.uint8)
+
+    @cached_property
+    def contour(self):
+        """Largest external contour, or None for an empty mask"""
+        contours, _ = cv2.findContours(self.mask_u8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+        return max(contours, key=cv2.contourArea)
+
+    @cached_property
+    def perimeter(self):
+        return cv2.arcLength(self.contour, True) if self.contour is not None else 0.0
+
+    @cached_property
+    def approx(self):
+        """Polygon approximation of the contour (2% of the perimeter tolerance)"""
+        if self.contour is None:
+            return None
+        return cv2.approxPolyDP(self.contour, 0.02 * self.perimeter, True)
+
+    @cached_property
+    def contour_area(self):
+        return cv2.contourArea(self.contour) if self.contour is not None else 0.0
+
+    @cached_property
+    def hull(self):
+        return cv2.convexHull(self.contour) if self.contour is not None else None
+
+    @cached_property
+    def hull_area(self):
+        return cv2.contourArea(self.hull) if self.hull is not None else 0.0
+
+    @cached_property
+    def solidity(self):
+        return self.contour_area / self.hull_area if self.hull_area > 0 else 0.0
+
+    @cached_property
+    def pixel_area(self):
+        """Number of mask pixels"""
+        return cv2.countNonZero(self.mask_u8)
+
+    @cached_property
+    def bbox(self):
+        """(min_x, min_y, max_x, max_y) of the mask pixels, inclusive, or None if empty"""
+        if self.pixel_area == 0:
+            return None
+        x, y, w, h = cv2.boundingRect(self.mask_u8)
+        return x, y, x + w - 1, y + h - 1
+
+    @property
+    def width(self):
+        return self.bbox[2] - self.bbox[0] + 1 if self.bbox else 0
+
+    @property
+    def height(self):
+        return self.bbox[3] - self.bbox[1] + 1 if self.bbox else 0
+
+    @property
+    def is_four_sided(self):
+        return self.approx is not None and len(self.approx) == 4
+
+def as_mask_geometry(mask):
+    """Wrap a raw mask in MaskGeometry unless it already is one"""
+    return mask if isinstance(mask, MaskGeometry) else MaskGeometry(mask)
+
 def find_mask_corners(mask):
     """Find corners of detected mask"""
-    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if contours:
-        largest_contour = max(contours, key=cv2.contourArea)
-        epsilon = 0.02 * cv2.arcLength(largest_contour, True)
-        approx = cv2.approxPolyDP(largest_contour, epsilon, True)
-        if len(approx) == 4:
-            return approx.reshape(4, 2).astype(np.float32)
+    geometry = as_mask_geometry(mask)
+    if geometry.contour is not None:
+        if geometry.is_four_sided:
+            return geometry.approx.reshape(4, 2).astype(np.float32)
         else:
-            rect = cv2.minAreaRect(largest_contour)
+            rect = cv2.minAreaRect(geometry.contour)
             box = cv2.boxPoints(rect)
             return box.astype(np.float32)
     return None
 
 def evaluate_mask_shape(mask):
     """Evaluate mask shape quality"""
-    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not contours:
+    geometry = as_mask_geometry(mask)
+    if geometry.contour is None:
         return 0
-    largest_contour = max(contours, key=cv2.contourArea)
-    epsilon = 0.02 * cv2.arcLength(largest_contour, True)
-    approx = cv2.approxPolyDP(largest_contour, epsilon, True)
     shape_score = 0
-    if len(approx) == 4:
+    if geometry.is_four_sided:
         shape_score += 10
-    area = cv2.contourArea(largest_contour)
-    hull = cv2.convexHull(largest_contour)
-    hull_area = cv2.contourArea(hull)
-    if hull_area > 0:
-        solidity = area / hull_area
-        shape_score += solidity * 5
-    perimeter = cv2.arcLength(largest_contour, True)
+    if geometry.hull_area > 0:
+        shape_score += geometry.solidity * 5
+    perimeter = geometry.perimeter
     if perimeter > 0:
-        circularity = 4 * np.pi * area / (perimeter * perimeter)
+        circularity = 4 * np.pi * geometry.contour_area / (perimeter * perimeter)
         rectangularity = 1 - circularity
         shape_score += rectangularity * 3
     return shape_score
 
 def calculate_mask_area(mask):
     """Calculate mask area"""
-    return np.sum(mask)
+    return as_mask_geometry(mask).pixel_area
 
 def is_four_sided_shape(mask):
     """Check if mask represents a four-sided shape"""
-    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not contours:
-        return False
-    largest_contour = max(contours, key=cv2.contourArea)
-    epsilon = 0.02 * cv2.arcLength(largest_contour, True)
-    approx = cv2.approxPolyDP(largest_contour, epsilon, True)
-    return len(approx) == 4
+    return as_mask_geometry(mask).is_four_sided
 
 def check_minimum_width(mask, min_width=20):
     """Check if mask meets minimum width requirement"""
-    mask_coords = np.where(mask)
-    if len(mask_coords[0]) > 0:
-        min_x, max_x = np.min(mask_coords[1]), np.max(mask_coords[1])
-        width = max_x - min_x + 1
-        return width >= min_width
+    geometry = as_mask_geometry(mask)
+    if geometry.bbox is not None:
+        return geometry.width >= min_width
     return False
 
 def meets_mandatory_requirements(mask, max_aspect_distance=0.5):
     """Check if mask meets mandatory requirements"""
-    if not is_four_sided_shape(mask):
+    geometry = as_mask_geometry(mask)
+    if not is_four_sided_shape(geometry):
         return False, "Not 4-sided"
-    if not check_minimum_width(mask):
+    if not check_minimum_width(geometry):
         return False, "Width < 20px"
-    mask_coords = np.where(mask)
-    if len(mask_coords[0]) == 0:
+    if geometry.pixel_area == 0:
         return False, "Empty mask"
     return True, "Valid"
 
@@ -183,17 +295,65 @@ def extract_bounding_boxes(ocr_results: List[dict]) -> List[dict]:
     
     return all_boxes
 
-def run_ocr_pipeline(image_data: str) -> Dict:
+def transform_points(points: np.ndarray, transform: np.ndarray) -> np.ndarray:
+    """Apply a 2x3 affine or 3x3 perspective transform to an (N, 2) array of points"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if transform.shape == (3, 3):
+        return cv2.perspectiveTransform(points.reshape(-1, 1, 2), transform).reshape(-1, 2)
+    return points @ transform[:, :2].T + transform[:, 2]
+
+def map_boxes_to_original(boxes: List[dict], transform: np.ndarray) -> List[dict]:
+    """Map OCR boxes from working-image coordinates into the original image (2x3 affine or 3x3 homography)"""
+    for box in boxes:
+        x1, y1, x2, y2 = [float(v) for v in box['bbox'][:4]]
+        corners = transform_points([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], transform)
+        box['bbox'] = [float(corners[:, 0].min()), float(corners[:, 1].min()),
+                       float(corners[:, 0].max()), float(corners[:, 1].max())]
+        if 'polygon' in box:
+            box['polygon'] = transform_points(box['polygon'], transform).tolist()
+    return boxes
+
+def rectify_card(img: np.ndarray, corners: np.ndarray, roi_policy: RoiResolutionPolicy) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Complete OCR pipeline function
+    Warp the quadrilateral given by corners (original image coordinates) to an upright
+    rectangle in one warpPerspective
     
-    Args:
-        image_data: Base64 encoded image data or image path
-        
-    Returns:
-        Dictionary with success status and OCR results
+    The output keeps the quad's own edge lengths, scaled by roi_policy. Returns the
+    rectified image and the 3x3 homography mapping it back to original coordinates.
     """
-    try:
+    src = order_points(corners.astype(np.float32))
+    top_left, top_right, bottom_right, bottom_left = src
+    width = max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left))
+    height = max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right))
+    scale = roi_policy.scale_for(height, width)
+    out_w, out_h = max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+    dst = np.array([[0, 0], [out_w - 1, 0], [out_w - 1, out_h - 1], [0, out_h - 1]], dtype=np.float32)
+    M = cv2.getPerspectiveTransform(src, dst)
+    interpolation = roi_policy.interpolation if scale < 1.0 else cv2.INTER_CUBIC
+    rectified = cv2.warpPerspective(img, M, (out_w, out_h), flags=interpolation, borderMode=cv2.BORDER_REPLICATE)
+    return rectified, np.linalg.inv(M)
+
+def run_yolo(frames: List[np.ndarray]) -> List:
+    """Run YOLO segmentation on a batch of frames already resized to imgsz"""
+    load_models()
+    with yolo_lock:
+        return model(list(frames), verbose=False, conf=0.4, device='cuda')
+
+ImageInput = Union[str, bytes, bytearray, memoryview, np.ndarray]
+
+def decode_image(image_data: ImageInput) -> np.ndarray:
+    """
+    Decode an image into a BGR array
+    
+    Accepts raw encoded bytes (decoded directly, no base64 round-trip), an already
+    decoded BGR ndarray (returned as-is), or a string holding base64 data, a data
+    URL or a file path.
+    """
+    if isinstance(image_data, np.ndarray):
+        return image_data
+
+    if isinstance(image_data, str):
         # Handle both base64 data and file paths
         if image_data.startswith('data:image'):
             # Remove data URL prefix if present
@@ -201,92 +361,206 @@ def run_ocr_pipeline(image_data: str) -> Dict:
         
         if len(image_data) < 100:  # Likely a file path
             with open(image_data, 'rb') as f:
-                img_data = base64.b64encode(f.read()).decode('utf-8')
+                image_data = f.read()
         else:
-            img_data = image_data
+            image_data = base64.b64decode(image_data)
+        
+    # Decode image
+    nparr = np.frombuffer(image_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image data")
+    return img
+
+DETECTION_ORDERS = (None, 'confidence', 'area')
+
+def iter_detection_results(img: np.ndarray, result, roi_policy: Optional[RoiResolutionPolicy] = None,
+                           order: Optional[str] = None) -> Iterator[List[Dict]]:
+    """
+    Crop, deskew and OCR the regions YOLO detected in a single image, one at a time
+    
+    Yields the OCR boxes of each region that produced text, so callers can stop
+    early. order='confidence' or 'area' visits the most promising regions first;
+    None keeps YOLO's order. Regions with a valid four-sided mask are rectified
+    with one perspective warp; others fall back to a bounding-box crop plus skew
+    search. Either way the working image is bounded by roi_policy and boxes are
+    mapped back to original image coordinates.
+    """
+    if order not in DETECTION_ORDERS:
+        raise ValueError(f"Unknown detection order: {order}")
+    load_models()
+    roi_policy = roi_policy or default_roi_policy
+    h, w = img.shape[:2]
+    
+    if result.masks is not None:
+        # Process detections
+        boxes = [[x1, y1, x2, y2, score] for x1, y1, x2, y2, score, _ in result.boxes.data.tolist()]
+        mask_indices = np.argsort([mask[0][0] for mask in result.masks.data.tolist()])
+        box_indices = np.argsort([box[0] for box in boxes])
+        index_mapping = dict(zip(box_indices, range(len(boxes))))
+        tracked_masks = [result.masks.data.tolist()[mask_indices[index_mapping[i]]] 
+                        for i in range(len(boxes)) if i in index_mapping]
+
+        detections = list(zip(boxes, tracked_masks))
+        if order == 'confidence':
+            detections.sort(key=lambda d: d[0][4], reverse=True)
+        elif order == 'area':
+            detections.sort(key=lambda d: (d[0][2] - d[0][0]) * (d[0][3] - d[0][1]), reverse=True)
+
+        # Process each detected object
+        for mask_idx, (box, mask) in enumerate(detections):
+            xyxy = np.array(box[:4])
+            x1, y1, x2, y2 = map(int, xyxy)
+            scale_x, scale_y = w / imgsz, h / imgsz
+            x1, y1, x2, y2 = int(x1 * scale_x), int(y1 * scale_y), int(x2 * scale_x), int(y2 * scale_y)
+            
+            # Add padding
+            padding = 50
+            x1_pad = max(0, x1 - padding)
+            y1_pad = max(0, y1 - padding)
+            x2_pad = min(w, x2 + padding)
+            y2_pad = min(h, y2 + padding)
+            
+            # Crop region (a view into the decoded BGR image, no full-frame copy)
+            cropped_no_pad = img[y1:y2, x1:x2]
+            if cropped_no_pad.size == 0:
+                continue
+            
+            # Process mask
+            mask_data = np.array(mask[:-2])
+            enhanced_mask = mask_data > 0.5
+            geometry = MaskGeometry(enhanced_mask)
+            is_valid, reason = meets_mandatory_requirements(geometry)
             
-        # Decode image
-        nparr = np.frombuffer(base64.b64decode(img_data), np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        original_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        h, w = original_rgb.shape[:2]
+            # Determine working image
+            if is_valid:
+                aspect_str, aspect_float = calculate_aspect_ratio(geometry.width, geometry.height)
+                shape_score = evaluate_mask_shape(geometry)
+                area = calculate_mask_area(geometry)
+                valid_candidate = {'mask': enhanced_mask, 'image': img, 'name': 'full', 'shape_score': shape_score, 'area': area}
+            else:
+                valid_candidate = None
+            
+            if valid_candidate is not None:
+                # Four-sided mask: one perspective warp from the mask corners replaces the skew search
+                mask_scale = np.array([w / imgsz, h / imgsz], dtype=np.float32)
+                corners = find_mask_corners(geometry) * mask_scale
+                corrected_bgr, to_original = rectify_card(img, corners, roi_policy)
+            else:
+                # Fallback: bounding-box crop at bounded resolution plus brute-force skew search
+                working_image, roi_scale = roi_policy.apply(cropped_no_pad)
+                skew_angle, corrected_bgr = correct_skew(working_image)
+                # Undo rotation, then scaling, then the crop offset
+                inverse = cv2.invertAffineTransform(rotation_matrix(working_image.shape, skew_angle))
+                to_original = np.hstack([inverse[:, :2] / roi_scale, (inverse[:, 2:] / roi_scale) + [[x1], [y1]]])
+
+            final_gray = cv2.cvtColor(corrected_bgr, cv2.COLOR_BGR2GRAY)
+            _, thresholded = cv2.threshold(final_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            
+            # Run OCR
+            detection_boxes = []
+            try:
+                final_img = cv2.cvtColor(thresholded, cv2.COLOR_GRAY2RGB)
+                ocr_result = ocr.predict(final_img)
+                if ocr_result and ocr_result[0]:
+                    ocr_texts = ocr_result[0].get('rec_texts', [])
+                    confidences = ocr_result[0].get('rec_scores', [])
+                    
+                    if ocr_texts:
+                        detection_boxes = map_boxes_to_original(extract_bounding_boxes(ocr_result), to_original)
+            except Exception as e:
+                print(f"OCR Error: {str(e)}")
+                continue
+
+            if detection_boxes:
+                yield detection_boxes
+
+def process_detections(img: np.ndarray, result, roi_policy: Optional[RoiResolutionPolicy] = None) -> List[Dict]:
+    """Crop, deskew and OCR every region YOLO detected in a single image"""
+    ocr_results = []
+    for detection_boxes in iter_detection_results(img, result, roi_policy):
+        ocr_results.extend(detection_boxes)
+    return ocr_results
+
+def run_ocr_pipeline(image_data: ImageInput, detector: Optional[Callable[[np.ndarray], object]] = None,
+                     roi_policy: Optional[RoiResolutionPolicy] = None,
+                     stop_when: Optional[Callable[[List[Dict]], bool]] = None,
+                     order: Optional[str] = None) -> Dict:
+    """
+    Complete OCR pipeline function
+    
+    Args:
+        image_data: Raw image bytes, a decoded BGR ndarray, base64 data or an image path
+        detector: Optional callable taking one resized frame and returning its YOLO
+            result, e.g. a MicroBatchScheduler submit. Defaults to a direct model call.
+        roi_policy: Resolution policy for detected regions (default_roi_policy if None)
+        stop_when: Optional callback given each region's OCR boxes as soon as they are
+            read; returning True skips the remaining regions (early-exit mode)
+        order: Region visiting order, see iter_detection_results
+        
+    Returns:
+        Dictionary with success status, OCR results, the decoded (width, height),
+        whether the run stopped early and how many text regions were read
+    """
+    try:
+        img = decode_image(image_data)
         
         # Run YOLO segmentation
-        results = model(cv2.resize(img.copy(), (imgsz, imgsz)), verbose=False, conf=0.4, device='cuda')
-        ocr_results = []
+        frame = cv2.resize(img, (imgsz, imgsz))
+        result = detector(frame) if detector is not None else run_yolo([frame])[0]
         
-        if results[0].masks is not None:
-            # Process detections
-            boxes = [[x1, y1, x2, y2, score] for x1, y1, x2, y2, score, _ in results[0].boxes.data.tolist()]
-            mask_indices = np.argsort([mask[0][0] for mask in results[0].masks.data.tolist()])
-            box_indices = np.argsort([box[0] for box in boxes])
-            index_mapping = dict(zip(box_indices, range(len(boxes))))
-            tracked_masks = [results[0].masks.data.tolist()[mask_indices[index_mapping[i]]] 
-                            for i in range(len(boxes)) if i in index_mapping]
-
-            # Process each detected object
-            for mask_idx, (box, mask) in enumerate(zip(boxes, tracked_masks)):
-                xyxy = np.array(box[:4])
-                x1, y1, x2, y2 = map(int, xyxy)
-                scale_x, scale_y = w / imgsz, h / imgsz
-                x1, y1, x2, y2 = int(x1 * scale_x), int(y1 * scale_y), int(x2 * scale_x), int(y2 * scale_y)
-                
-                # Add padding
-                padding = 50
-                x1_pad = max(0, x1 - padding)
-                y1_pad = max(0, y1 - padding)
-                x2_pad = min(w, x2 + padding)
-                y2_pad = min(h, y2 + padding)
-                
-                # Crop region
-                cropped_no_pad = original_rgb[y1:y2, x1:x2]
-                if cropped_no_pad.size == 0:
-                    continue
-                
-                # Process mask
-                mask_data = np.array(mask[:-2])
-                enhanced_mask = mask_data > 0.5
-                is_valid, reason = meets_mandatory_requirements(enhanced_mask)
-                
-                # Determine working image
-                if is_valid:
-                    mask_coords = np.where(enhanced_mask)
-                    min_y, max_y = np.min(mask_coords[0]), np.max(mask_coords[0])
-                    min_x, max_x = np.min(mask_coords[1]), np.max(mask_coords[1])
-                    mask_width = max_x - min_x + 1
-                    mask_height = max_y - min_y + 1
-                    aspect_str, aspect_float = calculate_aspect_ratio(mask_width, mask_height)
-                    shape_score = evaluate_mask_shape(enhanced_mask)
-                    area = calculate_mask_area(enhanced_mask)
-                    valid_candidate = {'mask': enhanced_mask, 'image': original_rgb, 'name': 'full', 'shape_score': shape_score, 'area': area}
-                else:
-                    valid_candidate = None
-                
-                if valid_candidate is None:
-                    working_image = cv2.cvtColor(cropped_no_pad, cv2.COLOR_RGB2BGR)
-                else:
-                    working_image = cv2.cvtColor(cropped_no_pad, cv2.COLOR_RGB2BGR)
-
-                # Correct skew and preprocess
-                _, corrected_bgr = correct_skew(working_image)
-                final_gray = cv2.cvtColor(corrected_bgr, cv2.COLOR_BGR2GRAY)
-                _, thresholded = cv2.threshold(final_gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-                
-                # Run OCR
-                try:
-                    final_img = cv2.cvtColor(thresholded, cv2.COLOR_GRAY2RGB)
-                    result = ocr.predict(final_img)
-                    if result and result[0]:
-                        ocr_texts = result[0].get('rec_texts', [])
-                        confidences = result[0].get('rec_scores', [])
-                        
-                        if ocr_texts:
-                            ocr_results.extend(extract_bounding_boxes(result))
-                except Exception as e:
-                    print(f"OCR Error: {str(e)}")
-                    continue
+        ocr_results = []
+        regions_read = 0
+        stopped_early = False
+        for detection_boxes in iter_detection_results(img, result, roi_policy, order):
+            ocr_results.extend(detection_boxes)
+            regions_read += 1
+            if stop_when is not None and stop_when(detection_boxes):
+                stopped_early = True
+                break
         
-        return {'success': True, 'results': ocr_results}
+        h, w = img.shape[:2]
+        return {'success': True, 'results': ocr_results, 'image_size': (w, h),
+                'stopped_early': stopped_early, 'regions_read': regions_read}
         
     except Exception as e:
-        return {'success': False, 'error': str(e)}
\ No newline at end of file
+        return {'success': False, 'error': str(e)}
+
+def run_ocr_pipeline_batch(image_data_list: List[ImageInput], batch_size: int = 8,
+                           roi_policy: Optional[RoiResolutionPolicy] = None) -> List[Dict]:
+    """
+    Run the OCR pipeline over many images, sharing YOLO forward passes
+    
+    Args:
+        image_data_list: Images in any form run_ocr_pipeline accepts
+        batch_size: Maximum number of frames per YOLO call
+        roi_policy: Resolution policy for detected regions (default_roi_policy if None)
+        
+    Returns:
+        One result dictionary per input, in the same order, shaped like run_ocr_pipeline's
+    """
+    outputs: List[Optional[Dict]] = [None] * len(image_data_list)
+    decoded = []
+    for i, image_data in enumerate(image_data_list):
+        try:
+            decoded.append((i, decode_image(image_data)))
+        except Exception as e:
+            outputs[i] = {'success': False, 'error': str(e)}
+
+    for chunk_start in range(0, len(decoded), batch_size):
+        chunk = decoded[chunk_start:chunk_start + batch_size]
+        try:
+            results = run_yolo([cv2.resize(img, (imgsz, imgsz)) for _, img in chunk])
+        except Exception as e:
+            for i, _ in chunk:
+                outputs[i] = {'success': False, 'error': str(e)}
+            continue
+
+        for (i, img), result in zip(chunk, results):
+            try:
+                h, w = img.shape[:2]
+                outputs[i] = {'success': True, 'results': process_detections(img, result, roi_policy), 'image_size': (w, h)}
+            except Exception as e:
+                outputs[i] = {'success': False, 'error': str(e)}
+
+    return outputs
@@ -0,0 +1,242 @@
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+
+class OcrPoolBusy(RuntimeError):
+    """Raised when the job queue is full and a new OCR job cannot be accepted"""
+
+
+class OcrJobTimeout(TimeoutError):
+    """Raised when a job runs longer than the pool's per-job timeout"""
+
+
+def _worker_main(worker_idx: int, job_queue, result_queue):
+    """Worker process entry point: load the models once, then serve jobs until told to stop"""
+    from ocr_pipeline import load_models, run_ocr_pipeline
+    from text_validation import SensitivityShortCircuit
+
+    load_models()
+    result_queue.put(('ready', worker_idx, None))
+    while True:
+        job = job_queue.get()
+        if job is None:
+            break
+
+        job_id, shm_name, size, options = job
+        result_queue.put(('started', job_id, worker_idx))
+        try:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            try:
+                # Decode straight out of the shared buffer; imdecode makes its own copy
+                encoded = shm.buf[:size]
+                if options.get('early_exit'):
+                    short_circuit = SensitivityShortCircuit()
+                    ocr_result = run_ocr_pipeline(encoded, stop_when=short_circuit, order='confidence')
+                    ocr_result['sensitive_entity'] = short_circuit.finish() if ocr_result['success'] else None
+                    ocr_result['detected_by'] = short_circuit.detected_by
+                    ocr_result['validation_errors'] = short_circuit.validation_errors
+                else:
+                    ocr_result = run_ocr_pipeline(encoded)
+                encoded.release()
+            finally:
+                shm.close()
+            result_queue.put(('done', job_id, ocr_result))
+        except Exception as e:
+            result_queue.put(('done', job_id, {'success': False, 'error': str(e)}))
+
+
+class OcrWorkerPool:
+    """
+    Pool of OCR worker processes, each holding its own YOLO and PaddleOCR models.
+
+    Keeps the CPU-heavy OpenCV/NumPy/OCR work out of the API process. Image bytes
+    are handed over through shared memory rather than pickled through the queue.
+    The job queue is bounded (submit raises OcrPoolBusy when full), and a job
+    running past job_timeout gets its worker killed and respawned.
+    """
+
+    def __init__(self, num_workers: int = 2, max_queued_jobs: int = 32, job_timeout: float = 60.0):
+        self.num_workers = num_workers
+        self.max_queued_jobs = max_queued_jobs
+        self.job_timeout = job_timeout
+
+        self._ctx = mp.get_context('spawn')
+        self._job_queue = None
+        self._result_queue = None
+        self._workers: Dict[int, mp.Process] = {}
+        self._pending: Dict[int, tuple] = {}  # job_id -> (future, shared memory)
+        self._running_jobs: Dict[int, tuple] = {}  # job_id -> (worker_idx, started_at)
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._collector: Optional[threading.Thread] = None
+        self._running = False
+        self.ready_workers = 0
+
+    def start(self):
+        """Spawn the worker processes and the result collector thread"""
+        if self._running:
+            return
+        self._job_queue = self._ctx.Queue(maxsize=self.max_queued_jobs)
+        self._result_queue = self._ctx.Queue()
+        self._running = True
+        for worker_idx in range(self.num_workers):
+            self._spawn_worker(worker_idx)
+        self._collector = threading.Thread(target=self._collect, name="ocr-pool-collector", daemon=True)
+        self._collector.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop accepting jobs, let workers finish, then fail anything left over"""
+        if not self._running:
+            return
+        self._running = False
+        for _ in self._workers:
+            try:
+                self._job_queue.put(None, timeout=1.0)
+            except queue.Full:
+                break
+
+        deadline = time.monotonic() + timeout
+        for process in self._workers.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join(1.0)
+        self._workers.clear()
+
+        if self._collector is not None:
+            self._collector.join(2.0)
+            self._collector = None
+
+        with self._lock:
+            pending = list(self._pending.items())
+            self._pending.clear()
+            self._running_jobs.clear()
+        for _, (future, shm) in pending:
+            self._release(shm)
+            if not future.done():
+                future.set_exception(RuntimeError("OCR worker pool stopped"))
+
+        self._job_queue.close()
+        self._result_queue.close()
+
+    def submit(self, image_bytes: bytes, early_exit: bool = False) -> Future:
+        """Queue an OCR job for encoded image bytes; the Future resolves to run_ocr_pipeline's dict"""
+        if not self._running:
+            raise RuntimeError("OCR worker pool is not running")
+
+        shm = shared_memory.SharedMemory(create=True, size=max(len(image_bytes), 1))
+        shm.buf[:len(image_bytes)] = image_bytes
+        job_id = next(self._job_ids)
+        future: Future = Future()
+        with self._lock:
+            self._pending[job_id] = (future, shm)
+        try:
+            self._job_queue.put_nowait((job_id, shm.name, len(image_bytes), {'early_exit': early_exit}))
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(job_id, None)
+            self._release(shm)
+            raise OcrPoolBusy(f"OCR queue is full ({self.max_queued_jobs} jobs)")
+        return future
+
+    def run(self, image_bytes: bytes, early_exit: bool = False) -> Dict:
+        """Submit a job and wait for its result"""
+        # The collector enforces job_timeout once the job starts; this also bounds queue wait
+        return self.submit(image_bytes, early_exit).result(timeout=self.job_timeout * 2)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'workers': len(self._workers),
+                'ready_workers': self.ready_workers,
+                'pending_jobs': len(self._pending),
+                'running_jobs': len(self._running_jobs),
+            }
+
+    def _spawn_worker(self, worker_idx: int):
+        process = self._ctx.Process(target=_worker_main, args=(worker_idx, self._job_queue, self._result_queue),
+                                    name=f"ocr-worker-{worker_idx}", daemon=True)
+        process.start()
+        self._workers[worker_idx] = process
+
+    @staticmethod
+    def _release(shm):
+        try:
+            shm.close()
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _finish(self, job_id: int, result: Optional[Dict] = None, error: Optional[BaseException] = None):
+        with self._lock:
+            entry = self._pending.pop(job_id, None)
+            self._running_jobs.pop(job_id, None)
+        if entry is None:
+            return
+        future, shm = entry
+        self._release(shm)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _collect(self):
+        while self._running or self._pending:
+            try:
+                kind, key, payload = self._result_queue.get(timeout=0.5)
+            except queue.Empty:
+                kind = None
+            except (EOFError, OSError):
+                break
+
+            if kind == 'ready':
+                with self._lock:
+                    self.ready_workers += 1
+            elif kind == 'started':
+                with self._lock:
+                    if key in self._pending:
+                        self._running_jobs[key] = (payload, time.monotonic())
+            elif kind == 'done':
+                self._finish(key, result=payload)
+
+            if not self._running and not any(p.is_alive() for p in self._workers.values()):
+                break
+            self._reap_overdue_jobs()
+            self._respawn_dead_workers()
+
+    def _reap_overdue_jobs(self):
+        now = time.monotonic()
+        with self._lock:
+            overdue = [(job_id, worker_idx) for job_id, (worker_idx, started_at) in self._running_jobs.items()
+                       if now - started_at > self.job_timeout]
+        for job_id, worker_idx in overdue:
+            process = self._workers.get(worker_idx)
+            if process is not None and process.is_alive():
+                process.terminate()
+                process.join(1.0)
+            with self._lock:
+                self.ready_workers = max(0, self.ready_workers - 1)
+            self._finish(job_id, error=OcrJobTimeout(f"OCR job exceeded {self.job_timeout}s"))
+            if self._running:
+                self._spawn_worker(worker_idx)
+
+    def _respawn_dead_workers(self):
+        if not self._running:
+            return
+        for worker_idx, process in list(self._workers.items()):
+            if process.is_alive():
+                continue
+            with self._lock:
+                crashed_jobs = [job_id for job_id, (idx, _) in self._running_jobs.items() if idx == worker_idx]
+                self.ready_workers = max(0, self.ready_workers - 1)
+            for job_id in crashed_jobs:
+                self._finish(job_id, error=RuntimeError(f"OCR worker {worker_idx} exited unexpectedly"))
+            self._spawn_worker(worker_idx)
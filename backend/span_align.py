@@ -0,0 +1,110 @@
+"""
+Re-anchor LLM-returned entities whose offsets don't match the text.
+
+Gemini often returns the right entity text with the wrong start/end. Searching
+for each entity separately from the start of the text is O(n * k) and always
+picks the first occurrence of a repeated string. Instead, one Aho-Corasick
+automaton is built over all misaligned entity strings, the text is scanned once,
+and each entity takes the unused occurrence closest to its hinted offset.
+"""
+import bisect
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+class MultiPatternMatcher:
+    """Aho-Corasick automaton reporting every (start, end, pattern) occurrence in one pass"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(dict.fromkeys(p for p in patterns if p))
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        for idx, pattern in enumerate(self.patterns):
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] += (idx,)
+
+        # Breadth-first so every node's failure target is finished before its children
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(ch, 0)
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        goto, fail, out, patterns = self._goto, self._fail, self._out, self.patterns
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for idx in out[node]:
+                yield i + 1 - len(patterns[idx]), i + 1, idx
+
+
+def _take_nearest(positions: List[int], used: List[bool], hint: int) -> int:
+    """Index of the unused position closest to hint (ties go left), or -1"""
+    right = bisect.bisect_left(positions, hint)
+    left = right - 1
+    while left >= 0 and used[left]:
+        left -= 1
+    while right < len(positions) and used[right]:
+        right += 1
+    if left < 0:
+        return right if right < len(positions) else -1
+    if right >= len(positions) or hint - positions[left] <= positions[right] - hint:
+        return left
+    return right
+
+
+def align_entities(text: str, entities: list, claimed: Iterable[Tuple[int, int]] = ()) -> list:
+    """
+    Move misaligned entities onto real occurrences of their text
+
+    Entities need .text, .start and .end; start is used as the hint. Each
+    occurrence is handed out at most once, so two "John"s hinted at different
+    places land on different matches; spans in claimed (entities that were
+    already correct) are never handed out. Entities are updated in place; the
+    ones whose text never occurs, or whose occurrences are all taken, are returned.
+    """
+    if not entities:
+        return []
+    matcher = MultiPatternMatcher(entity.text for entity in entities)
+    index = {pattern: idx for idx, pattern in enumerate(matcher.patterns)}
+    occurrences: List[List[int]] = [[] for _ in matcher.patterns]
+    for start, _, idx in matcher.finditer(text):
+        occurrences[idx].append(start)  # already in ascending order
+    claimed = set(claimed)
+    used = [[(start, start + len(pattern)) in claimed for start in starts]
+            for pattern, starts in zip(matcher.patterns, occurrences)]
+
+    unmatched = []
+    # In hint order, so a repeated string is handed out left to right
+    for entity in sorted(entities, key=lambda e: e.start):
+        idx = index.get(entity.text)
+        if idx is None:
+            unmatched.append(entity)
+            continue
+        chosen = _take_nearest(occurrences[idx], used[idx], entity.start)
+        if chosen < 0:
+            unmatched.append(entity)
+            continue
+        used[idx][chosen] = True
+        entity.start = occurrences[idx][chosen]
+        entity.end = entity.start + len(entity.text)
+    return unmatched
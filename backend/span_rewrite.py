@@ -0,0 +1,123 @@
+"""
+Linear-time placeholder substitution for detected entity spans.
+
+encrypt_text_pii used to splice the string once per entity, which is
+O(len(text) * entities) and corrupts the output when the detector returns
+duplicate or overlapping spans. Here overlapping spans are merged once into a
+sorted, non-overlapping list and the output is emitted in a single str.join pass,
+along with an OffsetMap between original and processed positions.
+"""
+import bisect
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+def resolve_overlaps(items: Iterable[T], merge: Callable[[T, int, int], T], text_length: Optional[int] = None,
+                     span: Callable[[T], Tuple[int, int]] = lambda item: (item.start, item.end),
+                     priority: Callable[[T], tuple] = lambda item: ()) -> List[T]:
+    """
+    Collapse items into a sorted, non-overlapping list that covers every input span
+
+    Overlapping spans, including chains where only neighbours touch, form one
+    cluster, and the cluster becomes a single item over their union. That way no
+    part of any detected span is left outside a replacement. Each cluster is
+    represented by its highest priority(item), with ties going to the longer
+    span. When the union is wider than that item's own span,
+    merge(item, union_start, union_end) builds the item that covers it. Exact
+    duplicates collapse to one. Empty or out-of-range spans are dropped. This is
+    one sort plus one sweep, so O(n log n) in the number of spans.
+    """
+    candidates = []
+    for item in items:
+        start, end = span(item)
+        if start < 0 or end <= start or (text_length is not None and end > text_length):
+            continue
+        candidates.append((start, end, item))
+    candidates.sort(key=lambda c: (c[0], -(c[1] - c[0])))
+
+    # [union_start, union_end, best_start, best_end, best_item] per cluster
+    clusters: List[list] = []
+    for start, end, item in candidates:
+        if clusters and start < clusters[-1][1]:
+            cluster = clusters[-1]
+            cluster[1] = max(cluster[1], end)
+            if (priority(item), end - start) > (priority(cluster[4]), cluster[3] - cluster[2]):
+                cluster[2:] = [start, end, item]
+            continue
+        clusters.append([start, end, start, end, item])
+
+    resolved = []
+    for union_start, union_end, best_start, best_end, item in clusters:
+        if (best_start, best_end) != (union_start, union_end):
+            item = merge(item, union_start, union_end)
+        resolved.append(item)
+    return resolved
+
+
+class OffsetMap:
+    """
+    Position mapping between the original text and the rewritten text
+
+    Built from the replaced spans in order. A position inside a replaced span
+    maps to the start of its replacement.
+    """
+
+    def __init__(self, original_spans: Sequence[Tuple[int, int]], processed_spans: Sequence[Tuple[int, int]]):
+        self.original_spans = list(original_spans)
+        self.processed_spans = list(processed_spans)
+        self._original_ends = [end for _, end in self.original_spans]
+        self._processed_ends = [end for _, end in self.processed_spans]
+
+    def __len__(self) -> int:
+        return len(self.original_spans)
+
+    def _map(self, pos: int, source, source_ends, target) -> int:
+        idx = bisect.bisect_right(source_ends, pos)
+        if idx < len(source) and source[idx][0] < pos:
+            return target[idx][0]  # inside a replaced span
+        if idx == 0:
+            return pos
+        return pos + (target[idx - 1][1] - source[idx - 1][1])
+
+    def to_processed(self, pos: int) -> int:
+        return self._map(pos, self.original_spans, self._original_ends, self.processed_spans)
+
+    def to_original(self, pos: int) -> int:
+        return self._map(pos, self.processed_spans, self._processed_ends, self.original_spans)
+
+    def span_at(self, processed_pos: int) -> Optional[int]:
+        """Index of the replacement covering processed_pos, or None"""
+        idx = bisect.bisect_right(self._processed_ends, processed_pos)
+        if idx < len(self.processed_spans) and self.processed_spans[idx][0] <= processed_pos:
+            return idx
+        return None
+
+    def to_dict(self) -> dict:
+        return {'original_spans': self.original_spans, 'processed_spans': self.processed_spans}
+
+
+def rewrite_spans(text: str, replacements: Iterable[Tuple[int, int, str]]) -> Tuple[str, OffsetMap]:
+    """
+    Replace sorted, non-overlapping (start, end, replacement) spans in one pass
+
+    Run resolve_overlaps first if the spans come straight from a detector.
+    Returns the rewritten text and the OffsetMap for it.
+    """
+    segments = []
+    original_spans = []
+    processed_spans = []
+    cursor = 0
+    out_len = 0
+    for start, end, replacement in replacements:
+        if start < cursor:
+            raise ValueError(f"Spans must be sorted and non-overlapping (span at {start} overlaps {cursor})")
+        segments.append(text[cursor:start])
+        out_len += start - cursor
+        segments.append(replacement)
+        original_spans.append((start, end))
+        processed_spans.append((out_len, out_len + len(replacement)))
+        out_len += len(replacement)
+        cursor = end
+    segments.append(text[cursor:])
+    return ''.join(segments), OffsetMap(original_spans, processed_spans)
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+from batch_scheduler import MicroBatchScheduler
+
+
+class RecordingModel:
+    """Doubles every item and records the size of each batch it was called with"""
+
+    def __init__(self, gate=None):
+        self.batches = []
+        self.gate = gate
+
+    def __call__(self, items):
+        if self.gate is not None:
+            self.gate.wait(5)
+        self.batches.append(len(items))
+        return [item * 2 for item in items]
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(infer_fn, **kwargs):
+        scheduler = MicroBatchScheduler(infer_fn, **kwargs)
+        scheduler.start()
+        schedulers.append(scheduler)
+        return scheduler
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+def test_full_batch_runs_without_waiting_for_the_deadline(make_scheduler):
+    model = RecordingModel()
+    scheduler = make_scheduler(model, max_batch_size=4, max_latency_ms=10_000)
+
+    start = time.monotonic()
+    futures = [scheduler.submit(i) for i in range(4)]
+    assert [future.result(2) for future in futures] == [0, 2, 4, 6]
+    assert time.monotonic() - start < 2
+    assert model.batches == [4]
+
+
+def test_partial_batch_is_flushed_at_the_deadline(make_scheduler):
+    model = RecordingModel()
+    scheduler = make_scheduler(model, max_batch_size=8, max_latency_ms=100)
+
+    start = time.monotonic()
+    assert scheduler.infer(21, timeout=2) == 42
+    assert time.monotonic() - start >= 0.09
+    assert model.batches == [1]
+
+
+def test_queued_items_are_split_by_max_batch_size(make_scheduler):
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    scheduler = make_scheduler(model, max_batch_size=3, max_latency_ms=20)
+
+    # The first item goes alone and holds the model until the other seven are queued
+    futures = [scheduler.submit(0)]
+    time.sleep(0.1)
+    futures += [scheduler.submit(i) for i in range(1, 8)]
+    gate.set()
+
+    assert [future.result(2) for future in futures] == [2 * i for i in range(8)]
+    assert model.batches == [1, 3, 3, 1]
+    assert scheduler.stats() == {'queue_depth': 0, 'batches_run': 4, 'items_run': 8}
+
+
+def test_model_errors_fail_every_future_in_the_batch(make_scheduler):
+    def broken(items):
+        raise ValueError('CUDA out of memory')
+
+    scheduler = make_scheduler(broken, max_batch_size=2, max_latency_ms=50)
+    futures = [scheduler.submit(i) for i in range(2)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(2)
+
+    short = make_scheduler(lambda items: items[:-1], max_batch_size=2, max_latency_ms=50)
+    with pytest.raises(RuntimeError, match='Expected 2 results'):
+        [future.result(2) for future in [short.submit(1), short.submit(2)]]
+
+
+def test_cancelled_items_are_skipped(make_scheduler):
+    gate = threading.Event()
+    model = RecordingModel(gate)
+    scheduler = make_scheduler(model, max_batch_size=4, max_latency_ms=20)
+
+    first = scheduler.submit(1)
+    time.sleep(0.1)
+    cancelled, kept = scheduler.submit(2), scheduler.submit(3)
+    assert cancelled.cancel()
+    gate.set()
+
+    assert first.result(2) == 2 and kept.result(2) == 6
+    assert model.batches == [1, 1]
+
+
+def test_stopped_scheduler_rejects_and_fails_items():
+    gate = threading.Event()
+    scheduler = MicroBatchScheduler(RecordingModel(gate), max_batch_size=1, max_latency_ms=10)
+    with pytest.raises(RuntimeError):
+        scheduler.infer(1)
+
+    scheduler.start()
+    running = scheduler.submit(1)
+    time.sleep(0.1)
+    waiting = scheduler.submit(2)
+    threading.Timer(0.2, gate.set).start()
+    scheduler.stop()
+
+    assert running.result(2) == 2
+    with pytest.raises(RuntimeError, match='stopped'):
+        waiting.result(2)
@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from ciphertext_codec import HEADER, MAGIC, VERSION, CiphertextCodec, is_framed
+from crypto_policy import AES_GCM, BFV, CKKS, TOKEN
+
+COMPRESSIBLE = b'label:SSN;' * 200
+
+
+@pytest.mark.parametrize('compression', ['none', 'zlib'])
+def test_round_trip(compression):
+    codec = CiphertextCodec(compression)
+    for kind in (TOKEN, AES_GCM, BFV, CKKS):
+        for payload in (b'', os.urandom(64), COMPRESSIBLE):
+            blob = codec.encode(payload, kind)
+            assert is_framed(blob)
+            assert codec.decode(blob) == (kind, payload)
+
+
+def test_compression_only_kept_when_smaller():
+    codec = CiphertextCodec('zlib')
+    random_payload = os.urandom(256)
+    assert codec.encode(random_payload, AES_GCM)[HEADER.size:] == random_payload
+    assert len(codec.encode(COMPRESSIBLE, AES_GCM)) < len(COMPRESSIBLE)
+
+
+def test_decoder_handles_other_codecs_frames():
+    blob = CiphertextCodec('zlib').encode(COMPRESSIBLE, BFV)
+    assert CiphertextCodec('none').decode(blob) == (BFV, COMPRESSIBLE)
+
+
+def test_header_layout():
+    blob = CiphertextCodec('none').encode(b'xyz', TOKEN)
+    assert blob[:2] == bytes([MAGIC, VERSION])
+    assert CiphertextCodec('none').decode_header(blob) == (TOKEN, 0)
+
+
+def test_rejects_bad_frames():
+    codec = CiphertextCodec('none')
+    assert not is_framed(b'\x00raw ciphertext')
+    with pytest.raises(ValueError):
+        codec.decode(b'\x00raw ciphertext')
+    with pytest.raises(ValueError):
+        codec.decode(bytes([MAGIC, VERSION + 1, 0, 1]) + b'x')
+    with pytest.raises(ValueError):
+        codec.decode(bytes([MAGIC, VERSION, 0, 99]) + b'x')
+    with pytest.raises(ValueError):
+        CiphertextCodec('brotli-9000')
+
+
+def test_default_codec_does_not_compress(monkeypatch):
+    monkeypatch.delenv('PII_CIPHERTEXT_COMPRESSION', raising=False)
+    assert CiphertextCodec.from_env().encode(COMPRESSIBLE, AES_GCM)[HEADER.size:] == COMPRESSIBLE
+    assert CiphertextCodec().compression == 'none'
+
+
+def test_he_ciphertexts_are_not_compressible():
+    ts = pytest.importorskip('tenseal')
+    from he_params import make_context, select_he_config
+
+    payload = ts.ckks_vector(make_context(select_he_config(payload_length=100)), [0.5] * 100).serialize()
+    assert CiphertextCodec('zlib').encode(payload, CKKS) == CiphertextCodec('none').encode(payload, CKKS)
+
+
+def test_context_round_trip_with_stripped_keys():
+    ts = pytest.importorskip('tenseal')
+    from he_params import candidate_configs, make_context
+
+    config = next(c for c in candidate_configs(16) if c.poly_modulus_degree == 2048)
+    context = make_context(config)
+    codec = CiphertextCodec('zlib')
+    blob = codec.encode_context(context, strip_public_key=True)
+    restored = codec.decode_context(blob, galois_keys=False, relin_keys=False)
+
+    values = [0.25, 0.5, 0.75]
+    encrypted = ts.lazy_ckks_vector_from(ts.ckks_vector(context, values).serialize())
+    encrypted.link_context(restored)
+    assert [round(v, 3) for v in encrypted.decrypt()[:3]] == values
+    with pytest.raises(ValueError):
+        codec.decode_context(codec.encode(b'x', CKKS))
@@ -0,0 +1,36 @@
+import pytest
+
+from crypto_policy import AES_GCM, BFV, CKKS, TOKEN, CryptoPolicy, TokenVault
+from mapping_store import MappingStore
+
+
+def test_policy_levels_and_label_overrides():
+    policy = CryptoPolicy.parse('1:token,2:aes-gcm,3:bfv;financial=ckks')
+    assert [policy.mechanism_for('EMAIL', level) for level in (1, 2, 3)] == [TOKEN, AES_GCM, BFV]
+    assert policy.mechanism_for('FINANCIAL', 1) == CKKS
+    with pytest.raises(ValueError):
+        CryptoPolicy.parse('2:rot13')
+
+
+def test_token_vault_is_deterministic_and_reversible():
+    vault = TokenVault(b'k' * 32)
+    token = vault.protect('555-123-4567', 'PHONE')
+    assert token == vault.protect('555-123-4567', 'PHONE') != vault.protect('555-123-4567', 'ID_NUMBER')
+    assert len(token) == TokenVault.TOKEN_BYTES
+    assert vault.reveal(token, 'PHONE') == '555-123-4567'
+
+
+def test_token_vault_is_bounded_by_its_store():
+    vault = TokenVault(store=MappingStore(max_entries=2))
+    tokens = [vault.protect(text, 'NAME') for text in ('Ann', 'Bob', 'Cy')]
+    assert len(vault) == 2
+    with pytest.raises(KeyError):
+        vault.reveal(tokens[0], 'NAME')
+
+
+def test_token_vault_export_restore_keeps_bounds():
+    vault = TokenVault()
+    tokens = [vault.protect(text, 'NAME') for text in ('Ann', 'Bob', 'Cy')]
+    restored = TokenVault.restore(vault.export(), MappingStore(max_entries=2))
+    assert len(restored) == 2
+    assert [restored.reveal(token, 'NAME') for token in tokens[1:]] == ['Bob', 'Cy']
@@ -0,0 +1,120 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+for dependency in ('torch', 'datasets', 'google.generativeai'):
+    pytest.importorskip(dependency)
+
+import gemini_pii_he_system  # noqa: E402
+from crypto_policy import AES_GCM, CryptoPolicy  # noqa: E402
+from gemini_pii_he_system import DetectionIncomplete, GeminiPIIEncryptionSystem  # noqa: E402
+
+TEXT = 'mail a@b.com or call 555-123-4567 now'
+EMAIL = {'text': 'a@b.com', 'label': 'EMAIL', 'start': 5, 'end': 12}
+PHONE = {'text': '555-123-4567', 'label': 'PHONE', 'start': 21, 'end': 33}
+
+
+class Broken(Exception):
+    pass
+
+
+class FakeStreamingModel:
+    """Streams one scripted response per call; a Broken item raises at that point of the stream"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def generate_content(self, prompt, generation_config=None, stream=False):
+        fragments = self.responses[min(self.calls, len(self.responses) - 1)]
+        self.calls += 1
+
+        def stream_fragments():
+            for fragment in fragments:
+                if isinstance(fragment, Broken):
+                    raise fragment
+                yield SimpleNamespace(text=fragment)
+        return stream_fragments()
+
+
+def array_fragments(*entities):
+    """A JSON array split so each entity arrives in its own fragment"""
+    return ['['] + [json.dumps(e) + (', ' if i < len(entities) - 1 else '') for i, e in enumerate(entities)] + [']']
+
+
+@pytest.fixture
+def system(monkeypatch):
+    monkeypatch.setattr(gemini_pii_he_system.time, 'sleep', lambda seconds: None)
+    return GeminiPIIEncryptionSystem('test-key', crypto_policy=CryptoPolicy({2: AES_GCM, 3: AES_GCM}))
+
+
+def test_retry_after_mid_stream_failure_yields_each_entity_once(system):
+    complete = array_fragments(EMAIL, PHONE)
+    system.model = FakeStreamingModel(complete[:2] + [Broken('connection reset')], complete)
+
+    entities = list(system.stream_pii_entities_with_gemini(TEXT))
+    assert [(e.start, e.end, e.label) for e in entities] == [(5, 12, 'EMAIL'), (21, 33, 'PHONE')]
+    assert system.model.calls == 2
+
+
+def test_unterminated_array_is_a_failed_attempt(system):
+    complete = array_fragments(EMAIL, PHONE)
+    system.model = FakeStreamingModel(complete[:2], complete)
+
+    assert len(list(system.stream_pii_entities_with_gemini(TEXT))) == 2
+    assert system.model.calls == 2
+
+
+def test_detection_that_never_completes_raises(system):
+    system.model = FakeStreamingModel(array_fragments(EMAIL, PHONE)[:2] + [Broken('connection reset')])
+
+    with pytest.raises(DetectionIncomplete):
+        system.encrypt_text_pii(TEXT, min_sensitivity=2)
+    assert system.model.calls == 3
+
+
+def test_encrypt_text_pii_protects_every_streamed_entity(system):
+    complete = array_fragments(EMAIL, PHONE)
+    system.model = FakeStreamingModel(complete[:2] + [Broken('connection reset')], complete)
+
+    result = system.encrypt_text_pii(TEXT, min_sensitivity=2)
+    assert '555-123-4567' not in result['processed_text'] and 'a@b.com' not in result['processed_text']
+    assert system.decrypt_many(result['encrypted_entities']) == ['a@b.com', '555-123-4567']
+
+
+def test_overlapping_chain_is_encrypted_once_as_its_union(system):
+    text = 'id AB12 CD3456 EF and more'
+    chain = [{'text': 'AB12', 'label': 'EMAIL', 'start': 3, 'end': 7},
+             {'text': '12 CD3456', 'label': 'SSN', 'start': 5, 'end': 14},
+             {'text': '56 E', 'label': 'PHONE', 'start': 12, 'end': 16}]
+    system.model = FakeStreamingModel(array_fragments(*chain))
+
+    result = system.encrypt_text_pii(text, min_sensitivity=2)
+    (merged,) = result['encrypted_entities']
+    assert (merged.start, merged.end, merged.label) == (3, 16, 'SSN')
+    assert result['all_entities'] == [merged]
+    assert list(system.entity_mappings) == [merged.encryption_id]
+    assert result['processed_text'] == f"id [ENCRYPTED_{merged.encryption_id}]F and more"
+
+
+def test_merging_never_drops_a_mapping_another_message_holds(system):
+    system.model = FakeStreamingModel(array_fragments(EMAIL))
+    (earlier,) = system.encrypt_text_pii(TEXT, min_sensitivity=2)['encrypted_entities']
+
+    # Same EMAIL span again (same content-hash id), this time swallowed by a longer span
+    longer = {'text': 'a@b.com or call', 'label': 'URL', 'start': 5, 'end': 20}
+    system.model = FakeStreamingModel(array_fragments(EMAIL, longer))
+    (kept,) = system.encrypt_text_pii(TEXT, min_sensitivity=2)['encrypted_entities']
+
+    assert kept.label == 'URL'
+    assert system.decrypt_many([system.stored_entity(earlier.encryption_id)]) == ['a@b.com']
+
+
+def test_late_span_joins_an_already_protected_cluster(system):
+    late = {'text': 'mail a@b.com', 'label': 'URL', 'start': 0, 'end': 12}
+    system.model = FakeStreamingModel(array_fragments(EMAIL, PHONE, late))
+
+    result = system.encrypt_text_pii(TEXT, min_sensitivity=2)
+    assert [(e.start, e.end, e.label) for e in result['all_entities']] == [(0, 12, 'URL'), (21, 33, 'PHONE')]
+    assert system.decrypt_many(result['encrypted_entities']) == ['mail a@b.com', '555-123-4567']
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip('tenseal')
+
+from he_packing import BFV_PROFILES, BFVTextEncoder, pack_bytes, select_profile, unpack_bytes  # noqa: E402
+
+
+def test_profiles_are_ordered_and_hold_their_packing():
+    capacities = [profile.capacity for profile in BFV_PROFILES]
+    assert capacities == sorted(capacities)
+    for profile in BFV_PROFILES:
+        assert profile.plain_modulus > 256 ** profile.bytes_per_slot
+        assert profile.plain_modulus % (2 * profile.poly_modulus_degree) == 1
+
+
+def test_select_profile_picks_the_smallest_that_fits():
+    first = BFV_PROFILES[0]
+    assert select_profile(0) == 0
+    assert select_profile(first.capacity) == 0
+    assert select_profile(first.capacity + 1) == 1
+    with pytest.raises(ValueError):
+        select_profile(BFV_PROFILES[-1].capacity + 1)
+
+
+@pytest.mark.parametrize('data', [b'', b'a', b'ab', b'abc', bytes(range(256)), 'Zoë 中文'.encode('utf-8')])
+def test_pack_unpack_round_trip(data):
+    for profile in BFV_PROFILES:
+        values = pack_bytes(data, profile)
+        assert values[0] == len(data)
+        assert len(values) == 1 + -(-len(data) // profile.bytes_per_slot)
+        assert unpack_bytes(values, profile) == data
+
+
+def test_unpack_accepts_centered_values():
+    profile = BFV_PROFILES[0]
+    t = profile.plain_modulus
+    values = pack_bytes(b'\xff\xff\x00\x01', profile)
+    centered = [v - t if v > t // 2 else v for v in values]
+    assert unpack_bytes(centered, profile) == b'\xff\xff\x00\x01'
+
+
+def test_encoder_round_trips_exactly():
+    encoder = BFVTextEncoder()
+    for text in ['S1234567D', 'jöhn.doe+tag@example.com', '中文 ' * 20]:
+        blob = encoder.protect(text, 'NAME')
+        assert blob[0] == select_profile(len(text.encode('utf-8')))
+        assert encoder.reveal(blob, 'NAME') == text
+
+
+def test_encoder_export_restore():
+    encoder = BFVTextEncoder()
+    blob = encoder.protect('4111 1111 1111 1111', 'CREDITCARD')
+    restored = BFVTextEncoder.restore(encoder.export())
+    assert restored.reveal(blob, 'CREDITCARD') == '4111 1111 1111 1111'
@@ -0,0 +1,41 @@
+import pytest
+
+ts = pytest.importorskip('tenseal')
+
+from he_params import (  # noqa: E402
+    MAX_COEFF_BITS, HEConfig, candidate_configs, make_context, profile_he_config, security_level, select_he_config,
+)
+
+
+def test_security_level():
+    assert security_level(HEConfig()) == 128
+    assert security_level(HEConfig(poly_modulus_degree=8192, coeff_mod_bit_sizes=[50, 50])) == 256
+    assert security_level(HEConfig(poly_modulus_degree=4096, coeff_mod_bit_sizes=[60, 40, 40, 60])) is None
+
+
+@pytest.mark.parametrize('level', sorted(MAX_COEFF_BITS))
+def test_candidates_fit_the_payload_and_security_level(level):
+    candidates = candidate_configs(100, level)
+    degrees = [config.poly_modulus_degree for config in candidates]
+    assert candidates and degrees == sorted(degrees)
+    for config in candidates:
+        assert config.poly_modulus_degree // 2 >= 100
+        assert security_level(config) >= level
+        assert config.symmetric and not config.cache_galois_keys and not config.cache_relin_keys
+
+
+def test_select_he_config_picks_the_smallest_byte_exact_candidate():
+    selected = select_he_config(payload_length=100, samples=3)
+    exact = [config for config in candidate_configs(100) if profile_he_config(config, 100, samples=3)['byte_exact']]
+    assert selected == exact[0]
+
+    values = [byte / 255.0 for byte in range(100)]
+    decrypted = ts.ckks_vector(make_context(selected), values).decrypt()
+    assert [round(v * 255) for v in decrypted] == list(range(100))
+
+
+def test_select_he_config_rejects_payloads_without_candidates():
+    largest_slots = max(MAX_COEFF_BITS[128]) // 2
+    assert candidate_configs(largest_slots + 1) == []
+    with pytest.raises(ValueError):
+        select_he_config(payload_length=largest_slots + 1)
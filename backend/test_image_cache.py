@@ -0,0 +1,147 @@
+import asyncio
+import io
+import json
+import os
+
+import numpy as np
+from PIL import Image
+
+from image_cache import ImageResultCache
+
+
+def png_bytes(color, size=(32, 32)) -> bytes:
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def gradient_bytes(fmt: str, size=(64, 64)) -> bytes:
+    image = Image.new('L', size)
+    image.putdata([(x * 4 + y) % 256 for y in range(size[1]) for x in range(size[0])])
+    buf = io.BytesIO()
+    image.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def test_get_or_compute_caches_by_content():
+    cache = ImageResultCache()
+    calls = []
+    compute = lambda: calls.append(1) or {'analysis': {'is_sensitive': True}}
+
+    assert cache.get_or_compute(cache.make_key(png_bytes('red')), compute) == ({'analysis': {'is_sensitive': True}}, False)
+    assert cache.get_or_compute(cache.make_key(png_bytes('red')), compute)[1] is True
+    assert len(calls) == 1
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_should_cache_false_is_not_stored():
+    cache = ImageResultCache()
+    key = cache.make_key(png_bytes('blue'))
+    value = {'analysis': {'is_sensitive': False, 'validation_error': True}}
+
+    assert cache.get_or_compute(key, lambda: value, should_cache=lambda v: False) == (value, False)
+    assert cache.get(key) is None
+
+
+def test_lru_eviction_by_entries():
+    cache = ImageResultCache(max_entries=2)
+    keys = [cache.make_key(png_bytes(color)) for color in ('red', 'green', 'blue')]
+    for key in keys:
+        cache.put(key, key.sha256, 1.0)
+
+    assert cache.get(keys[0]) is None
+    assert cache.get(keys[2]) == keys[2].sha256
+
+
+def test_phash_deferred_until_exact_miss():
+    cache = ImageResultCache(use_phash=True)
+    data = gradient_bytes('PNG')
+    cache.put(cache.make_key(data), 'value', 1.0)
+
+    key = cache.make_key(data)
+    assert key.phash is None
+    assert cache.get(key) == 'value'
+    assert key.phash is None  # exact hit, no decode
+
+
+def test_phash_matches_reencoded_copy():
+    cache = ImageResultCache(use_phash=True)
+    cache.put(cache.make_key(gradient_bytes('PNG')), 'value', 1.0)
+
+    key = cache.make_key(gradient_bytes('BMP'))
+    assert cache.get(key) == 'value'
+    assert key.phash is not None
+    assert cache.phash_hits == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    data = png_bytes('yellow')
+    ImageResultCache(disk_dir=str(tmp_path)).put(ImageResultCache().make_key(data), {'a': 1}, 5.0)
+
+    cache = ImageResultCache(disk_dir=str(tmp_path))
+    assert cache.get(cache.make_key(data)) == {'a': 1}
+    assert cache.disk_hits == 1
+
+
+def test_variants_do_not_share_entries():
+    cache = ImageResultCache(use_phash=True)
+    data = gradient_bytes('PNG')
+    cache.put(cache.make_key(data), 'full', 1.0)
+
+    assert cache.get(cache.make_key(data, variant='early-exit')) is None
+    assert cache.get(cache.make_key(gradient_bytes('BMP'), variant='early-exit')) is None
+    cache.put(cache.make_key(data, variant='early-exit'), 'partial', 1.0)
+    assert cache.get(cache.make_key(data)) == 'full'
+    assert cache.get(cache.make_key(data, variant='early-exit')) == 'partial'
+
+
+def test_get_or_compute_async_runs_compute_once():
+    cache = ImageResultCache()
+    key = cache.make_key(png_bytes('purple'))
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'value'
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_compute_async(key, compute) for _ in range(3)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(cached for _, cached in results) == [False, True, True]
+    assert all(value == 'value' for value, _ in results)
+
+
+def test_disk_tier_is_bounded_and_evicts_least_recently_used(tmp_path):
+    cache = ImageResultCache(max_entries=1, disk_dir=str(tmp_path), disk_max_entries=2)
+    keys = [cache.make_key(png_bytes(color)) for color in ('red', 'green', 'blue')]
+    cache.put(keys[0], {'n': 0}, 1.0)
+    cache.put(keys[1], {'n': 1}, 1.0)
+    assert cache.get(keys[0]) == {'n': 0}  # disk hit: keys[1] is now the oldest file
+    cache.put(keys[2], {'n': 2}, 1.0)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f"{k.sha256}.json" for k in (keys[0], keys[2]))
+    assert cache.stats()['disk_entries'] == 2
+
+    # A restart orders the files by mtime
+    os.utime(tmp_path / f"{keys[0].sha256}.json", (1, 1))
+    os.utime(tmp_path / f"{keys[2].sha256}.json", (2, 2))
+    restarted = ImageResultCache(disk_dir=str(tmp_path), disk_max_entries=1)
+    assert [p.name for p in tmp_path.iterdir()] == [f"{keys[2].sha256}.json"]
+    assert restarted.get(keys[2]) == {'n': 2}
+
+
+def test_disk_tier_stores_json(tmp_path):
+    cache = ImageResultCache(disk_dir=str(tmp_path))
+    key = cache.make_key(png_bytes('orange'))
+    value = {'analysis': {'is_sensitive': True}, 'ocr_results': [{'bbox': np.array([1, 2, 3, 4]), 'score': np.float32(0.5)}]}
+    cache.put(key, value, 5.0)
+
+    stored = json.loads((tmp_path / f"{key.sha256}.json").read_text())
+    assert stored['value']['ocr_results'] == [{'bbox': [1, 2, 3, 4], 'score': 0.5}]
+
+    # Anything but a JSON entry, e.g. a pickle planted in the directory, is not loaded
+    (tmp_path / f"{key.sha256}.json").write_bytes(b'\x80\x04K\x01.')
+    assert ImageResultCache(disk_dir=str(tmp_path)).get(key) is None
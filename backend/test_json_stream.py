@@ -0,0 +1,49 @@
+import json
+import random
+
+from json_stream import IncrementalJSONArrayParser, iter_json_array
+
+ENTITIES = [
+    {'text': 'John, "Jr." [II]', 'label': 'NAME', 'start': 0, 'end': 16, 'confidence': 0.9},
+    {'text': 'a\\b@example.com', 'label': 'EMAIL', 'start': 20, 'end': 35, 'confidence': 1.0},
+    {'text': '{not an object}', 'label': 'MISC', 'start': 40, 'end': 55, 'confidence': 0.5, 'tags': [1, [2]]},
+]
+
+
+def split_randomly(text, seed):
+    rng = random.Random(seed)
+    pieces, pos = [], 0
+    while pos < len(text):
+        size = rng.randint(1, 7)
+        pieces.append(text[pos:pos + size])
+        pos += size
+    return pieces
+
+
+def test_elements_survive_any_fragmentation():
+    payload = '```json\n' + json.dumps(ENTITIES, indent=1) + '\n```'
+    for seed in range(30):
+        assert list(iter_json_array(split_randomly(payload, seed))) == ENTITIES
+
+
+def test_elements_are_emitted_as_soon_as_they_close():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"a": 1}, {"b"') == [{'a': 1}]
+    assert parser.feed(': 2}') == []
+    assert parser.feed(', 3]') == [{'b': 2}, 3]
+    assert parser.finished
+
+
+def test_text_after_the_array_is_ignored():
+    assert list(iter_json_array(['[1, 2]', ' trailing [3]'])) == [1, 2]
+
+
+def test_empty_array_and_no_array():
+    assert list(iter_json_array(['[', ' ', ']'])) == []
+    assert list(iter_json_array(['no json here'])) == []
+
+
+def test_bad_element_is_counted_and_skipped():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"a": 1}, {bad}, {"c": 3}]') == [{'a': 1}, {'c': 3}]
+    assert (parser.items_parsed, parser.errors) == (2, 1)
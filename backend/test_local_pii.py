@@ -0,0 +1,53 @@
+import pytest
+
+from local_pii import detect_local_pii, luhn_valid
+
+
+def labels(text):
+    return [(e['label'], e['text']) for e in detect_local_pii(text)]
+
+
+@pytest.mark.parametrize('number', [
+    '555-123-4567',
+    '555.123.4567',
+    '555 123 4567',
+    '(555) 123-4567',
+    '(555)123-4567',
+    '+1 555-123-4567',
+    '+1 (555) 123-4567',
+])
+def test_full_phone_number_is_matched_whole(number):
+    assert labels(f"call {number} today") == [('PHONE', number)]
+
+
+@pytest.mark.parametrize('number', ['123-4567', '555.1234', '+65 9123 4567', '+44 20 7946 0958'])
+def test_short_and_international_phone_forms_still_match(number):
+    assert labels(f"tel {number}") == [('PHONE', number)]
+
+
+@pytest.mark.parametrize('digits', ['5551234567', '1234567', '20240312', '2024 0312'])
+def test_bare_digit_runs_stay_below_the_early_exit_threshold(digits):
+    text = f"invoice {digits} total"
+    assert [(e['label'], e['sensitivity_level']) for e in detect_local_pii(text)] == [('PHONE', 1)]
+    assert detect_local_pii(text, min_sensitivity=2) == []
+
+
+def test_offsets_point_at_the_match():
+    text = 'ring 555-123-4567 or mail a.b@example.com'
+    for entity in detect_local_pii(text):
+        assert text[entity['start']:entity['end']] == entity['text']
+
+
+def test_ssn_is_not_reported_as_phone():
+    assert labels('ssn 123-45-6789') == [('SSN', '123-45-6789')]
+
+
+def test_credit_card_requires_luhn():
+    assert luhn_valid('4111 1111 1111 1111')
+    assert labels('card 4111 1111 1111 1111') == [('CREDITCARD', '4111 1111 1111 1111')]
+    assert ('CREDITCARD', '4111 1111 1111 1112') not in labels('card 4111 1111 1111 1112')
+
+
+def test_min_sensitivity_filters_levels():
+    assert labels('a.b@example.com 123-45-6789') == [('EMAIL', 'a.b@example.com'), ('SSN', '123-45-6789')]
+    assert [e['label'] for e in detect_local_pii('a.b@example.com 123-45-6789', min_sensitivity=3)] == ['SSN']
@@ -0,0 +1,54 @@
+import pytest
+
+import mapping_store
+from mapping_store import MappingStore
+
+
+def test_evicts_least_recently_used():
+    store = MappingStore(max_entries=2)
+    store['a'] = 1
+    store['b'] = 2
+    assert store.get('a') == 1  # 'b' is now the oldest
+    store['c'] = 3
+
+    assert 'b' not in store
+    assert store['a'] == 1 and store['c'] == 3
+    assert len(store) == 2
+    assert store.evictions == 1
+
+
+def test_expires_after_max_age(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(mapping_store.time, 'monotonic', lambda: now[0])
+    store = MappingStore(max_age=10)
+    store['a'] = 1
+    now[0] += 5
+    assert store.get('a') == 1
+    now[0] += 6
+    assert store.get('a') is None
+    assert len(store) == 0
+
+
+def test_dict_interface():
+    store = MappingStore(initial={'a': {'label': 'SSN'}})
+    assert store.get('missing', {}) == {}
+    with pytest.raises(KeyError):
+        store['missing']
+    assert store.pop('a') == {'label': 'SSN'}
+    assert store.pop('a', None) is None
+    assert list(store) == []
+
+
+def test_to_dict_round_trip():
+    store = MappingStore(max_entries=5)
+    for i in range(3):
+        store[str(i)] = i
+    restored = MappingStore(max_entries=2, initial=store.to_dict())
+    assert restored.to_dict() == {'1': 1, '2': 2}
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv('PII_MAX_MAPPINGS', '7')
+    monkeypatch.setenv('PII_MAPPING_TTL', '30')
+    store = MappingStore.from_env()
+    assert (store.max_entries, store.max_age) == (7, 30.0)
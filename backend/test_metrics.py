@@ -0,0 +1,87 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import Registry, http_request_seconds, install_http_metrics
+
+
+def test_counter_renders_one_sample_per_label_set():
+    registry = Registry()
+    counter = registry.counter('pii_entities_total', 'PII entities detected', ('service', 'label'))
+    counter.inc(service='text', label='EMAIL')
+    counter.inc(2, service='text', label='PHONE')
+    counter.inc(service='text', label='EMAIL')
+
+    assert counter.value(service='text', label='EMAIL') == 2
+    assert registry.render() == (
+        '# HELP pii_entities_total PII entities detected\n'
+        '# TYPE pii_entities_total counter\n'
+        'pii_entities_total{service="text",label="EMAIL"} 2\n'
+        'pii_entities_total{service="text",label="PHONE"} 2\n'
+    )
+
+
+def test_label_values_are_escaped_and_checked():
+    registry = Registry()
+    counter = registry.counter('errors_total', 'Errors', ('reason',))
+    counter.inc(reason='bad "quote"\\path\nline')
+    assert 'errors_total{reason="bad \\"quote\\"\\\\path\\nline"} 1' in registry.render()
+
+    with pytest.raises(ValueError):
+        counter.inc(reason='x', kind='y')
+
+
+def test_gauge_callback_is_read_at_render_time():
+    registry = Registry()
+    depth = [3]
+    registry.gauge('queue_depth', 'Items waiting', callback=lambda: depth[0])
+    registry.gauge('broken', 'Raises on read', callback=lambda: 1 / 0)
+    assert 'queue_depth 3\n' in registry.render()
+
+    depth[0] = 7
+    rendered = registry.render()
+    assert 'queue_depth 7\n' in rendered
+    assert '# TYPE broken gauge\n' in rendered and '\nbroken ' not in rendered
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('stage_seconds', 'Stage time', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage='ocr')
+
+    assert histogram.snapshot(stage='ocr') == {'count': 4, 'sum': 3.65}
+    assert histogram.snapshot(stage='yolo') == {'count': 0, 'sum': 0.0}
+    assert registry.render().splitlines()[2:] == [
+        'stage_seconds_bucket{stage="ocr",le="0.1"} 2',
+        'stage_seconds_bucket{stage="ocr",le="1.0"} 3',
+        'stage_seconds_bucket{stage="ocr",le="+Inf"} 4',
+        'stage_seconds_sum{stage="ocr"} 3.65',
+        'stage_seconds_count{stage="ocr"} 4',
+    ]
+
+
+def test_registering_a_name_twice_returns_the_first_metric():
+    registry = Registry()
+    first = registry.counter('requests_total', 'Requests')
+    assert registry.counter('requests_total', 'Requests again') is first
+    assert registry.render().count('# TYPE requests_total') == 1
+
+
+def test_http_metrics_are_labelled_by_route_template():
+    app = FastAPI()
+    install_http_metrics(app, 'test')
+
+    @app.get('/items/{item_id}')
+    def get_item(item_id: int):
+        return {'id': item_id}
+
+    client = TestClient(app)
+    labels = {'service': 'test', 'method': 'GET', 'route': '/items/{item_id}', 'status': 200}
+    before = http_request_seconds.snapshot(**labels)['count']
+    client.get('/items/1')
+    client.get('/items/2')
+    client.get('/missing')
+
+    assert http_request_seconds.snapshot(**labels)['count'] == before + 2
+    assert http_request_seconds.snapshot(service='test', method='GET', route='unmatched', status=404)['count'] >= 1
@@ -0,0 +1,118 @@
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip('scipy')
+
+import ocr_pipeline  # noqa: E402
+from ocr_pipeline import (  # noqa: E402
+    MaskGeometry, RoiResolutionPolicy, find_mask_corners, map_boxes_to_original, meets_mandatory_requirements,
+    order_points, rectify_card, transform_points,
+)
+
+SQUARE = np.array([[0, 0], [10, 0], [10, 10], [0, 10]], dtype=np.float32)
+
+
+def rect_mask(shape, x1, y1, x2, y2):
+    mask = np.zeros(shape, dtype=bool)
+    mask[y1:y2 + 1, x1:x2 + 1] = True
+    return mask
+
+
+def test_helpers_import_without_loading_models():
+    assert ocr_pipeline.model is None and ocr_pipeline.ocr is None
+
+
+def test_order_points():
+    shuffled = SQUARE[[2, 0, 3, 1]]
+    assert order_points(shuffled).tolist() == SQUARE.tolist()
+
+    tilted = np.array([[95, 70], [4, 62], [10, 5], [100, 12]], dtype=np.float32)
+    assert order_points(tilted).tolist() == [[10, 5], [100, 12], [95, 70], [4, 62]]
+
+
+def test_transform_points_affine_and_perspective():
+    points = [[1, 2], [3, 4]]
+    affine = np.array([[2, 0, 10], [0, 3, 20]], dtype=np.float64)
+    assert transform_points(points, affine).tolist() == [[12, 26], [16, 32]]
+
+    homography = np.array([[2, 0, 10], [0, 3, 20], [0, 0, 1]], dtype=np.float64)
+    assert np.allclose(transform_points(points, homography), [[12, 26], [16, 32]])
+
+    # Projective division: w = 0.5 * x + 1
+    projective = np.array([[1, 0, 0], [0, 1, 0], [0.5, 0, 1]], dtype=np.float64)
+    assert np.allclose(transform_points([[2, 4]], projective), [[1, 2]])
+
+
+def test_map_boxes_to_original():
+    boxes = [{'bbox': [0, 0, 4, 2], 'polygon': [[0, 0], [4, 0], [4, 2], [0, 2]], 'text': 'x'},
+             {'bbox': [1, 1, 2, 2], 'text': 'y'}]
+    # 90 degrees counter-clockwise, then shift by (100, 50)
+    rotate = np.array([[0, 1, 100], [-1, 0, 50]], dtype=np.float64)
+
+    mapped = map_boxes_to_original(boxes, rotate)
+    assert mapped[0]['bbox'] == [100.0, 46.0, 102.0, 50.0]
+    assert mapped[0]['polygon'] == [[100, 50], [100, 46], [102, 46], [102, 50]]
+    assert mapped[1]['bbox'] == [101.0, 48.0, 102.0, 49.0] and 'polygon' not in mapped[1]
+
+
+def test_scale_for():
+    policy = RoiResolutionPolicy(target_long_side=1000)
+    assert policy.scale_for(500, 2000) == 0.5
+    assert policy.scale_for(400, 500) == 1.0
+    assert RoiResolutionPolicy(target_long_side=1000, allow_upscale=True).scale_for(400, 500) == 2.0
+    assert RoiResolutionPolicy(target_long_side=None).scale_for(5000, 5000) == 1.0
+
+
+def test_policy_apply_resizes_to_the_target():
+    roi = np.zeros((300, 600, 3), dtype=np.uint8)
+    resized, scale = RoiResolutionPolicy(target_long_side=200).apply(roi)
+    assert scale == pytest.approx(1 / 3) and resized.shape == (100, 200, 3)
+
+    same, scale = RoiResolutionPolicy(target_long_side=1000).apply(roi)
+    assert same is roi and scale == 1.0
+
+
+def test_mask_geometry_of_a_rectangle():
+    geometry = MaskGeometry(rect_mask((100, 100), 10, 20, 59, 49))
+    assert geometry.bbox == (10, 20, 59, 49)
+    assert (geometry.width, geometry.height) == (50, 30)
+    assert geometry.pixel_area == 50 * 30
+    assert geometry.is_four_sided and geometry.solidity == pytest.approx(1.0)
+    assert meets_mandatory_requirements(geometry) == (True, 'Valid')
+    assert sorted(find_mask_corners(geometry).tolist()) == [[10, 20], [10, 49], [59, 20], [59, 49]]
+
+
+def test_mask_geometry_rejections():
+    empty = MaskGeometry(np.zeros((50, 50), dtype=bool))
+    assert empty.contour is None and empty.bbox is None and empty.width == 0
+    assert find_mask_corners(empty) is None
+    assert meets_mandatory_requirements(empty) == (False, 'Not 4-sided')
+
+    narrow = MaskGeometry(rect_mask((100, 100), 10, 10, 20, 80))
+    assert narrow.is_four_sided
+    assert meets_mandatory_requirements(narrow) == (False, 'Width < 20px')
+
+    disc = np.zeros((100, 100), dtype=np.uint8)
+    cv2.circle(disc, (50, 50), 40, 1, -1)
+    assert meets_mandatory_requirements(MaskGeometry(disc > 0)) == (False, 'Not 4-sided')
+
+
+def test_rectify_card_warps_the_quad_upright():
+    img = np.zeros((200, 300, 3), dtype=np.uint8)
+    img[50:100, 40:240] = 255
+    corners = np.array([[240, 100], [40, 50], [40, 100], [240, 50]], dtype=np.float32)
+
+    rectified, to_original = rectify_card(img, corners, RoiResolutionPolicy(target_long_side=None))
+    assert rectified.shape == (50, 200, 3)
+    assert rectified[2:-2, 2:-2].min() == 255
+    assert np.allclose(transform_points([[0, 0], [199, 49]], to_original), [[40, 50], [240, 100]])
+
+
+def test_rectify_card_applies_the_resolution_policy():
+    img = np.full((400, 600, 3), 128, dtype=np.uint8)
+    corners = np.array([[0, 0], [599, 0], [599, 399], [0, 399]], dtype=np.float32)
+
+    rectified, to_original = rectify_card(img, corners, RoiResolutionPolicy(target_long_side=300))
+    assert rectified.shape == (200, 300, 3)
+    assert np.allclose(transform_points([[299, 199]], to_original), [[599, 399]])
@@ -0,0 +1,102 @@
+import time
+
+import pytest
+
+from ocr_workers import OcrJobTimeout, OcrPoolBusy, OcrWorkerPool
+
+# Stands in for ocr_pipeline in the worker processes, which import it by name
+FAKE_PIPELINE = '''
+import time
+
+
+def load_models():
+    pass
+
+
+def run_ocr_pipeline(image_data, stop_when=None, order=None):
+    data = bytes(image_data)
+    if data == b'hang':
+        time.sleep(60)
+    if data == b'crash':
+        import os
+        time.sleep(0.5)  # let the 'started' message reach the pool first
+        os._exit(1)
+    return {'success': True, 'results': [{'text': data.decode()}], 'image_size': (1, 1), 'order': order}
+'''
+
+
+def wait_until(condition, timeout=20.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out waiting for the pool'
+        time.sleep(0.05)
+
+
+@pytest.fixture
+def make_pool(tmp_path, monkeypatch):
+    (tmp_path / 'ocr_pipeline.py').write_text(FAKE_PIPELINE)
+    # Spawned workers inherit sys.path, so they pick up the fake pipeline first
+    monkeypatch.syspath_prepend(str(tmp_path))
+    pools = []
+
+    def make(**kwargs):
+        pool = OcrWorkerPool(**kwargs)
+        pool.start()
+        pools.append(pool)
+        wait_until(lambda: pool.ready_workers == pool.num_workers)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.stop(timeout=2.0)
+
+
+def test_jobs_round_trip_through_shared_memory(make_pool):
+    pool = make_pool(num_workers=2)
+    futures = [pool.submit(f'image {i}'.encode()) for i in range(6)]
+    assert [f.result(20)['results'][0]['text'] for f in futures] == [f'image {i}' for i in range(6)]
+    assert pool.run(b'') == {'success': True, 'results': [{'text': ''}], 'image_size': (1, 1), 'order': None}
+    assert pool.stats() == {'workers': 2, 'ready_workers': 2, 'pending_jobs': 0, 'running_jobs': 0}
+
+
+def test_full_queue_raises_busy(make_pool):
+    pool = make_pool(num_workers=1, max_queued_jobs=1, job_timeout=30.0)
+    pool.submit(b'hang')
+    wait_until(lambda: pool.stats()['running_jobs'] == 1)
+    queued = pool.submit(b'queued')
+
+    with pytest.raises(OcrPoolBusy):
+        pool.submit(b'rejected')
+    assert pool.stats()['pending_jobs'] == 2
+    assert not queued.done()
+
+
+def test_overdue_job_times_out_and_its_worker_is_replaced(make_pool):
+    pool = make_pool(num_workers=1, job_timeout=1.0)
+    hung = pool.submit(b'hang')
+    after = pool.submit(b'after')
+
+    with pytest.raises(OcrJobTimeout):
+        hung.result(20)
+    assert after.result(20)['results'][0]['text'] == 'after'
+    assert pool.stats()['ready_workers'] == 1
+
+
+def test_crashed_worker_fails_its_job_and_is_respawned(make_pool):
+    pool = make_pool(num_workers=1)
+    with pytest.raises(RuntimeError, match='exited unexpectedly'):
+        pool.run(b'crash')
+    assert pool.run(b'again')['results'][0]['text'] == 'again'
+
+
+def test_stop_fails_jobs_still_waiting(make_pool):
+    pool = make_pool(num_workers=1, job_timeout=30.0)
+    pool.submit(b'hang')
+    wait_until(lambda: pool.stats()['running_jobs'] == 1)
+    waiting = pool.submit(b'waiting')
+
+    pool.stop(timeout=0.5)
+    with pytest.raises(RuntimeError, match='stopped'):
+        waiting.result(5)
+    with pytest.raises(RuntimeError):
+        pool.submit(b'late')
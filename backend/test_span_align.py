@@ -0,0 +1,68 @@
+import random
+from dataclasses import dataclass
+
+from span_align import MultiPatternMatcher, align_entities
+
+
+@dataclass
+class Entity:
+    text: str
+    start: int
+    end: int = 0
+
+
+def naive_occurrences(text, patterns):
+    found = set()
+    for idx, pattern in enumerate(patterns):
+        pos = text.find(pattern)
+        while pos != -1:
+            found.add((pos, pos + len(pattern), idx))
+            pos = text.find(pattern, pos + 1)
+    return found
+
+
+def test_matcher_reports_overlapping_and_nested_patterns():
+    matcher = MultiPatternMatcher(['he', 'she', 'his', 'hers'])
+    found = {(start, end, matcher.patterns[idx]) for start, end, idx in matcher.finditer('ushers')}
+    assert found == {(1, 4, 'she'), (2, 4, 'he'), (2, 6, 'hers')}
+
+
+def test_matcher_matches_str_find_on_random_text():
+    rng = random.Random(0)
+    for _ in range(50):
+        text = ''.join(rng.choice('abc') for _ in range(60))
+        patterns = [''.join(rng.choice('abc') for _ in range(rng.randint(1, 4))) for _ in range(6)]
+        matcher = MultiPatternMatcher(patterns)
+        assert set(matcher.finditer(text)) == naive_occurrences(text, matcher.patterns)
+
+
+def test_matcher_drops_empty_and_duplicate_patterns():
+    assert MultiPatternMatcher(['', 'a', 'a', 'b']).patterns == ['a', 'b']
+
+
+def test_align_moves_entity_to_nearest_occurrence():
+    text = 'John met John again'
+    entity = Entity('John', start=7)
+    assert align_entities(text, [entity]) == []
+    assert (entity.start, entity.end) == (9, 13)
+
+
+def test_repeated_text_gets_distinct_occurrences():
+    text = 'John met John again'
+    first, second = Entity('John', start=1), Entity('John', start=2)
+    assert align_entities(text, [second, first]) == []
+    assert {(first.start, first.end), (second.start, second.end)} == {(0, 4), (9, 13)}
+
+
+def test_claimed_spans_are_not_handed_out():
+    text = 'John met John again'
+    entity = Entity('John', start=0)
+    assert align_entities(text, [entity], claimed=[(0, 4)]) == []
+    assert entity.start == 9
+
+
+def test_unmatched_entities_are_returned():
+    text = 'only one Ann here'
+    ann, ghost, extra = Entity('Ann', 9), Entity('Zed', 0), Entity('Ann', 12)
+    assert align_entities(text, [ann, ghost, extra]) == [ghost, extra]
+    assert ann.start == 9
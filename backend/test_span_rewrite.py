@@ -0,0 +1,90 @@
+from dataclasses import dataclass, replace
+
+import pytest
+
+from span_rewrite import OffsetMap, resolve_overlaps, rewrite_spans
+
+
+@dataclass
+class Span:
+    start: int
+    end: int
+    label: str = 'X'
+    level: int = 1
+
+
+def merge(item, start, end):
+    return replace(item, start=start, end=end)
+
+
+def spans(items):
+    return [(i.start, i.end, i.label) for i in items]
+
+
+def test_disjoint_spans_are_kept_in_order():
+    items = [Span(10, 12, 'B'), Span(0, 3, 'A')]
+    assert spans(resolve_overlaps(items, merge)) == [(0, 3, 'A'), (10, 12, 'B')]
+
+
+def test_exact_duplicates_collapse_without_merging():
+    a, b = Span(2, 6, 'A'), Span(2, 6, 'B', level=2)
+    (kept,) = resolve_overlaps([a, b], merge, priority=lambda i: (i.level,))
+    assert kept is b
+
+
+def test_chain_is_merged_into_its_union():
+    # A never touches C, but A-B and B-C overlap, so all three form one cluster
+    items = [Span(0, 5, 'A'), Span(3, 12, 'B'), Span(11, 30, 'C')]
+    assert spans(resolve_overlaps(items, merge)) == [(0, 30, 'C')]
+
+
+def test_partial_overlap_covers_both_spans():
+    items = [Span(0, 8, 'LOW', level=1), Span(5, 10, 'HIGH', level=3)]
+    assert spans(resolve_overlaps(items, merge, priority=lambda i: (i.level,))) == [(0, 10, 'HIGH')]
+
+
+def test_contained_span_keeps_the_outer_item():
+    outer, inner = Span(0, 10, 'OUTER'), Span(2, 4, 'INNER')
+    assert resolve_overlaps([inner, outer], merge) == [outer]
+
+
+def test_adjacent_spans_do_not_merge():
+    items = [Span(0, 5, 'A'), Span(5, 9, 'B')]
+    assert spans(resolve_overlaps(items, merge)) == [(0, 5, 'A'), (5, 9, 'B')]
+
+
+def test_invalid_spans_are_dropped():
+    items = [Span(-1, 3), Span(4, 4), Span(5, 50), Span(1, 2, 'OK')]
+    assert spans(resolve_overlaps(items, merge, text_length=20)) == [(1, 2, 'OK')]
+
+
+def test_rewrite_leaves_no_detected_text_behind():
+    text = 'id AB-1234-567 end'
+    items = [Span(3, 8, 'A'), Span(6, 12, 'B'), Span(11, 14, 'C')]
+    resolved = resolve_overlaps(items, merge, text_length=len(text))
+    processed, offsets = rewrite_spans(text, [(i.start, i.end, '[X]') for i in resolved])
+    assert processed == 'id [X] end'
+    assert offsets.to_processed(len(text)) == len(processed)
+
+
+def test_rewrite_spans_and_offset_map():
+    text = 'call 555-1234 or mail a@b.co now'
+    processed, offsets = rewrite_spans(text, [(5, 13, '<P>'), (22, 28, '<EMAIL>')])
+    assert processed == 'call <P> or mail <EMAIL> now'
+    assert offsets.to_processed(0) == 0
+    assert offsets.to_processed(7) == 5  # inside the first span
+    assert offsets.to_processed(14) == processed.index('or')
+    assert offsets.to_original(processed.index('now')) == text.index('now')
+    assert offsets.span_at(processed.index('<EMAIL>') + 1) == 1
+    assert offsets.span_at(0) is None
+    assert len(offsets) == 2
+
+
+def test_rewrite_rejects_overlaps():
+    with pytest.raises(ValueError):
+        rewrite_spans('abcdef', [(0, 3, 'x'), (2, 4, 'y')])
+
+
+def test_offset_map_round_trips_to_dict():
+    offsets = OffsetMap([(1, 3)], [(1, 5)])
+    assert offsets.to_dict() == {'original_spans': [(1, 3)], 'processed_spans': [(1, 5)]}
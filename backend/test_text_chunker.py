@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+
+from text_chunker import CHARS_PER_TOKEN, TextChunk, chunk_text, estimate_tokens, merge_chunk_entities
+
+
+@dataclass
+class Entity:
+    start: int
+    end: int
+    label: str
+    confidence: float = 1.0
+
+
+def make_text(sentences: int) -> str:
+    return ' '.join(f"Sentence number {i} mentions someone." for i in range(sentences))
+
+
+def test_estimate_tokens_rounds_up():
+    assert estimate_tokens(0) == 1
+    assert estimate_tokens(CHARS_PER_TOKEN) == 1
+    assert estimate_tokens(CHARS_PER_TOKEN + 1) == 2
+
+
+def test_short_text_is_one_chunk():
+    assert chunk_text('hello there.', max_tokens=10) == [TextChunk(0, 12, 'hello there.')]
+
+
+def test_chunks_cover_text_within_budget_and_overlap():
+    text = make_text(200)
+    chunks = chunk_text(text, max_tokens=64, overlap_tokens=16)
+
+    assert len(chunks) > 1
+    assert chunks[0].start == 0 and chunks[-1].end == len(text)
+    for chunk in chunks:
+        assert chunk.text == text[chunk.start:chunk.end]
+        assert estimate_tokens(len(chunk.text)) <= 64 + 1  # per-sentence rounding
+    for previous, current in zip(chunks, chunks[1:]):
+        assert previous.start < current.start <= previous.end  # no gaps, always progressing
+        assert current.start < previous.end  # sentences repeated for the overlap
+
+
+def test_chunks_break_on_sentence_boundaries():
+    text = make_text(100)
+    for chunk in chunk_text(text, max_tokens=40, overlap_tokens=0)[1:]:
+        assert chunk.text.startswith('Sentence number')
+
+
+def test_run_on_text_is_hard_split():
+    text = 'word ' * 400
+    chunks = chunk_text(text, max_tokens=32, overlap_tokens=0)
+    assert ''.join(chunk.text for chunk in chunks) == text
+    assert all(len(chunk.text) <= 32 * CHARS_PER_TOKEN for chunk in chunks)
+
+
+def test_merge_shifts_offsets_and_keeps_the_more_confident_duplicate():
+    first, second = TextChunk(0, 50, ''), TextChunk(40, 90, '')
+    merged = merge_chunk_entities([(first, [Entity(42, 46, 'NAME', 0.5)]), (second, [Entity(2, 6, 'NAME', 0.9)])])
+    assert [(e.start, e.end, e.confidence) for e in merged] == [(42, 46, 0.9)]
+
+
+def test_merge_drops_contained_same_label_span():
+    chunk = TextChunk(0, 100, '')
+    merged = merge_chunk_entities([(chunk, [Entity(10, 20, 'NAME'), Entity(12, 15, 'NAME'), Entity(12, 15, 'EMAIL')])])
+    assert [(e.start, e.end, e.label) for e in merged] == [(10, 20, 'NAME'), (12, 15, 'EMAIL')]
+
+
+def test_merge_keeps_partial_overlaps_for_resolve_overlaps():
+    left, right = TextChunk(0, 30, ''), TextChunk(20, 60, '')
+    merged = merge_chunk_entities([(left, [Entity(18, 30, 'NAME')]), (right, [Entity(4, 14, 'NAME')])])
+    assert [(e.start, e.end) for e in merged] == [(18, 30), (24, 34)]
@@ -0,0 +1,39 @@
+import pickle
+
+import pytest
+
+for dependency in ('torch', 'spacy', 'transformers', 'datasets'):
+    pytest.importorskip(dependency)
+
+from datasets import IterableDataset  # noqa: E402
+
+from text.pii_he_system import TrainingExamples, has_entities  # noqa: E402
+
+ROWS = [
+    {'unmasked_text': 'Call Ann', 'ent_starts': [5], 'ent_ends': [8], 'ent_labels': ['FIRSTNAME']},
+    {'unmasked_text': 'nothing here', 'ent_starts': [], 'ent_ends': [], 'ent_labels': []},
+    {'unmasked_text': 'Bob wrote', 'ent_starts': [0], 'ent_ends': [3], 'ent_labels': ['FIRSTNAME']},
+]
+
+
+def generate(rows):
+    yield from rows
+
+
+def test_has_entities():
+    assert pickle.loads(pickle.dumps(has_entities)) is has_entities
+    assert has_entities({'ent_starts': [[0], [], [1, 4]]}) == [True, False, True]
+
+
+def test_streamed_shard_pickles_with_its_filter():
+    # A list in gen_kwargs is split across shards, one row each here
+    dataset = IterableDataset.from_generator(generate, gen_kwargs={'rows': ROWS})
+    examples = TrainingExamples(dataset.filter(has_entities, batched=True))
+    assert examples.streaming and examples.dataset.n_shards == 3
+
+    shards = [pickle.loads(pickle.dumps(examples.shard(3, i))) for i in range(3)]
+    assert [list(shard) for shard in shards] == [
+        [('Call Ann', {'entities': [(5, 8, 'FIRSTNAME')]})],
+        [],
+        [('Bob wrote', {'entities': [(0, 3, 'FIRSTNAME')]})],
+    ]
@@ -0,0 +1,54 @@
+import text_validation
+from text_validation import SensitivityShortCircuit, validation_headers
+
+
+def boxes(*texts):
+    return [{'text': text} for text in texts]
+
+
+def fake_service(calls, entities):
+    def validate(text):
+        calls.append(text)
+        return {'entities': entities}
+    return validate
+
+
+def test_local_hit_stops_without_a_service_call(monkeypatch):
+    calls = []
+    monkeypatch.setattr(text_validation, 'validate_text_with_service', fake_service(calls, []))
+    short_circuit = SensitivityShortCircuit()
+
+    assert short_circuit(boxes('card', '4111 1111 1111 1111')) is True
+    assert short_circuit.finish()['label'] == 'CREDITCARD'
+    assert short_circuit.detected_by == 'local' and calls == []
+
+
+def test_clean_regions_are_validated_in_one_call(monkeypatch):
+    calls = []
+    monkeypatch.setattr(text_validation, 'validate_text_with_service', fake_service(calls, []))
+    short_circuit = SensitivityShortCircuit()
+
+    for region in (boxes('Receipt'), boxes('invoice 20240312'), boxes('x'), boxes('Total', '12.50')):
+        assert short_circuit(region) is False
+    assert short_circuit.finish() is None
+    assert calls == ['Receipt invoice 20240312 Total 12.50']
+    assert short_circuit.service_calls == 1
+
+
+def test_service_entity_above_threshold_is_reported(monkeypatch):
+    calls = []
+    entities = [{'label': 'PERSON', 'sensitivity_level': 1}, {'label': 'ADDRESS', 'sensitivity_level': 2}]
+    monkeypatch.setattr(text_validation, 'validate_text_with_service', fake_service(calls, entities))
+    short_circuit = SensitivityShortCircuit()
+
+    short_circuit(boxes('10 Downing Street'))
+    assert short_circuit.finish()['label'] == 'ADDRESS'
+    assert short_circuit.detected_by == 'service'
+
+
+def test_validation_headers(monkeypatch):
+    monkeypatch.setenv('PII_SERVICE_TOKEN', 'secret')
+    assert validation_headers(owner='chat-1') == {'Content-Type': 'application/json',
+                                                  'Authorization': 'Bearer secret', 'X-PII-Owner': 'chat-1'}
+    monkeypatch.delenv('PII_SERVICE_TOKEN')
+    assert 'Authorization' not in validation_headers()
@@ -9,13 +9,17 @@ import tenseal as ts
 import pickle
 from typing import List, Dict, Tuple, Optional
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 import hashlib
 import google.generativeai as genai
 import time
 import os
 from dotenv import load_dotenv
 
+# Shared backend modules: run from backend/ as `python -m text.gemini_pii_he_system`, or put backend/ on PYTHONPATH
+from span_align import align_entities
+from span_rewrite import resolve_overlaps, rewrite_spans
+
 load_dotenv()  # Load environment variables from .env file
 API_KEY = os.getenv("GEMINI_API_KEY", "")
 
@@ -146,6 +150,7 @@ Text to analyze: "'''
                 
                 # Convert to PIIEntity objects
                 entities = []
+                misaligned = []
                 for entity_dict in entities_data:
                     try:
                         # Get sensitivity level
@@ -164,14 +169,7 @@ Text to analyze: "'''
                         # Validate entity positions
                         span = text[entity.start:entity.end]
                         if span != entity.text:
-                            # Try to find the entity text in the original string
-                            match = re.search(re.escape(entity.text), text)
-                            if match:
-                                entity.start, entity.end = match.start(), match.end()
-                                logger.info(f"Corrected entity offsets for: {entity.text}")
-                                entities.append(entity)
-                            else:
-                                logger.warning(f"Invalid entity positions for: {entity.text}")
+                            misaligned.append(entity)
                         else:
                             entities.append(entity)
                             
@@ -179,6 +177,16 @@ Text to analyze: "'''
                         logger.warning(f"Error processing entity {entity_dict}: {e}")
                         continue
                 
+                # Find misaligned entities in the original string, nearest their hinted offsets
+                if misaligned:
+                    unmatched = {id(e) for e in align_entities(text, misaligned, claimed=((e.start, e.end) for e in entities))}
+                    for entity in misaligned:
+                        if id(entity) in unmatched:
+                            logger.warning(f"Invalid entity positions for: {entity.text}")
+                        else:
+                            logger.info(f"Corrected entity offsets for: {entity.text}")
+                            entities.append(entity)
+                
                 return entities
                 
             except Exception as e:
@@ -291,35 +299,24 @@ Text to analyze: "'''
         logger.info(f"Detecting PII in text ({len(text)} chars)...")
         entities = self.detect_pii_entities_with_gemini(text)
         
-        # Filter by sensitivity level
-        entities_to_encrypt = [e for e in entities if e.sensitivity_level >= min_sensitivity]
-        
-        logger.info(f"Found {len(entities)} total entities, {len(entities_to_encrypt)} to encrypt")
-        
-        # Encrypt sensitive entities
-        encrypted_entities = []
-        processed_text = text
-        offset = 0
+        entities.sort(key=lambda x: x.start)
         
-        # Sort entities by start position (reverse order for safe replacement)
-        entities_to_encrypt.sort(key=lambda x: x.start, reverse=True)
+        # Filter by sensitivity level; duplicate and overlapping spans merge into one entity per cluster
+        entities_to_encrypt = resolve_overlaps(
+            [e for e in entities if e.sensitivity_level >= min_sensitivity],
+            merge=lambda e, start, end: replace(e, start=start, end=end, text=text[start:end]),
+            text_length=len(text),
+            priority=lambda e: (e.sensitivity_level, e.confidence)
+        )
         
-        for entity in entities_to_encrypt:
-            # Encrypt the entity
-            encrypted_entity = self.encrypt_pii_entity(entity)
-            encrypted_entities.append(encrypted_entity)
-            
-            # Replace in text with placeholder (working backwards to preserve positions)
-            start_pos = entity.start
-            end_pos = entity.end
-            placeholder = f"[ENCRYPTED_{encrypted_entity.encryption_id}]"
-            
-            processed_text = (processed_text[:start_pos] + 
-                            placeholder + 
-                            processed_text[end_pos:])
+        logger.info(f"Found {len(entities)} total entities, {len(entities_to_encrypt)} to encrypt")
         
-        # Sort back to original order for return
-        encrypted_entities.reverse()
+        # Encrypt sensitive entities, then swap in all placeholders in one pass
+        encrypted_entities = [self.encrypt_pii_entity(entity) for entity in entities_to_encrypt]
+        processed_text, offset_map = rewrite_spans(
+            text,
+            [(e.start, e.end, f"[ENCRYPTED_{e.encryption_id}]") for e in encrypted_entities]
+        )
         
         return {
             'original_text': text,
@@ -327,7 +324,10 @@ Text to analyze: "'''
             'encrypted_entities': encrypted_entities,
             'total_entities': len(entities),
             'encrypted_count': len(encrypted_entities),
-            'all_entities': entities,
+            # Sensitive spans appear once per cluster, as the entity that carries the placeholder
+            'all_entities': sorted([e for e in entities if e.sensitivity_level < min_sensitivity] + encrypted_entities,
+                                   key=lambda x: x.start),
+            'offset_map': offset_map,
             'gemini_response_time': None  # Can be added for performance monitoring
         }
     
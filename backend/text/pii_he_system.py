@@ -4,17 +4,22 @@ import json
 import torch
 import spacy
 from spacy.tokens import DocBin
-from datasets import load_dataset
+from datasets import IterableDataset, load_dataset
 from transformers import AutoModelForSequenceClassification, AutoTokenizer
 from tqdm import tqdm
 import tenseal as ts
 import pickle
 from typing import List, Dict, Tuple, Optional
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 import hashlib
 import base64
 import ast
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Shared backend modules: run from backend/ as `python -m text.pii_he_system`, or put backend/ on PYTHONPATH
+from span_rewrite import resolve_overlaps, rewrite_spans
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +27,12 @@ logger = logging.getLogger(__name__)
 
 device = "cuda:0" if torch.cuda.is_available() else "cpu"
 
+# Pipeline components that don't contribute to doc.ents
+NON_NER_COMPONENTS = ["tagger", "parser", "lemmatizer", "attribute_ruler", "senter", "morphologizer"]
+
+# Below this many texts, nlp.pipe worker start-up costs more than it saves
+PARALLEL_PIPE_MIN_TEXTS = 2000
+
 @dataclass
 class HEConfig:
     """Configuration for homomorphic encryption parameters"""
@@ -47,6 +58,167 @@ class PIIEntity:
     encrypted_value: Optional[bytes] = None
     encryption_id: Optional[str] = None
 
+def _parse_annotation(value):
+    """Parse a privacy_mask / span_labels cell that may be JSON or a Python literal"""
+    if not isinstance(value, str):
+        return value
+    # Python-literal cells use single quotes; skip the doomed json.loads attempt for those
+    if "'" in value[:3]:
+        return ast.literal_eval(value)
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return ast.literal_eval(value)
+
+def _label_from_key(key: str) -> str:
+    """'[JOBTYPE_1]' or 'JOBTYPE_1' -> 'JOBTYPE'"""
+    return key.strip('[]').split('_')[0]
+
+def extract_entity_spans(text: str, privacy_mask=None, span_labels=None) -> List[Tuple[int, int, str]]:
+    """
+    Character spans for one dataset row
+    
+    Uses explicit offsets when the row has them (span_labels, or a privacy_mask list
+    with start/end). Otherwise falls back to locating each masked value in the text,
+    continuing after the previous occurrence of that value so repeated entities map
+    to successive positions instead of all landing on the first one.
+    """
+    spans = _parse_annotation(span_labels) if span_labels else None
+    if spans:
+        return [(int(start), int(end), _label_from_key(label))
+                for start, end, label in spans if label != 'O']
+    
+    masks = _parse_annotation(privacy_mask) if privacy_mask else None
+    if isinstance(masks, list):
+        if all('start' in item and 'end' in item for item in masks):
+            return [(int(item['start']), int(item['end']), _label_from_key(item['label'])) for item in masks]
+        pairs = [(item['label'], item['value']) for item in masks]
+    elif isinstance(masks, dict):
+        pairs = list(masks.items())
+    else:
+        return []
+    
+    entities = []
+    search_from = {}
+    for key, mask in pairs:
+        start_pos = text.find(mask, search_from.get(mask, 0))
+        if start_pos == -1:
+            start_pos = text.find(mask)
+        if start_pos != -1:
+            end_pos = start_pos + len(mask)
+            search_from[mask] = end_pos
+            entities.append((start_pos, end_pos, _label_from_key(key)))
+    return entities
+
+def extract_entity_columns(batch: Dict[str, list]) -> Dict[str, list]:
+    """Batched datasets.map function: adds ent_starts / ent_ends / ent_labels columns"""
+    texts = batch["unmasked_text"]
+    privacy_masks = batch.get("privacy_mask", [None] * len(texts))
+    span_labels = batch.get("span_labels", [None] * len(texts))
+    
+    starts, ends, labels = [], [], []
+    for text, privacy_mask, spans in zip(texts, privacy_masks, span_labels):
+        try:
+            entities = extract_entity_spans(text, privacy_mask, spans)
+        except (ValueError, SyntaxError, KeyError, TypeError) as e:
+            logger.warning(f"Error processing row: {e}")
+            entities = []
+        starts.append([e[0] for e in entities])
+        ends.append([e[1] for e in entities])
+        labels.append([e[2] for e in entities])
+    return {"ent_starts": starts, "ent_ends": ends, "ent_labels": labels}
+
+def has_entities(batch: Dict[str, list]) -> List[bool]:
+    """Batched datasets.filter predicate: keep rows with at least one entity"""
+    # Module-level rather than a lambda: a streamed dataset keeps it and is pickled into train_ner_model's workers
+    return [len(starts) > 0 for starts in batch["ent_starts"]]
+
+class TrainingExamples:
+    """
+    Lazy (text, {"entities": [...]}) view over a prepared HF dataset
+    
+    Rows stay in the dataset's memory-mapped Arrow files (or arrive from the
+    stream), so the full corpus never sits in Python lists.
+    """
+    
+    def __init__(self, dataset):
+        self.dataset = dataset
+    
+    @property
+    def streaming(self) -> bool:
+        """True for a streamed (IterableDataset) corpus, which has no length"""
+        return isinstance(self.dataset, IterableDataset)
+    
+    def __len__(self):
+        return len(self.dataset)
+    
+    def __iter__(self):
+        for row in self.dataset:
+            entities = list(zip(row["ent_starts"], row["ent_ends"], row["ent_labels"]))
+            yield row["unmasked_text"], {"entities": entities}
+    
+    def shard(self, num_shards: int, index: int) -> "TrainingExamples":
+        """Contiguous slice of the examples, for splitting work across processes"""
+        return TrainingExamples(self.dataset.shard(num_shards=num_shards, index=index, contiguous=True))
+
+def make_training_doc(nlp, text: str, entities: List[Tuple[int, int, str]]):
+    """Build a spaCy Doc with non-overlapping entity spans, or None if no span aligns"""
+    doc = nlp.make_doc(text)
+    
+    # One sorted sweep over character offsets: earliest start first, longest first on ties,
+    # dropping anything that overlaps the last accepted entity before a Span is ever built
+    filtered_spans = []
+    last_end = -1
+    for start, end, label in sorted(entities, key=lambda e: (e[0], -e[1])):
+        if start < last_end:
+            continue
+        span = doc.char_span(start, end, label=label, alignment_mode="contract")
+        if span:
+            filtered_spans.append(span)
+            last_end = end  # update end of last accepted span
+    
+    if not filtered_spans:
+        return None
+    doc.ents = filtered_spans
+    return doc
+
+def write_docbin_shards(train_data, output_dir: str, shard_size: int = 10000,
+                        prefix: str = "shard", show_progress: bool = True) -> List[Dict]:
+    """
+    Stream examples into DocBin shards of at most shard_size docs
+    
+    Each shard is written to disk as soon as it fills, so at most one shard is
+    held in memory. Returns [{"path", "docs"}] for the shards written.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    nlp = spacy.blank("en")
+    
+    shards = []
+    
+    def flush(db):
+        path = os.path.join(output_dir, f"{prefix}_{len(shards):05d}.spacy")
+        db.to_disk(path)
+        shards.append({"path": path, "docs": len(db)})
+    
+    db = DocBin()
+    for text, annot in tqdm(train_data, desc="Writing DocBin shards", disable=not show_progress):
+        doc = make_training_doc(nlp, text, annot["entities"])
+        if doc is None:
+            continue
+        db.add(doc)
+        if len(db) >= shard_size:
+            flush(db)
+            db = DocBin()
+    if len(db):
+        flush(db)
+    return shards
+
+def _build_shards_worker(args) -> List[Dict]:
+    """ProcessPoolExecutor entry point: build the DocBin shards for one slice of the data"""
+    examples, output_dir, shard_size, worker_idx = args
+    return write_docbin_shards(examples, output_dir, shard_size,
+                               prefix=f"part{worker_idx:03d}", show_progress=False)
+
 class PIIEncryptionSystem:
     """Complete PII detection and homomorphic encryption system"""
     
@@ -92,105 +264,109 @@ class PIIEncryptionSystem:
         logger.info("CKKS context initialized successfully")
         return context
     
-    def load_and_prepare_dataset(self, dataset_name: str = "Isotonic/pii-masking-200k"):
-        """Load and prepare the PII dataset"""
+    def load_and_prepare_dataset(self, dataset_name: str = "Isotonic/pii-masking-200k",
+                                 num_proc: Optional[int] = None, streaming: bool = False) -> TrainingExamples:
+        """
+        Load and prepare the PII dataset
+        
+        Entity extraction runs as a batched datasets.map across num_proc processes
+        (or lazily per chunk when streaming), and the result is returned as a lazy
+        TrainingExamples view rather than a list held in memory.
+        """
         logger.info(f"Loading dataset: {dataset_name}")
-        dataset = load_dataset(dataset_name, split="train")
-        df = pd.DataFrame(dataset)
-        
-        train_data = []
-        for i, row in tqdm(df.iterrows(), total=len(df), desc="Processing dataset"):
-            text = row["unmasked_text"]
-            entities = []
-            
-            try:
-                masks = row["privacy_mask"]
-                if isinstance(masks, str):
-                    masks = row["privacy_mask"]
-                if isinstance(masks, str):
-                    try:
-                        masks = json.loads(masks)  # try JSON first
-                    except json.JSONDecodeError:
-                        masks = ast.literal_eval(masks)  
-                
-                for key, mask in masks.items():
-                    start_pos = text.find(mask)
-                    if start_pos != -1:
-                        end_pos = start_pos + len(mask)
-                        label = key.strip('[]').split('_')[0]  # e.g., '[JOBTYPE_1]' -> 'JOBTYPE'
-                        entities.append((start_pos, end_pos, label))
-            
-
-            except Exception as e:
-                logger.warning(f"Error processing row {i}: {e}")
-                continue
-            
-            if entities:
-                train_data.append((text, {"entities": entities}))
-        
-        logger.info(f"Prepared {len(train_data)} training examples")
-        return train_data
-
+        dataset = load_dataset(dataset_name, split="train", streaming=streaming)
+        
+        keep = {"unmasked_text"}
+        remove_columns = [c for c in (dataset.column_names or []) if c not in keep]
+        if streaming:
+            dataset = dataset.map(extract_entity_columns, batched=True, batch_size=1000,
+                                  remove_columns=remove_columns)
+        else:
+            dataset = dataset.map(extract_entity_columns, batched=True, batch_size=1000,
+                                  num_proc=num_proc, remove_columns=remove_columns,
+                                  desc="Processing dataset")
+        dataset = dataset.filter(has_entities, batched=True, **({} if streaming else {"num_proc": num_proc}))
+        
+        examples = TrainingExamples(dataset)
+        if not streaming:
+            logger.info(f"Prepared {len(examples)} training examples")
+        return examples
     
-    def train_ner_model(self, train_data: List[Tuple], output_path: str = "./pii_train.spacy"):
-        """Train spaCy NER model for PII detection"""
-        logger.info("Creating spaCy training data...")
-        
-        nlp = spacy.blank("en")
-        db = DocBin()
-        
-        successful_docs = 0
-        for text, annot in tqdm(train_data, desc="Creating spaCy docs"):
-            # try:
-                doc = nlp.make_doc(text)
-                ents = []
-                
-                spans = []
-                for start, end, label in annot["entities"]:
-                    span = doc.char_span(start, end, label=label, alignment_mode="contract")
-                    if span:
-                        spans.append(span)
-
-                # Sort spans by start index
-                spans = sorted(spans, key=lambda s: s.start)
-
-                # Filter overlapping spans
-                filtered_spans = []
-                last_end = -1
-                for span in spans:
-                    if span.start >= last_end:
-                        filtered_spans.append(span)
-                        last_end = span.end  # update end of last accepted span
-
-                if filtered_spans:
-                    doc.ents = filtered_spans
-                    db.add(doc)
-                    successful_docs += 1
+    def write_docbin_shards(self, train_data, output_dir: str = "./pii_train_shards",
+                            shard_size: int = 10000) -> List[str]:
+        """Stream examples into DocBin shards of shard_size docs, flushing each shard to disk as it fills"""
+        shards = write_docbin_shards(train_data, output_dir, shard_size)
+        logger.info(f"Wrote {len(shards)} DocBin shards to {output_dir}")
+        return [shard["path"] for shard in shards]
 
-                    
-            # except Exception as e:
-            #     logger.warning(f"Error creating doc: {e}")
-            #     continue
+    def train_ner_model(self, train_data, output_path: str = "./pii_train_shards",
+                        num_workers: Optional[int] = None, shard_size: int = 10000) -> str:
+        """
+        Build the spaCy NER training corpus as DocBin shards, in parallel
+        
+        The examples are split into num_workers contiguous slices (TrainingExamples
+        are sharded without loading them; lists are sliced), and each worker process
+        writes its own shards. A streamed corpus has no length, so it is split along
+        its source shards (dataset.n_shards) and written serially when there is only
+        one. A manifest.json listing every shard and its doc count is written next to
+        them. spaCy's corpus reader accepts the directory directly and reads one shard
+        at a time.
+        
+        Returns:
+            The output directory
+        """
+        logger.info("Creating spaCy training data...")
+        num_workers = num_workers or os.cpu_count() or 1
+        os.makedirs(output_path, exist_ok=True)
+        
+        if isinstance(train_data, TrainingExamples) and train_data.streaming:
+            num_workers = max(1, min(num_workers, train_data.dataset.n_shards))
+            slices = [train_data] if num_workers == 1 else [train_data.shard(num_workers, i)
+                                                            for i in range(num_workers)]
+        elif isinstance(train_data, TrainingExamples):
+            num_workers = max(1, min(num_workers, len(train_data)))
+            slices = [train_data.shard(num_workers, i) for i in range(num_workers)]
+        else:
+            train_data = list(train_data)
+            num_workers = max(1, min(num_workers, len(train_data)))
+            chunk = -(-len(train_data) // num_workers)
+            slices = [train_data[i:i + chunk] for i in range(0, len(train_data), chunk)]
+        
+        jobs = [(examples, output_path, shard_size, i) for i, examples in enumerate(slices)]
+        if len(jobs) == 1:
+            shard_lists = [_build_shards_worker(jobs[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=len(jobs)) as executor:
+                shard_lists = list(tqdm(executor.map(_build_shards_worker, jobs), total=len(jobs),
+                                        desc="Creating spaCy docs"))
+        
+        shards = [shard for shard_list in shard_lists for shard in shard_list]
+        manifest = {
+            "format": "spacy-docbin",
+            "total_docs": sum(shard["docs"] for shard in shards),
+            "shards": [{"path": os.path.relpath(shard["path"], output_path), "docs": shard["docs"]}
+                       for shard in shards],
+        }
+        with open(os.path.join(output_path, "manifest.json"), "w") as f:
+            json.dump(manifest, f, indent=2)
         
-        db.to_disk(output_path)
-        logger.info(f"Saved {successful_docs} training documents to {output_path}")
+        logger.info(f"Saved {manifest['total_docs']} training documents in {len(shards)} shards to {output_path}")
         return output_path
     
     def load_trained_model(self, model_path: str):
-        """Load trained spaCy NER model"""
+        """Load trained spaCy NER model without its non-NER components"""
+        # Only NER output is used; excluded components are never loaded, so they
+        # cost neither load time nor memory
         try:
-            self.nlp = spacy.load(model_path)
+            self.nlp = spacy.load(model_path, exclude=NON_NER_COMPONENTS)
             logger.info(f"Loaded NER model from {model_path}")
         except:
             logger.warning("Trained model not found, using base English model")
-            self.nlp = spacy.load("en_core_web_lg")
+            self.nlp = spacy.load("en_core_web_lg", exclude=NON_NER_COMPONENTS)
+        logger.info(f"Active pipeline components: {self.nlp.pipe_names}")
     
-    def detect_pii_entities(self, text: str, confidence_threshold: float = 0.5) -> List[PIIEntity]:
-        """Detect PII entities in text"""
-        if not self.nlp:
-            raise ValueError("NER model not loaded")
-        
-        doc = self.nlp(text)
+    def _doc_to_entities(self, doc) -> List[PIIEntity]:
+        """Convert a processed spaCy doc into PIIEntity objects"""
         entities = []
         
         for ent in doc.ents:
@@ -209,6 +385,43 @@ class PIIEncryptionSystem:
         
         return entities
     
+    def detect_pii_entities(self, text: str, confidence_threshold: float = 0.5) -> List[PIIEntity]:
+        """Detect PII entities in text"""
+        if not self.nlp:
+            raise ValueError("NER model not loaded")
+        
+        return self._doc_to_entities(self.nlp(text))
+    
+    def detect_many(self, texts: List[str], batch_size: int = 256, n_process: int = 1) -> List[List[PIIEntity]]:
+        """
+        Detect PII entities in many texts at once using nlp.pipe
+        
+        Args:
+            texts: Messages to analyze
+            batch_size: Number of texts spaCy processes per batch
+            n_process: Worker processes for nlp.pipe (-1 for all cores)
+            
+        Returns:
+            One list of PIIEntity per input text, in input order
+        """
+        if not self.nlp:
+            raise ValueError("NER model not loaded")
+        
+        return [self._doc_to_entities(doc)
+                for doc in self.nlp.pipe(texts, batch_size=batch_size, n_process=n_process)]
+    
+    def batch_detect_pii(self, texts: List[str], batch_size: int = 256,
+                         n_process: Optional[int] = None) -> List[List[PIIEntity]]:
+        """
+        Offline counterpart of GeminiPIIEncryptionSystem.batch_detect_pii: same inputs, same entities
+
+        n_process defaults to one worker per CPU for batches of PARALLEL_PIPE_MIN_TEXTS
+        or more, and to a single process below that.
+        """
+        if n_process is None:
+            n_process = (os.cpu_count() or 1) if len(texts) >= PARALLEL_PIPE_MIN_TEXTS else 1
+        return self.detect_many(texts, batch_size=batch_size, n_process=n_process)
+    
     def _text_to_vector(self, text: str, max_length: int = 100) -> List[float]:
         """Convert text to numerical vector for encryption"""
         # Simple approach: use character codes normalized to [0,1]
@@ -260,42 +473,28 @@ class PIIEncryptionSystem:
         print(f"Detected {len(entities)} PII entities")
         print(f"Entities: {[e for e in entities]}")
 
-        # Filter by sensitivity level
-        entities_to_encrypt = [e for e in entities if e.sensitivity_level >= min_sensitivity]
-        
-        # Encrypt sensitive entities
-        encrypted_entities = []
-        processed_text = text
-        offset = 0
-        
-        # Sort entities by start position
-        entities_to_encrypt.sort(key=lambda x: x.start)
-        
-        for entity in entities_to_encrypt:
-            # Encrypt the entity
-            encrypted_entity = self.encrypt_pii_entity(entity)
+        # Filter by sensitivity level; duplicate and overlapping spans merge into one entity per cluster
+        entities_to_encrypt = resolve_overlaps(
+            [e for e in entities if e.sensitivity_level >= min_sensitivity],
+            merge=lambda e, start, end: replace(e, start=start, end=end, text=text[start:end]),
+            text_length=len(text),
+            priority=lambda e: (e.sensitivity_level, e.confidence)
+        )
         
-
-            encrypted_entities.append(encrypted_entity)
-            
-            # Replace in text with placeholder
-            start_pos = entity.start + offset
-            end_pos = entity.end + offset
-            placeholder = f"[ENCRYPTED_{encrypted_entity.encryption_id}]"
-            
-            processed_text = (processed_text[:start_pos] + 
-                            placeholder + 
-                            processed_text[end_pos:])
-            
-            # Update offset for next replacements
-            offset += len(placeholder) - (entity.end - entity.start)
+        # Encrypt sensitive entities, then swap in all placeholders in one pass
+        encrypted_entities = [self.encrypt_pii_entity(entity) for entity in entities_to_encrypt]
+        processed_text, offset_map = rewrite_spans(
+            text,
+            [(e.start, e.end, f"[ENCRYPTED_{e.encryption_id}]") for e in encrypted_entities]
+        )
         
         return {
             'original_text': text,
             'processed_text': processed_text,
             'encrypted_entities': encrypted_entities,
             'total_entities': len(entities),
-            'encrypted_count': len(encrypted_entities)
+            'encrypted_count': len(encrypted_entities),
+            'offset_map': offset_map
         }
     
     def decrypt_pii_entity(self, entity: PIIEntity) -> str:
@@ -406,7 +605,7 @@ def demo_pii_encryption():
 if __name__ == "__main__":
     # Uncomment to run full training pipeline
     system = PIIEncryptionSystem()
-    train_data = system.load_and_prepare_dataset()
+    train_data = system.load_and_prepare_dataset(num_proc=os.cpu_count())
     system.train_ner_model(train_data)
     
     # Run demo
@@ -0,0 +1,113 @@
+"""
+Sentence-aware chunking of long texts for per-chunk PII detection.
+
+Long pasted documents are split into windows of at most max_tokens (estimated
+from character count), breaking on sentence boundaries and repeating the last
+overlap_tokens worth of sentences at the start of the next window so entities
+straddling a boundary are seen whole at least once. Entities found per chunk
+are shifted back to global offsets and deduplicated by merge_chunk_entities.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Sequence, Tuple
+
+CHARS_PER_TOKEN = 4  # rough average for English text with Gemini's tokenizer
+
+SENTENCE_BREAK = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n\s*\n")
+WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass
+class TextChunk:
+    """A window of the original text; start/end are offsets into it"""
+    start: int
+    end: int
+    text: str
+
+
+def estimate_tokens(length: int) -> int:
+    return max(1, -(-length // CHARS_PER_TOKEN))
+
+
+def _sentence_units(text: str, max_chars: int) -> List[Tuple[int, int]]:
+    """Contiguous (start, end) spans covering text, one per sentence, none longer than max_chars"""
+    units = []
+    start = 0
+    for match in SENTENCE_BREAK.finditer(text):
+        if match.end() > start:
+            units.append((start, match.end()))
+            start = match.end()
+    if start < len(text):
+        units.append((start, len(text)))
+
+    # Hard-split run-on "sentences" at the last whitespace that fits
+    bounded = []
+    for start, end in units:
+        while end - start > max_chars:
+            cut = start + max_chars
+            spaces = [m.end() for m in WHITESPACE.finditer(text, start + 1, cut)]
+            if spaces:
+                cut = spaces[-1]
+            bounded.append((start, cut))
+            start = cut
+        bounded.append((start, end))
+    return bounded
+
+
+def chunk_text(text: str, max_tokens: int = 1024, overlap_tokens: int = 64) -> List[TextChunk]:
+    """Split text into sentence-aligned, overlapping chunks of at most max_tokens"""
+    if estimate_tokens(len(text)) <= max_tokens:
+        return [TextChunk(0, len(text), text)]
+
+    units = _sentence_units(text, max_tokens * CHARS_PER_TOKEN)
+    sizes = [estimate_tokens(end - start) for start, end in units]
+    chunks = []
+    i = 0
+    while i < len(units):
+        j, tokens = i, 0
+        while j < len(units) and (j == i or tokens + sizes[j] <= max_tokens):
+            tokens += sizes[j]
+            j += 1
+        start, end = units[i][0], units[j - 1][1]
+        chunks.append(TextChunk(start, end, text[start:end]))
+        if j >= len(units):
+            break
+
+        # Step back over trailing sentences for the overlap, always making progress and
+        # leaving room for the next new sentence so no chunk is overlap only
+        k, overlap = j, 0
+        while (k - 1 > i and overlap + sizes[k - 1] <= overlap_tokens
+               and overlap + sizes[k - 1] + sizes[j] <= max_tokens):
+            k -= 1
+            overlap += sizes[k]
+        i = k
+    return chunks
+
+
+def merge_chunk_entities(chunk_results: Sequence[Tuple[TextChunk, list]]) -> list:
+    """
+    Shift per-chunk entities to global offsets and drop overlap duplicates
+
+    Entities need .start, .end and .label. The same span found in two chunks is
+    kept once (the more confident copy), and a span inside a longer one with the
+    same label (e.g. a name cut at one chunk's edge) is dropped. Partially
+    overlapping spans are both kept, so resolve_overlaps can merge them into
+    their union instead of leaving part of one uncovered.
+    """
+    merged = {}
+    for chunk, entities in chunk_results:
+        for entity in entities:
+            entity.start += chunk.start
+            entity.end += chunk.start
+            key = (entity.start, entity.end, entity.label)
+            if key not in merged or getattr(merged[key], 'confidence', 0) < getattr(entity, 'confidence', 0):
+                merged[key] = entity
+
+    result = []
+    reach_by_label = {}  # label -> furthest end of a kept span with that label
+    for entity in sorted(merged.values(), key=lambda e: (e.start, -(e.end - e.start))):
+        if entity.end <= reach_by_label.get(entity.label, -1):
+            continue
+        reach_by_label[entity.label] = entity.end
+        result.append(entity)
+    return result
@@ -0,0 +1,89 @@
+import os
+import requests
+from typing import Dict, List, Optional
+
+from local_pii import detect_local_pii
+from metrics import stage_seconds
+
+def validation_headers(owner: Optional[str] = None) -> Dict[str, str]:
+    """Headers for text service calls: the shared PII_SERVICE_TOKEN, and the owner new ciphertexts are issued to"""
+    headers = {"Content-Type": "application/json"}
+    token = os.getenv("PII_SERVICE_TOKEN", "")
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    if owner:
+        headers["X-PII-Owner"] = owner
+    return headers
+
+def validate_text_with_service(text: str, validation_endpoint: str = "127.0.0.1:8003") -> Dict:
+    """Validate text using the validation service; failures come back with no entities and validation_error set"""
+    try:
+        headers = validation_headers()
+        with stage_seconds.time(service='api', stage='validation_call'):
+            response = requests.get(f"http://{validation_endpoint}/validate_text_msg?text={text}", headers=headers)
+        
+        if response.status_code == 200:
+            return response.json()
+        else:
+            print(f"Validation service failed with status code: {response.status_code}")
+            return {
+                'original_text': text,
+                'encrypted_text': text,
+                'entities': [],
+                'validation_error': True
+            }
+    except requests.exceptions.RequestException as e:
+        print(f"Error connecting to validation service: {e}")
+        return {
+            'original_text': text,
+            'encrypted_text': text,
+            'entities': [],
+            'validation_error': True
+        }
+
+class SensitivityShortCircuit:
+    """
+    stop_when callback for run_ocr_pipeline's early-exit mode.
+
+    Each region's text is checked with the local regex detector, so an obvious
+    ID card or credit card stops the pipeline after its first crop. Regions the
+    local check passes are collected, and finish() sends them to the
+    validation service in one call once the pipeline is done, rather than one
+    call per region.
+    """
+
+    def __init__(self, min_sensitivity: int = 2):
+        self.min_sensitivity = min_sensitivity
+        self.entity: Optional[Dict] = None
+        self.detected_by: Optional[str] = None
+        self.service_calls = 0
+        self.validation_errors = 0
+        self.pending_texts: List[str] = []
+
+    def __call__(self, detection_boxes: List[Dict]) -> bool:
+        text = ' '.join(box.get('text', '').strip() for box in detection_boxes).strip()
+        if len(text) < 2:
+            return False
+
+        local_entities = detect_local_pii(text, min_sensitivity=self.min_sensitivity)
+        if local_entities:
+            self.entity, self.detected_by = local_entities[0], 'local'
+            return True
+
+        self.pending_texts.append(text)
+        return False
+
+    def finish(self) -> Optional[Dict]:
+        """Validate the collected region texts in one service call, unless a region was already sensitive"""
+        if self.entity is not None or not self.pending_texts:
+            return self.entity
+
+        self.service_calls += 1
+        validation_result = validate_text_with_service(' '.join(self.pending_texts))
+        self.pending_texts = []
+        self.validation_errors += bool(validation_result.get('validation_error'))
+        for entity in validation_result.get('entities', []):
+            if entity.get('sensitivity_level', 0) >= self.min_sensitivity:
+                self.entity, self.detected_by = entity, 'service'
+                break
+        return self.entity